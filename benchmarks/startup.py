@@ -0,0 +1,61 @@
+"""
+Startup time benchmark.
+
+Measures the time of short invocations in fresh interpreters, and
+checks that heavy optional dependencies are not imported at startup.
+
+Usage: python benchmarks/startup.py [repetitions]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+commands = {
+    'python': ['-c', 'pass'],
+    'import apt2bom': ['-c', 'import apt2bom.apt2bom'],
+    'apt2bom --help': ['-m', 'apt2bom', '--help'],
+}
+
+heavy_modules = ['requests', 'urllib3', 'yaml', 'openpyxl', 'sqlite3', 'multiprocessing', 'numpy']
+
+
+def measure(args: list[str], repetitions: int) -> list[float]:
+    env = dict(os.environ, PYTHONPATH=src)
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        # the log file of apt2bom is written to the working directory
+        subprocess.run([sys.executable] + args, env=env, check=True, cwd=tempfile.gettempdir(),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def imported_modules() -> list[str]:
+    check = ('import sys, apt2bom.apt2bom; '
+             f'print(" ".join(m for m in {heavy_modules!r} if m in sys.modules))')
+    env = dict(os.environ, PYTHONPATH=src)
+    result = subprocess.run([sys.executable, '-c', check], env=env, check=True,
+                            capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for name, args in commands.items():
+        times = measure(args, repetitions)
+        print(f'{name:20s} min {min(times) * 1000:7.1f} ms  median {statistics.median(times) * 1000:7.1f} ms')
+
+    heavy = imported_modules()
+    print(f'heavy modules imported at startup: {", ".join(heavy) or "none"}')
+    return 1 if heavy else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,8 +8,43 @@ parser = argparse.ArgumentParser(
     prog='apt2bom',
     description='WGenerate SBoM from apt metadata.')
 parser.add_argument('-c', '--config')
+parser.add_argument('--serve', action='store_true',
+                    help='run as HTTP/JSON service with in-memory metadata')
+parser.add_argument('--host')
+parser.add_argument('--port', type=int)
+parser.add_argument('--why', metavar='PACKAGE',
+                    help='explain why a package is part of the last resolved package lists')
+parser.add_argument('--dependents', action='store_true',
+                    help='with --why, list all packages depending on the package')
+parser.add_argument('--owner', metavar='PATH',
+                    help='find the packages containing a file, or a path prefix ending with *')
+parser.add_argument('--diff', metavar='CONFIG',
+                    help='compare the package lists with the ones resolved using the repositories of another config')
+parser.add_argument('--worker', nargs='?', const='', metavar='DIRECTORY',
+                    help='work on the shards of a partitioned resolution')
 args = parser.parse_args()
 
-# run tool
-from apt2bom.apt2bom import run
-run(config=args.config)
+if args.why:
+    # query dependency trees
+    from apt2bom.why import query
+    query(config=args.config, package=args.why, dependents=args.dependents)
+elif args.owner:
+    # query contents indices
+    from apt2bom.contents import owner
+    owner(config=args.config, path=args.owner)
+elif args.diff:
+    # compare repository states
+    from apt2bom.diff import diff
+    diff(config=args.config, other=args.diff)
+elif args.worker is not None:
+    # partitioned resolution worker
+    from apt2bom.apt2bom import worker
+    worker(config=args.config, directory=args.worker or None)
+elif args.serve:
+    # run service
+    from apt2bom.server import serve
+    serve(config=args.config, host=args.host, port=args.port)
+else:
+    # run tool
+    from apt2bom.apt2bom import run
+    run(config=args.config)
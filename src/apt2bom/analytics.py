@@ -0,0 +1,331 @@
+"""
+Size and composition analytics of the resolved package lists.
+
+The packages of a list are loaded into columns: the sizes as integer
+arrays, and section, source, type, component and priority as codes
+into tables of labels. Grouped totals and the top contributors are
+computed on whole columns, using NumPy if it is installed, and plain
+Python otherwise. Both give the same results.
+
+The exclusive size of a root package is the size of the packages
+which are only reached through it, i.e. which it dominates in the
+dependency graph of the list. Dropping the roots one at a time and
+resolving again is quadratic. Instead, the dominator tree is computed
+once, and the sizes of the subtrees of all roots are differences of
+one prefix sum over its preorder.
+
+'installed_size' is in KiB, as in the package index, 'size' is the
+size of the .deb file in bytes.
+"""
+import heapq
+import json
+import logging
+import os
+from array import array
+from itertools import accumulate
+from .apt_data import Package
+from .graph import ArchGraph
+from .resolve_lists import Overlay, PackageLists
+
+
+logger = logging.getLogger('analytics')
+
+# categorical columns, in report order
+group_columns = ('section', 'source', 'pkg_type', 'component', 'priority')
+
+# columns reported completely, the others only with the top groups
+small_groups = ('section', 'pkg_type', 'component', 'priority')
+
+
+def load_numpy():
+    """
+    Get NumPy if it is installed, None otherwise.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class Columns:
+    """
+    Columnar view of a resolved package list.
+    """
+    def __init__(self, packages: dict[str, Package], overlays: dict[str, Overlay]):
+        self.names: list[str] = list(packages.keys())
+        self.installed_size: array = array('q')
+        self.size: array = array('q')
+        self.codes: dict[str, array] = {column: array('i') for column in group_columns}
+        self.labels: dict[str, list[str]] = {column: [] for column in group_columns}
+
+        code_of: dict[str, dict[str, int]] = {column: {} for column in group_columns}
+        for name, package in packages.items():
+            # unknown sizes are -1
+            self.installed_size.append(max(package.installed_size, 0))
+            self.size.append(max(package.size, 0))
+            values = (
+                package.section,
+                package.source.package if package.source else None,
+                overlays[name].pkg_type,
+                package.component.name if package.component else None,
+                package.priority,
+            )
+            for column, value in zip(group_columns, values):
+                value = value or '-'
+                codes = code_of[column]
+                if value not in codes:
+                    codes[value] = len(codes)
+                    self.labels[column].append(value)
+                self.codes[column].append(codes[value])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def group_totals(columns: Columns, column: str, np=None) -> list[dict]:
+    """
+    Number of packages and sizes per group, largest installed size first.
+    """
+    labels = columns.labels[column]
+    if np is not None:
+        codes = np.frombuffer(columns.codes[column], dtype=np.int32)
+        counts = np.bincount(codes, minlength=len(labels)).tolist()
+        installed = np.bincount(codes, weights=np.frombuffer(columns.installed_size, dtype=np.int64),
+                                minlength=len(labels)).astype(np.int64).tolist()
+        sizes = np.bincount(codes, weights=np.frombuffer(columns.size, dtype=np.int64),
+                            minlength=len(labels)).astype(np.int64).tolist()
+    else:
+        counts = [0] * len(labels)
+        installed = [0] * len(labels)
+        sizes = [0] * len(labels)
+        for code, installed_size, size in zip(columns.codes[column], columns.installed_size, columns.size):
+            counts[code] += 1
+            installed[code] += installed_size
+            sizes[code] += size
+
+    groups = [{'name': label, 'packages': counts[code], 'installed_size': installed[code], 'size': sizes[code]}
+              for code, label in enumerate(labels)]
+    groups.sort(key=lambda group: (-group['installed_size'], group['name']))
+    return groups
+
+
+def top_packages(columns: Columns, count: int, np=None) -> list[int]:
+    """
+    Positions of the packages with the largest installed size,
+    ties in list order.
+    """
+    if np is not None:
+        installed = np.frombuffer(columns.installed_size, dtype=np.int64)
+        return np.argsort(-installed, kind='stable')[:count].tolist()
+    return heapq.nlargest(count, range(len(columns)), key=columns.installed_size.__getitem__)
+
+
+def list_successors(arch_graph: ArchGraph, packages: dict[str, Package]) -> list[list[int]]:
+    """
+    Resolved dependencies within a package list, by list position.
+    """
+    index_of = arch_graph.index_of
+    position = {index_of[id(package)]: i for i, package in enumerate(packages.values())}
+    members = set(position.keys())
+    return [[position[dep] for dep in arch_graph.resolved_depends(index_of[id(package)], members)
+             if dep in position]
+            for package in packages.values()]
+
+
+def dominators(successors: list[list[int]], roots: list[int]) -> list[int]:
+    """
+    Immediate dominators of the nodes reachable from the roots.
+
+    A virtual entry node, 'len(successors)', precedes all roots, and
+    is its own dominator. Unreachable nodes get -1. Iterative algorithm
+    of Cooper, Harvey and Kennedy, in reverse postorder.
+    """
+    entry = len(successors)
+
+    # iterative depth-first postorder
+    visited = bytearray(entry + 1)
+    visited[entry] = 1
+    postorder: list[int] = []
+    stack = [(entry, iter(roots))]
+    while stack:
+        node, targets = stack[-1]
+        for target in targets:
+            if not visited[target]:
+                visited[target] = 1
+                stack.append((target, iter(successors[target])))
+                break
+        else:
+            stack.pop()
+            postorder.append(node)
+
+    number = [-1] * (entry + 1)
+    for i, node in enumerate(postorder):
+        number[node] = i
+
+    predecessors: list[list[int]] = [[] for _ in range(entry + 1)]
+    for root in roots:
+        predecessors[root].append(entry)
+    for node in postorder:
+        if node != entry:
+            for target in successors[node]:
+                predecessors[target].append(node)
+
+    idom = [-1] * (entry + 1)
+    idom[entry] = entry
+    order = postorder[-2::-1]
+    changed = True
+    while changed:
+        changed = False
+        for node in order:
+            new = -1
+            for pred in predecessors[node]:
+                if idom[pred] < 0:
+                    continue
+                if new < 0:
+                    new = pred
+                    continue
+                # nearest common dominator
+                a, b = pred, new
+                while a != b:
+                    while number[a] < number[b]:
+                        a = idom[a]
+                    while number[b] < number[a]:
+                        b = idom[b]
+                new = a
+            if idom[node] != new:
+                idom[node] = new
+                changed = True
+    return idom
+
+
+def subtree_extents(idom: list[int]) -> tuple[list[int], list[int], list[int]]:
+    """
+    Preorder of the dominator tree, and the start and end position
+    of the subtree of each node in this preorder.
+    """
+    entry = len(idom) - 1
+    children: list[list[int]] = [[] for _ in range(entry + 1)]
+    for node in range(entry):
+        if idom[node] >= 0:
+            children[idom[node]].append(node)
+
+    preorder: list[int] = []
+    start = [0] * (entry + 1)
+    end = [0] * (entry + 1)
+    stack = [(entry, iter(children[entry]))]
+    preorder.append(entry)
+    while stack:
+        node, nodes = stack[-1]
+        child = next(nodes, None)
+        if child is None:
+            stack.pop()
+            end[node] = len(preorder)
+        else:
+            start[child] = len(preorder)
+            preorder.append(child)
+            stack.append((child, iter(children[child])))
+    return preorder, start, end
+
+
+def exclusive_sizes(columns: Columns, successors: list[list[int]], roots: list[int],
+                    np=None) -> list[tuple[int, int, int]]:
+    """
+    Number of packages, installed size and size only reached through
+    each of the roots.
+    """
+    if not roots:
+        return []
+
+    preorder, start, end = subtree_extents(dominators(successors, roots))
+    # the entry node has no size
+    nodes = preorder[1:]
+    starts = [start[root] - 1 for root in roots]
+    ends = [end[root] - 1 for root in roots]
+
+    if np is not None:
+        order = np.array(nodes, dtype=np.int64)
+        first = np.array(starts, dtype=np.int64)
+        last = np.array(ends, dtype=np.int64)
+        totals = []
+        for values in (columns.installed_size, columns.size):
+            prefix = np.concatenate(([0], np.cumsum(np.frombuffer(values, dtype=np.int64)[order])))
+            totals.append((prefix[last] - prefix[first]).tolist())
+        return list(zip((last - first).tolist(), *totals))
+
+    totals = []
+    for values in (columns.installed_size, columns.size):
+        prefix = list(accumulate((values[node] for node in nodes), initial=0))
+        totals.append([prefix[e] - prefix[s] for s, e in zip(starts, ends)])
+    return [(e - s, installed, size) for s, e, installed, size in zip(starts, ends, *totals)]
+
+
+def list_report(arch_graph: ArchGraph, packages: dict[str, Package], overlays: dict[str, Overlay],
+                roots: set[str], count: int, np=None) -> dict:
+    """
+    Analytics of one resolved package list.
+    """
+    columns = Columns(packages, overlays)
+    installed_total = sum(columns.installed_size)
+    size_total = sum(columns.size)
+
+    groups = {column: group_totals(columns, column, np) for column in group_columns}
+
+    top = [{
+        'name': columns.names[i],
+        'installed_size': columns.installed_size[i],
+        'size': columns.size[i],
+        'pkg_type': overlays[columns.names[i]].pkg_type,
+    } for i in top_packages(columns, count, np)]
+
+    root_positions = [i for i, name in enumerate(columns.names) if name in roots]
+    exclusive = exclusive_sizes(columns, list_successors(arch_graph, packages), root_positions, np)
+    root_sizes = [{
+        'name': columns.names[i],
+        'packages': packages_count,
+        'installed_size': installed,
+        'size': size,
+    } for i, (packages_count, installed, size) in zip(root_positions, exclusive)]
+    root_sizes.sort(key=lambda root: (-root['installed_size'], root['name']))
+
+    return {
+        'packages': len(columns),
+        'installed_size': installed_total,
+        'size': size_total,
+        'groups': {column: groups[column] for column in small_groups},
+        'top_sources': groups['source'][:count],
+        'top_packages': top,
+        'roots': root_sizes,
+        # reached through several roots, or by none
+        'shared': {
+            'packages': len(columns) - sum(root['packages'] for root in root_sizes),
+            'installed_size': installed_total - sum(root['installed_size'] for root in root_sizes),
+            'size': size_total - sum(root['size'] for root in root_sizes),
+        },
+    }
+
+
+def write_analytics(config, lists: PackageLists):
+    """
+    Write the size and composition analytics of the resolved package lists.
+    """
+    np = load_numpy()
+    count = config['output'].get('analytics_top', 20)
+    logger.debug('Computing analytics using %s ...', 'NumPy' if np is not None else 'Python')
+
+    data = {}
+    for arch in lists.ecu_packages.keys():
+        arch_graph = lists.graph.archs[arch]
+        data[arch] = {
+            'ecu': list_report(arch_graph, lists.ecu_packages[arch], lists.ecu_overlays[arch],
+                               lists.ecu_roots[arch], count, np),
+            'sdk': list_report(arch_graph, lists.sdk_packages[arch], lists.sdk_overlays[arch],
+                               lists.sdk_roots[arch], count, np),
+        }
+        logger.info('%s: ECU %d KiB installed, SDK %d KiB installed', arch,
+                    data[arch]['ecu']['installed_size'], data[arch]['sdk']['installed_size'])
+
+    file = os.path.join(config['output']['directory'], config['output']['analytics'])
+    logger.debug('Writing analytics to %s ...', file)
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
@@ -1,13 +1,22 @@
 """
 apt2bom main
 """
+from __future__ import annotations
+
 import logging
-from .conf import read_config, read_packages
-from .apt_parsing import scan_repositories
+from typing import TYPE_CHECKING
+from .conf import read_config, read_packages, read_build_options, read_variants, per_architecture, architecture_config
+from .apt_parsing import scan_repositories, scan_architecture
+from .graph import DependencyGraph, build_graph
 from .resolve_lists import resolve_package_lists
-from .output import write_package_lists, write_repos
-from .excel import write_excel_package_list
-from .dot import write_ecu_runtime_dot_graph, write_ecu_build_time_dot_graph
+from .apt_data import AptRepository
+from .apt_download import MirrorSet, config_mirrors
+from .output import write_repos
+from .suggest import TrigramIndex, name_index, suggest_missing
+from .plugins import write_outputs
+
+if TYPE_CHECKING:
+    from .partition import Partitioner
 
 
 logger = logging.getLogger('apt2bom')
@@ -21,31 +30,143 @@ def run(config: str ='config.yaml'):
     # read config and input
     logger.info('Read inputs...')
     config = read_config(file=config)
-    prod, dev, sdk = read_packages(config)
+    mirrors = config_mirrors(config)
+    variants = read_roots(config, mirrors)
+
+    if per_architecture(config):
+        # one architecture at a time, so that only its packages are kept in memory
+        repos = None
+        for arch in config['packages']['architectures']:
+            logger.info('Processing architecture %s...', arch)
+            repos, graph = load_graph(architecture_config(config, arch), dump=True, arch=arch, repos=repos,
+                                      mirrors=mirrors)
+            arch_variants = [(name, architecture_config(variant, arch), roots)
+                             for name, variant, roots in variants]
+            process_variants(config, arch_variants, repos, graph)
+            del graph
+    else:
+        repos, graph = load_graph(config, dump=True, mirrors=mirrors)
+        process_variants(config, variants, repos, graph)
+
+
+def read_roots(config, mirrors: dict[str, MirrorSet] | None = None) -> list[tuple[str | None, dict, tuple]]:
+    """
+    Read the variants, and the PROD, DEV and SDK root packages of each.
+    """
+    variants = [(name, variant, read_packages(variant))
+                for name, variant in read_variants(config)]
+
+    if config.get('contents'):
+        # root lists may contain file paths
+        logger.info('Load contents indices...')
+        from .contents import Contents
+        contents = Contents(config, mirrors)
+        variants = [(name, variant, [contents.resolve_paths(names) for names in roots])
+                    for name, variant, roots in variants]
+        contents.close()
+    return variants
+
+
+def process_variants(config, variants: list, repos: list[AptRepository], graph: DependencyGraph):
+    """
+    Resolve and write all variants using the same dependency graph.
+    """
+    index = name_index(graph)
+    if len(variants) > 1:
+        # share resolved subgraphs between the variants
+        graph.enable_reach_cache()
+
+    partitioner = None
+    options = config.get('partition')
+    if options:
+        # expand shards of the roots in worker processes
+        from .partition import Partitioner
+        partitioner = Partitioner(
+            graph, options['directory'], options.get('shards', 8), options.get('workers', 4),
+            options.get('timeout', 300.0), options.get('claim_timeout', 60.0))
+        partitioner.start()
+
+    try:
+        for name, variant, (prod, dev, sdk) in variants:
+            if name:
+                logger.info('Processing variant %s...', name)
+            process_variant(variant, repos, graph, prod, dev, sdk, partitioner, index)
+    finally:
+        if partitioner:
+            partitioner.stop()
+
+
+def load_graph(config, dump: bool = False, arch: str | None = None,
+               repos: list[AptRepository] | None = None,
+               mirrors: dict[str, MirrorSet] | None = None) -> tuple[list[AptRepository], DependencyGraph]:
+    """
+    Read the apt metadata and compile the dependency graph.
+
+    With 'arch', only the packages of this architecture are read,
+    and the sources of the previously scanned 'repos' are reused.
+    The 'mirrors' default to the mirror sets of the config.
+    """
+    architectures = config['packages']['architectures']
+    profiles, indep = read_build_options(config)
+
+    storage = config.get('storage') or {}
+    if storage.get('sqlite'):
+        # read apt metadata into the out-of-core store
+        from .sqlite_store import SqliteStore
+        store = SqliteStore(storage['sqlite'])
+        logger.info('Load apt repositories into %s...', store)
+        store.load(config, mirrors)
+        repos = []
+
+        logger.info('Compile dependency graph...')
+        graph = store.build_graph(architectures, profiles=profiles, indep=indep)
+    else:
+        # read apt metadata
+        logger.info('Scan apt repositories...')
+        if arch:
+            repos = scan_architecture(config, arch, repos, mirrors)
+        else:
+            repos = scan_repositories(config, mirrors)
+        
+        if dump:
+            # dump APT metadata
+            logger.info('Dump apt metadata...')
+            write_repos(config, repos)
+
+        # compile dependency graph
+        logger.info('Compile dependency graph...')
+        graph = build_graph(repos, architectures, profiles=profiles, indep=indep)
+    return repos, graph
+
+
+def worker(config: str = 'config.yaml', directory: str = None):
+    """
+    Work on the shards of a partitioned resolution, e.g. on another host.
+    """
+    config = read_config(file=config)
+    if per_architecture(config):
+        # the coordinator compiles one graph per architecture
+        logger.error('Workers on other hosts are not supported with pipeline.per_architecture!')
+        exit(1)
+    directory = directory or config['partition']['directory']
+    from .partition import work
+    _, graph = load_graph(config)
+    work(directory, graph)
 
-    # read apt metadata
-    logger.info('Scan apt repositories...')
-    repos = scan_repositories(config)
-    
-    # dump APT metadata
-    logger.info('Dump apt metadata...')
-    write_repos(config, repos)
 
+def process_variant(config, repos, graph: DependencyGraph, prod, dev, sdk,
+                    partitioner: Partitioner | None = None,
+                    index: TrigramIndex | None = None):
+    """
+    Resolve the root packages of one variant and write all outputs.
+    """
     # resolve packages
     logger.info('Resolve packages...')
     architectures = config['packages']['architectures']
-    lists = resolve_package_lists(repos, architectures, prod, dev, sdk)
+    lists = resolve_package_lists(repos, architectures, prod, dev, sdk, graph=graph, partitioner=partitioner)
+    if index:
+        # did you mean suggestions for missing packages
+        suggest_missing(lists, index)
     
-    # write package lists
-    logger.info('Writing package lists...')
-    write_package_lists(config, lists)
-
-    # write excel list
-    logger.info('Writing excel list...')
-    write_excel_package_list(config, lists)
-
-    # dot graphs
-    logger.info('Writing runtime dependencies dot graphs...')
-    write_ecu_runtime_dot_graph(config, lists)
-    logger.info('Writing build time dependencies dot graphs...')
-    write_ecu_build_time_dot_graph(config, lists)
+    # write all enabled outputs
+    write_outputs(config, lists)
@@ -9,6 +9,46 @@ import logging
 
 logger = logging.getLogger('apt_data')
 
+class Dependency:
+    """
+    A single entry of a dependency field, e.g. 'libc6:any (>= 2.34)'.
+
+    Alternatives ('a | b') are represented as lists of dependencies.
+    Build-time dependencies may be restricted to architectures,
+    e.g. '[amd64 !i386]', and to build profiles, e.g. '<!nocheck>'.
+    Each profile list is a conjunction, the lists are alternatives.
+    """
+    def __init__(self, name: str = None):
+        self.name: str = name
+        self.arch: str = None
+        self.relation: str = None
+        self.version: str = None
+        self.architectures: list[str] = []
+        self.profiles: list[list[str]] = []
+
+    def __str__(self) -> str:
+        text = self.name
+        if self.arch:
+            text += f':{self.arch}'
+        if self.relation:
+            text += f' ({self.relation} {self.version})'
+        if self.architectures:
+            text += f' [{" ".join(self.architectures)}]'
+        for profiles in self.profiles:
+            text += f' <{" ".join(profiles)}>'
+        return text
+
+    def __repr__(self) -> str:
+        return f'Dependency({self})'
+
+
+def format_dependencies(groups: list[list[Dependency]]) -> str:
+    """
+    Format dependency groups as APT dependency field value.
+    """
+    return ', '.join([' | '.join([str(dep) for dep in group]) for group in groups])
+
+
 class SourceFile:
     """
     A source file is part of a Debian source package (dsc).
@@ -41,21 +81,24 @@ class Source:
         self.section: str = None
         self.maintainer: str = None
         self.standards_version: str = None
-        self.build_depends: list[tuple[str, str]] = []
+        self.build_depends: list[list[Dependency]] = []
+        self.build_depends_indep: list[list[Dependency]] = []
+        self.build_depends_arch: list[list[Dependency]] = []
         self.homepage: str = None
         self.vcs_browser: str = None
         self.vcs_git: str = None
         self.directory: str = None
         self.package_list: list[tuple[str, list[str]]] = []
         self.files: dict[str, SourceFile] = {}
-        self.pkg_type: str = None
         self.repository: AptRepository = repository
         self.component: Component = component
 
     def to_record(self) -> dict[str, str]:
         data = self.__dict__.copy()
         data['binaries'] = ', '.join(self.binaries)
-        data['build_depends'] = ', '.join([f'{name} {version}' for name, version in self.build_depends])
+        data['build_depends'] = format_dependencies(self.build_depends)
+        data['build_depends_indep'] = format_dependencies(self.build_depends_indep)
+        data['build_depends_arch'] = format_dependencies(self.build_depends_arch)
         data['package_list'] = ', '.join([name for name, _ in self.package_list])
         data['files'] = ', '.join(self.files.keys())
 
@@ -100,8 +143,8 @@ class Package:
         self.original_maintainer: str = None
         self.bugs: str = None
         self.installed_size: int = -1
-        self.depends: list[tuple[str, str]] = []
-        self.provides: list[tuple[str, str]] = []
+        self.depends: list[list[Dependency]] = []
+        self.provides: list[Dependency] = []
         self.recommends: str = None
         self.suggests: str = None
         self.filename: str = None
@@ -115,15 +158,14 @@ class Package:
         self.task: list[str] = []
         self.description_md5: str = None
         self.source: Source = None
-        self.pkg_type: str = None
         self.repository: AptRepository = repository
         self.component: Component = component
 
     def to_record(self) -> dict[str, str]:
         data = self.__dict__.copy()
-        data['depends'] = ', '.join([f'{name} {version}' for name, version in self.depends])
+        data['depends'] = format_dependencies(self.depends)
         data['task'] = ', '.join(self.task)
-        data['provides'] = ', '.join([f'{name} {version}' for name, version in self.provides])
+        data['provides'] = ', '.join([str(provide) for provide in self.provides])
 
         if self.source:
             del data['source']
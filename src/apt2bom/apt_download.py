@@ -1,19 +1,41 @@
 """
 Download APT metadata form HTTP(s) servers.
+
+A repository can be served by several mirrors, see 'MirrorSet'. The
+downloads of files of a mirrored distribution are spread over its
+healthy mirrors, and fail over to the next mirror per file.
+
+The mirror sets of a config are created by 'config_mirrors', and
+passed to the download functions, which look up the mirrors of an URL.
 """
-import requests
 import io
 import gzip
+import hashlib
+import itertools
 import logging
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
 
 
 logger = logging.getLogger('apt_data')
 
 
-def read_gz_url(url: str) -> str:
+# chunk size for streamed downloads
+chunk_size = 1 << 20
+
+
+def read_gz_url(url: str, mirrors: dict[str, 'MirrorSet'] | None = None) -> list[str]:
     """
     Read a gz compressed file from an URL.
     """
+    mirror_set, path = find_mirrors(url, mirrors)
+    if mirror_set:
+        return gzip.decompress(mirror_set.fetch(path)).decode().split('\n')
+
+    import requests
+
     response = requests.get(url)
 
     if response.status_code != 200:
@@ -28,11 +50,24 @@ def read_gz_url(url: str) -> str:
         return content.split('\n')
 
 
-def read_url(url: str) -> list[str]:
+def read_url(url: str, mirrors: dict[str, 'MirrorSet'] | None = None) -> list[str]:
     """
     Read a file from an URL.
     """
+    mirror_set, path = find_mirrors(url, mirrors)
+    if mirror_set:
+        return mirror_set.fetch(path).decode().split('\n')
+
+    import requests
+
     response = requests.get(url)
+
+    if response.status_code != 200:
+        logger.error('Reading %s failed!', url)
+        return []
+    else:
+        logger.debug('Reading %s: %d', url, response.status_code)
+
     text = bytes.decode(response.content)
     return text.split('\n')
 
@@ -48,3 +83,246 @@ def get_distro_url(base: str, distro: str, path: str) -> str:
         path = path[1:]
 
     return f'{base}dists/{distro}/{path}'
+
+
+def stream_gz_url(url: str, mirrors: dict[str, 'MirrorSet'] | None = None):
+    """
+    Iterate the lines of a gz compressed file from an URL as bytes,
+    without loading the whole file into memory.
+
+    A mirrored file is downloaded to a temporary file first, so that
+    it is verified, and failed over, before any line is returned.
+    """
+    mirror_set, path = find_mirrors(url, mirrors)
+    if mirror_set:
+        with tempfile.TemporaryFile() as f:
+            mirror_set.fetch_file(path, f)
+            with gzip.GzipFile(fileobj=f) as gz:
+                for line in gz:
+                    yield line
+        return
+
+    import requests
+
+    with requests.get(url, stream=True) as response:
+        if response.status_code != 200:
+            logger.error('Reading %s failed!', url)
+            return
+        logger.debug('Streaming %s: %d', url, response.status_code)
+
+        with gzip.GzipFile(fileobj=response.raw) as f:
+            for line in f:
+                yield line
+
+
+def release_checksums(lines: list[str]) -> dict[str, tuple[str, str]]:
+    """
+    Get the checksums of the files listed in a 'Release' file,
+    as path to algorithm and checksum, preferring SHA256.
+    """
+    checksums: dict[str, tuple[str, str]] = {}
+    algorithm = None
+    for line in lines:
+        if not line.startswith(' '):
+            algorithm = {'MD5Sum:': 'md5', 'SHA256:': 'sha256'}.get(line.strip())
+            continue
+        if algorithm is None:
+            continue
+        parts = line.split()
+        if len(parts) == 3 and (algorithm == 'sha256' or parts[2] not in checksums):
+            checksums[parts[2]] = (algorithm, parts[0])
+    return checksums
+
+
+def release_date(content: bytes) -> float:
+    """
+    Get the 'Date' of a 'Release' file as timestamp, 0 if unknown.
+    """
+    for line in content.decode(errors='replace').split('\n'):
+        if line.startswith('Date:'):
+            try:
+                return parsedate_to_datetime(line[5:].strip()).timestamp()
+            except (TypeError, ValueError):
+                return 0.0
+    return 0.0
+
+
+class MirrorSet:
+    """
+    Mirrors of an APT distribution.
+
+    The mirrors are probed when the 'Release' file is read: the mirrors
+    serving the newest 'Release' file are healthy, ordered by latency,
+    and mirrors out of sync are skipped. The other files are spread
+    over the healthy mirrors. A download which fails, or does not match
+    the checksum of the 'Release' file, is retried on the next mirror.
+    """
+    def __init__(self, urls: list[str], distribution: str, timeout: float = 30.0):
+        self.urls: list[str] = urls
+        self.distribution: str = distribution
+        self.timeout: float = timeout
+        self.healthy: list[str] = []
+        self.latency: dict[str, float] = {}
+        self.release: bytes | None = None
+        self.checksums: dict[str, tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._next = itertools.count()
+
+    def __repr__(self) -> str:
+        return f'MirrorSet({self.distribution}, {len(self.healthy)}/{len(self.urls)} healthy)'
+
+    def _get(self, url: str, path: str, stream: bool = False):
+        import requests
+        return requests.get(get_distro_url(url, self.distribution, path), timeout=self.timeout, stream=stream)
+
+    def probe(self):
+        """
+        Read the 'Release' file from all mirrors, and select the healthy ones.
+        """
+        import requests
+
+        releases: dict[str, bytes] = {}
+        for url in self.urls:
+            start = time.monotonic()
+            try:
+                response = self._get(url, 'Release')
+            except requests.RequestException as e:
+                logger.warning('Mirror %s of %s failed: %s', url, self.distribution, e)
+                continue
+            if response.status_code != 200:
+                logger.warning('Mirror %s of %s failed: HTTP %d', url, self.distribution, response.status_code)
+                continue
+            self.latency[url] = time.monotonic() - start
+            releases[url] = response.content
+
+        if not releases:
+            raise RuntimeError(f'No mirror of {self.distribution} is reachable: {", ".join(self.urls)}')
+
+        # the newest release, served by the most mirrors
+        votes: dict[bytes, int] = {}
+        for content in releases.values():
+            votes[content] = votes.get(content, 0) + 1
+        newest = max(votes.keys(), key=lambda content: (release_date(content), votes[content]))
+
+        healthy = [url for url, content in releases.items() if content == newest]
+        for url in releases.keys():
+            if url not in healthy:
+                logger.warning('Mirror %s of %s is out of sync, skipped.', url, self.distribution)
+
+        with self._lock:
+            self.healthy = sorted(healthy, key=lambda url: self.latency[url])
+            self.release = newest
+            self.checksums = release_checksums(newest.decode().split('\n'))
+        logger.info('Mirrors of %s: %s', self.distribution,
+                    ', '.join(f'{url} ({self.latency[url] * 1000:.0f} ms)' for url in self.healthy))
+
+    def _order(self) -> list[str]:
+        """
+        Get the healthy mirrors, starting with the next one in turn.
+        """
+        if self.release is None:
+            with self._probe_lock:
+                if self.release is None:
+                    self.probe()
+
+        with self._lock:
+            start = next(self._next) % len(self.healthy)
+            return self.healthy[start:] + self.healthy[:start]
+
+    def fetch(self, path: str) -> bytes:
+        """
+        Download a file of the distribution, failing over to the next mirror.
+        """
+        if path == 'Release':
+            self.probe()
+            return self.release
+
+        import requests
+
+        # probes the mirrors first, for the checksums
+        order = self._order()
+        expected = self.checksums.get(path)
+        errors = []
+        for url in order:
+            try:
+                response = self._get(url, path)
+            except requests.RequestException as e:
+                errors.append(f'{url}: {e}')
+                continue
+            if response.status_code != 200:
+                errors.append(f'{url}: HTTP {response.status_code}')
+                continue
+            if expected and hashlib.new(expected[0], response.content).hexdigest() != expected[1]:
+                errors.append(f'{url}: {expected[0]} mismatch')
+                continue
+            if errors:
+                logger.warning('Downloaded %s from %s after failures: %s', path, url, '; '.join(errors))
+            return response.content
+
+        raise RuntimeError(f'Downloading {path} of {self.distribution} failed on all mirrors: {"; ".join(errors)}')
+
+    def fetch_file(self, path: str, f):
+        """
+        Download a file of the distribution in chunks to the binary file
+        'f', failing over to the next mirror. 'f' is rewound.
+        """
+        import requests
+
+        order = self._order()
+        expected = self.checksums.get(path)
+        errors = []
+        for url in order:
+            f.seek(0)
+            f.truncate()
+            digest = hashlib.new(expected[0]) if expected else None
+            try:
+                with self._get(url, path, stream=True) as response:
+                    if response.status_code != 200:
+                        errors.append(f'{url}: HTTP {response.status_code}')
+                        continue
+                    for chunk in response.iter_content(chunk_size):
+                        if digest:
+                            digest.update(chunk)
+                        f.write(chunk)
+            except requests.RequestException as e:
+                errors.append(f'{url}: {e}')
+                continue
+            if digest and digest.hexdigest() != expected[1]:
+                errors.append(f'{url}: {expected[0]} mismatch')
+                continue
+            if errors:
+                logger.warning('Downloaded %s from %s after failures: %s', path, url, '; '.join(errors))
+            f.seek(0)
+            return
+
+        raise RuntimeError(f'Downloading {path} of {self.distribution} failed on all mirrors: {"; ".join(errors)}')
+
+
+def find_mirrors(url: str, mirrors: dict[str, MirrorSet] | None = None) -> tuple[MirrorSet | None, str]:
+    """
+    Get the mirrors serving an URL, and the path in the distribution.
+    """
+    for prefix, mirror_set in (mirrors or {}).items():
+        if url.startswith(prefix):
+            return mirror_set, url[len(prefix):]
+    return None, url
+
+
+def config_mirrors(config) -> dict[str, MirrorSet]:
+    """
+    Create the mirror sets of the configured repositories,
+    by distribution URL.
+
+    The 'url' of a repository with 'mirrors' is used for the package
+    URLs, and defaults to the first mirror, see 'read_config'.
+    """
+    mirrors: dict[str, MirrorSet] = {}
+    for repository in config.get('repositories') or []:
+        if not repository.get('mirrors'):
+            continue
+        url = repository.get('url') or repository['mirrors'][0]
+        prefix = get_distro_url(url, repository['distribution'], '')
+        mirrors[prefix] = MirrorSet(
+            repository['mirrors'], repository['distribution'], repository.get('timeout', 30.0))
+    return mirrors
@@ -3,12 +3,58 @@ APT metadata parsing.
 """
 import re
 import logging
-from .apt_data import AptRepository, Index, Component, Package, Source, SourceFile
-from .apt_download import get_distro_url, read_gz_url, read_url
+from typing import Iterable, Iterator
+from .apt_data import AptRepository, Index, Component, Dependency, Package, Source, SourceFile
+from .apt_download import MirrorSet, config_mirrors, get_distro_url, read_gz_url, read_url
+from .conf import read_fields
 
 
 logger = logging.getLogger('apt_parsing')
 
+dependency_pattern = re.compile(
+    r'^(?P<name>[^\s:(\[<]+)(?::(?P<arch>[^\s(\[<]+))?'
+    r'\s*(?:\(\s*(?P<relation><<|<=|=|>=|>>|<|>)\s*(?P<version>[^)\s]+)\s*\))?'
+    r'\s*(?:\[(?P<architectures>[^\]]*)\])?'
+    r'\s*(?P<profiles>(?:<[^>]*>\s*)*)')
+
+profiles_pattern = re.compile(r'<([^>]*)>')
+
+
+def parse_dependency(text: str) -> Dependency | None:
+    """
+    Parse a single dependency, e.g. 'python3:any (>= 3.10)'.
+    """
+    match = dependency_pattern.match(text.strip())
+    if not match:
+        return None
+
+    dep = Dependency(match.group('name'))
+    dep.arch = match.group('arch')
+    dep.relation = match.group('relation')
+    dep.version = match.group('version')
+    if match.group('architectures'):
+        dep.architectures = match.group('architectures').split()
+    if match.group('profiles'):
+        dep.profiles = [profiles.split() for profiles in profiles_pattern.findall(match.group('profiles'))]
+    return dep
+
+
+def parse_dependencies(value: str) -> list[list[Dependency]]:
+    """
+    Parse a dependency field value into groups of alternatives.
+    """
+    groups: list[list[Dependency]] = []
+    for entry in value.split(','):
+        group = []
+        for alternative in entry.split('|'):
+            dep = parse_dependency(alternative)
+            if dep:
+                group.append(dep)
+        if group:
+            groups.append(group)
+    return groups
+
+
 
 def parse_apt_repository(
         url: str,
@@ -73,26 +119,41 @@ def parse_apt_repository(
     return repo
 
 
-def parse_package_index(
-        url: str, base_url: str,
+def field_prefixes(fields: set[str] | None) -> tuple[str, ...] | None:
+    """
+    Line prefixes of the stanza fields to keep, None keeps all fields.
+    """
+    if fields is None:
+        return None
+    return tuple([f'{field}:' for field in fields])
+
+
+def iter_packages(
+        lines: Iterable[str], base_url: str,
         repo: AptRepository,
-        component: Component) -> dict[str, Package]:
+        component: Component,
+        fields: set[str] | None = None) -> Iterator[Package]:
     """
-    Read an binary package index 'Packages.gz' file.
+    Parse the stanzas of a binary package index.
+
+    If 'fields' is given, all other stanza fields are skipped.
     """
     if base_url[-1] != '/':
         base_url += '/'
 
-    packages: dict[str, Package] = {}
-
-    lines = read_gz_url(url)
+    prefixes = field_prefixes(fields)
 
     package = Package(repo, component)
     for line in lines:
         if line.strip() == '':
             # packages are separated by empty lines
+            if package.package:
+                yield package
             package = Package(repo, component)
             continue
+
+        if prefixes is not None and not line.startswith(prefixes):
+            continue
         
         if line.startswith('Package:'):
             package.package = line[8:].strip()
@@ -115,34 +176,9 @@ def parse_package_index(
         elif line.startswith('Installed-Size:'):
             package.installed_size = int(line[15:].strip())
         elif line.startswith('Provides:'):
-            provides = line[9:].strip().split(',')
-            for provide in provides:
-                provide = provide.strip()
-                if ' ' in provide:
-                    name, version = provide.split(' ', maxsplit=1)
-                    package.provides.append((name, version))
-                elif ':' in provide:
-                    name, version = provide.split(':', maxsplit=1)
-                    package.provides.append((name, version))
-                elif provide.strip() != '':
-                    package.provides.append((provide, ''))
-            
-            for provide, _ in package.provides:
-                if provide not in packages:
-                    packages[provide] = package
-
+            package.provides = [group[0] for group in parse_dependencies(line[9:])]
         elif line.startswith('Depends:'):
-            depends = line[8:].strip().split(',')
-            for depend in depends:
-                depend = depend.strip()
-                if ' ' in depend:
-                    name, version = depend.split(' ', maxsplit=1)
-                    package.depends.append((name, version))
-                elif ':' in depend:
-                    name, version = depend.split(':', maxsplit=1)
-                    package.depends.append((name, version))
-                elif depend.strip() != '':
-                    package.depends.append((depend, ''))
+            package.depends = parse_dependencies(line[8:])
         elif line.startswith('Recommends:'):
             package.recommends = line[11:].strip()
         elif line.startswith('Suggests:'):
@@ -169,30 +205,63 @@ def parse_package_index(
         elif line.startswith('Description-md5:'):
             package.description_md5 = line[16:].strip()
 
-        if package.package:
-            packages[package.package] = package
+    if package.package:
+        yield package
+
+
+def add_package(packages: dict[str, Package], package: Package):
+    """
+    Add a package by its name and its provided names.
+
+    The name of a package takes precedence over a provided name,
+    and the first package providing a name wins.
+    """
+    packages[package.package] = package
+    for provide in package.provides:
+        if provide.name not in packages:
+            packages[provide.name] = package
+
+
+def parse_package_index(
+        url: str, base_url: str,
+        repo: AptRepository,
+        component: Component,
+        fields: set[str] | None = None,
+        mirrors: dict[str, MirrorSet] | None = None) -> dict[str, Package]:
+    """
+    Read an binary package index 'Packages.gz' file.
+
+    If 'fields' is given, all other stanza fields are skipped.
+    """
+    packages: dict[str, Package] = {}
+    for package in iter_packages(read_gz_url(url, mirrors), base_url, repo, component, fields):
+        add_package(packages, package)
 
     return packages
 
 
-def parse_source_index(
-        url: str, base_url: str, repo: AptRepository,
-        component: Component) -> dict[str, Package]:
+def iter_sources(
+        lines: Iterable[str], base_url: str, repo: AptRepository,
+        component: Component,
+        fields: set[str] | None = None) -> Iterator[Source]:
     """
-    Read package source index.
+    Parse the stanzas of a source package index.
+
+    If 'fields' is given, all other stanza fields are skipped.
     """
     if base_url[-1] != '/':
         base_url += '/'
 
-    sources: dict[str, Package] = {}
+    prefixes = field_prefixes(fields)
 
-    lines = read_gz_url(url)
     source = Source(repo, component)
     package_list = False
     files_list = False
     checksum: str = 'md5'
     for line in lines:
         if line.strip() == '':
+            if source.package:
+                yield source
             source = Source(repo, component)
             continue
         
@@ -225,6 +294,9 @@ def parse_source_index(
             package_list = False
             files_list = False
 
+            if prefixes is not None and not line.startswith(prefixes):
+                continue
+
             if line.startswith('Package:'):
                 source.package = line[8:].strip()
             elif line.startswith('Format:'):
@@ -244,18 +316,11 @@ def parse_source_index(
             elif line.startswith('Standards-Version:'):
                 source.standards_version = line[18:].strip()
             elif line.startswith('Build-Depends:'):
-                depends: list[(str, str)] = []
-                for depend in line[14:].strip().split(','):
-                    depend = depend.strip()
-                    if ' ' in depend:
-                        name, version = depend.split(' ', maxsplit=1)
-                        depends.append((name, version))
-                    elif ':' in depend:
-                        name, version = depend.split(':', maxsplit=1)
-                        depends.append((name, version))
-                    elif depend.strip != '':
-                        depends.append((depend, ''))
-                source.build_depends = depends
+                source.build_depends = parse_dependencies(line[14:])
+            elif line.startswith('Build-Depends-Indep:'):
+                source.build_depends_indep = parse_dependencies(line[20:])
+            elif line.startswith('Build-Depends-Arch:'):
+                source.build_depends_arch = parse_dependencies(line[19:])
             elif line.startswith('Homepage:'):
                 source.homepage = line[9:].strip()
             elif line.startswith('Vcs-Browser:'):
@@ -268,104 +333,211 @@ def parse_source_index(
                 package_list = True
             elif line.startswith('Files:'):
                 files_list = True
+                checksum = 'md5'
             elif line.startswith('Checksums-'):
                 files_list = True
                 checksum = line.strip()[10:-1]
 
-        if source.package:
-            sources[source.package] = source
+    if source.package:
+        yield source
+
+
+def parse_source_index(
+        url: str, base_url: str, repo: AptRepository,
+        component: Component,
+        fields: set[str] | None = None,
+        mirrors: dict[str, MirrorSet] | None = None) -> dict[str, Package]:
+    """
+    Read package source index.
+
+    If 'fields' is given, all other stanza fields are skipped.
+    """
+    sources: dict[str, Package] = {}
+    for source in iter_sources(read_gz_url(url, mirrors), base_url, repo, component, fields):
+        sources[source.package] = source
 
     return sources
 
 
-def scan_apt_repository(
-        url: str,
-        distribution: str,
-        architectures: list[str] | None = ['amd64', 'arm64'],
-        components: list[str] | None = ['main', 'universe']
-    ) -> AptRepository:
+def package_indices(comp: Component, arch: str) -> list[Index]:
     """
-    Read all packages and sources from the given APT repository.
+    Get the binary package indices of a component for an architecture.
+    """
+    index_folder = f'binary-{arch}'
+    return [index for index in comp.indices if index_folder in index.url and 'Packages.gz' in index.url]
+
+
+def source_indices(comp: Component) -> list[Index]:
+    """
+    Get the source package indices of a component.
+    """
+    return [index for index in comp.indices if 'source' in index.url and 'Sources.gz' in index.url]
+
+
+def scan_packages(repo: AptRepository, comp: Component, architectures: list[str],
+                  fields: set[str] | None = None, parsed: dict[tuple[int, str], dict] | None = None,
+                  mirrors: dict[str, MirrorSet] | None = None):
+    """
+    Read the binary package indices of a component for the given architectures.
+
+    Indices contained in 'parsed', by component ID and URL, were parsed in advance.
+    """
+    for arch in architectures:
+        for index in package_indices(comp, arch):
+            if parsed and (id(comp), index.url) in parsed:
+                packages = parsed.pop((id(comp), index.url))
+            else:
+                logger.debug('Parsing %s', index)
+                packages = parse_package_index(index.url, repo.url, repo, comp, fields, mirrors)
+            for package in packages.keys():
+                comp.packages.setdefault(package, {}).setdefault(arch, []).append(packages[package])
+
+
+def scan_sources(repo: AptRepository, comp: Component,
+                 fields: set[str] | None = None, parsed: dict[tuple[int, str], dict] | None = None,
+                 mirrors: dict[str, MirrorSet] | None = None):
+    """
+    Read the source package indices of a component.
+
+    Indices contained in 'parsed', by component ID and URL, were parsed in advance.
+    """
+    for index in source_indices(comp):
+        if parsed and (id(comp), index.url) in parsed:
+            sources = parsed.pop((id(comp), index.url))
+        else:
+            logger.debug('Parsing %s', index)
+            sources = parse_source_index(index.url, repo.url, repo, comp, fields, mirrors)
+        for source in sources.keys():
+            if comp.sources.get(source) is not None:
+                logger.warning('Duplicate source %s in %s', source, index.url)
+            else:
+                comp.sources[source] = sources[source]
+
+
+def link_sources(comp: Component):
+    """
+    Set the source of all binary packages of a component.
+    """
+    # index binary names, the first source building a binary wins
+    binaries: dict[str, Source] = {}
+    for source in comp.sources.values():
+        for binary in source.binaries:
+            binaries.setdefault(binary, source)
+
+    for package in comp.packages.keys():
+        source = binaries.get(package)
+        if source:
+            for a in comp.packages[package].keys():
+                for p in comp.packages[package][a]:
+                    p.source = source
+
+
+def read_release(url: str, distribution: str, components: list[str] | None,
+                 mirrors: dict[str, MirrorSet] | None = None) -> AptRepository:
+    """
+    Read the 'Release' file of an APT repository.
     """
-    logger.info('Parsing repository %s %s %s %s',
-                url, distribution, architectures, components)
-    
     release = get_distro_url(url, distribution, 'Release')
     
-    content = read_url(release)
-    repo = parse_apt_repository(url, distribution, components, content)
+    content = read_url(release, mirrors)
+    return parse_apt_repository(url, distribution, components, content)
 
+
+def release_options(
+        repo: AptRepository,
+        architectures: list[str] | None,
+        components: list[str] | None) -> tuple[list[str], list[str]]:
+    """
+    Get the used architectures and components, all if not given.
+    """
     if components is None or components == []:
         components = repo.component_names
     
     if architectures is None or architectures == []:
         architectures = repo.architectures
     
+    return architectures, components
+
+
+def scan_components(
+        repo: AptRepository,
+        architectures: list[str] | None,
+        components: list[str] | None,
+        fields: set[str] | None = None,
+        parsed: dict[tuple[int, str], dict] | None = None,
+        mirrors: dict[str, MirrorSet] | None = None):
+    """
+    Read all packages and sources of the components of a repository.
+    """
+    architectures, components = release_options(repo, architectures, components)
+    
     for component in components:
         if not component in repo.components:
             logger.warning('Component %s not found in repository %s', component, repo)
             continue
 
         comp = repo.components[component]
+        scan_packages(repo, comp, architectures, fields, parsed, mirrors)
+        scan_sources(repo, comp, fields, parsed, mirrors)
+        link_sources(comp)
 
-        for arch in architectures:
-            index_folder = f'binary-{arch}'
+        logger.info('Component %s: %d packages, %d sources.', comp.name, len(comp.packages), len(comp.sources))
 
-            for index in comp.indices:
-                if index_folder in index.url and 'Packages.gz' in index.url:
-                    logger.debug('Parsing %s', index)
-                    packages = parse_package_index(index.url, url, repo, comp)
-                    for package in packages.keys():
-                        if package not in comp.packages:
-                            comp.packages[package] = {}
-                            comp.packages[package][arch] = []
 
-                        comp.packages[package][arch].append(packages[package])
+def scan_apt_repository(
+        url: str,
+        distribution: str,
+        architectures: list[str] | None = ['amd64', 'arm64'],
+        components: list[str] | None = ['main', 'universe'],
+        fields: set[str] | None = None,
+        mirrors: dict[str, MirrorSet] | None = None
+    ) -> AptRepository:
+    """
+    Read all packages and sources from the given APT repository.
+    """
+    logger.info('Parsing repository %s %s %s %s',
+                url, distribution, architectures, components)
+    
+    repo = read_release(url, distribution, components, mirrors)
+    scan_components(repo, architectures, components, fields, mirrors=mirrors)
+    
+    return repo
 
-        repo.components[component] = comp
 
-        for index in comp.indices:
-            if 'source' in index.url and 'Sources.gz' in index.url:
-                logger.debug('Parsing %s', index)
-                sources = parse_source_index(index.url, url, repo, comp)
-                for source in sources.keys():
-                    if comp.sources.get(source) is not None:
-                        logger.warning('Duplicate source %s in %s', package, index.url)
-                    else:
-                        comp.sources[source] = sources[source]
-
-        repo.components[component] = comp
-
-        for package in comp.packages.keys():
-            for source_name in comp.sources.keys():
-                source = comp.sources[source_name]
-                if package in source.binaries:
-                    for a in comp.packages[package].keys():
-                        for p in comp.packages[package][a]:
-                            p.source = source
-                    break
-
-        repo.components[component] = comp
+def repository_options(repository: dict) -> tuple[list[str] | None, list[str] | None]:
+    """
+    Read the architectures and components of a configured repository.
+    """
+    architectures = ['amd64', 'arm64']
+    components = ['main', 'universe']
+    
+    if 'architectures' in repository:
+        architectures =  repository['architectures']
 
-        logger.info('Component %s: %d packages, %d sources.', comp.name, len(comp.packages), len(comp.sources))
+    if 'components' in repository:
+        components = repository['components']
     
-    return repo
+    return architectures, components
 
 
-def scan_repositories(config) -> list[AptRepository]:
+def scan_repositories(config, mirrors: dict[str, MirrorSet] | None = None) -> list[AptRepository]:
     """
     Read all packages and sources from all given APT repositories.
+
+    The 'mirrors' default to the mirror sets of the config.
     """
+    fields = read_fields(config)
+    if mirrors is None:
+        mirrors = config_mirrors(config)
+    processes = (config.get('parsing') or {}).get('processes', 1)
+    if processes > 1:
+        # parse the indices in worker processes
+        from .parallel_parsing import scan_repositories_parallel
+        return scan_repositories_parallel(config, fields, processes, mirrors)
+
     repos: list[AptRepository] = []
     for repository in config['repositories']:
-        architectures = ['amd64', 'arm64']
-        components = ['main', 'universe']
-        
-        if 'architectures' in repository:
-            architectures =  repository['architectures']
-
-        if 'components' in repository:
-            components = repository['components']
+        architectures, components = repository_options(repository)
         
         logger.debug('Scanning apt repository %s', repository['url'])
 
@@ -373,8 +545,57 @@ def scan_repositories(config) -> list[AptRepository]:
             url=repository['url'],
             distribution=repository['distribution'],
             architectures=architectures,
-            components=components
+            components=components,
+            fields=fields,
+            mirrors=mirrors
         )
         repos.append(repo)
     
     return repos
+
+
+def scan_architecture(config, arch: str, repos: list[AptRepository] | None = None,
+                      mirrors: dict[str, MirrorSet] | None = None) -> list[AptRepository]:
+    """
+    Read the packages of one architecture from all given APT repositories.
+
+    The release data and sources are read once, with the first
+    architecture. For the next architectures, the 'repos' of the
+    previous architecture are reused, and their packages are replaced,
+    so that only the packages of one architecture are kept in memory.
+    The 'mirrors' default to the mirror sets of the config.
+    """
+    fields = read_fields(config)
+    if mirrors is None:
+        mirrors = config_mirrors(config)
+    if repos is None:
+        repos = []
+        for repository in config['repositories']:
+            _, components = repository_options(repository)
+            logger.info('Parsing sources of repository %s %s %s',
+                        repository['url'], repository['distribution'], components)
+
+            repo = read_release(repository['url'], repository['distribution'], components, mirrors)
+            for comp in repo.components.values():
+                scan_sources(repo, comp, fields, mirrors=mirrors)
+            repos.append(repo)
+
+    # release the packages of the previous architecture
+    for repo in repos:
+        for comp in repo.components.values():
+            comp.packages = {}
+
+    for repo, repository in zip(repos, config['repositories']):
+        architectures, _ = repository_options(repository)
+        if not architectures:
+            architectures = repo.architectures
+
+        for comp in repo.components.values():
+            if arch in architectures:
+                scan_packages(repo, comp, [arch], fields, mirrors=mirrors)
+            link_sources(comp)
+
+            logger.info('Component %s (%s): %d packages, %d sources.',
+                        comp.name, arch, len(comp.packages), len(comp.sources))
+    
+    return repos
@@ -0,0 +1,263 @@
+"""
+Download the .deb and source artifacts of resolved package lists.
+
+All files are fetched with bounded concurrency. Partial downloads
+are kept as '.part' files and resumed with HTTP range requests,
+and every file is hashed while it is streamed to disk. Verified
+files are recorded in a manifest in the artifact directory, so
+that later runs skip them without hashing them again.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from .apt_data import Package, Source, SourceFile
+from .resolve_lists import PackageLists
+
+
+logger = logging.getLogger('artifacts')
+
+# checksums in order of preference
+checksum_algorithms = ['sha256', 'sha512', 'sha1', 'md5']
+
+chunk_size = 1024 * 1024
+
+
+class Artifact:
+    """
+    A file to download, with its expected size and checksum.
+    """
+    def __init__(self, url: str, size: int, algorithm: str | None, checksum: str | None):
+        self.url: str = url
+        self.size: int = size
+        self.algorithm: str | None = algorithm
+        self.checksum: str | None = checksum
+
+    def __repr__(self) -> str:
+        return f'Artifact({self.url})'
+
+
+def make_artifact(url: str, metadata: Package | SourceFile) -> Artifact:
+    for algorithm in checksum_algorithms:
+        checksum = getattr(metadata, algorithm)
+        if checksum:
+            return Artifact(url, metadata.size, algorithm, checksum)
+    return Artifact(url, metadata.size, None, None)
+
+
+def collect_artifacts(config, lists: PackageLists) -> list[Artifact]:
+    """
+    Collect the unique artifacts of the ECU and SDK package lists.
+
+    Files shared between architectures, package lists and binary
+    packages of the same source are only downloaded once.
+    """
+    options = config['artifacts']
+    artifacts: dict[str, Artifact] = {}
+    sources: set[int] = set()
+
+    for arch_packages in (lists.ecu_packages, lists.sdk_packages):
+        for packages in arch_packages.values():
+            for package in packages.values():
+                if options.get('binaries', True) and package.filename:
+                    if package.filename not in artifacts:
+                        artifacts[package.filename] = make_artifact(package.filename, package)
+
+                source: Source = package.source
+                if options.get('sources', True) and source and id(source) not in sources:
+                    sources.add(id(source))
+                    for file in source.files.values():
+                        if file.name not in artifacts:
+                            artifacts[file.name] = make_artifact(file.name, file)
+
+    # identical content from different URLs, e.g. mirrored pools
+    unique: dict[tuple, Artifact] = {}
+    for artifact in artifacts.values():
+        key = (artifact.algorithm, artifact.checksum) if artifact.checksum else artifact.url
+        unique.setdefault(key, artifact)
+
+    return list(unique.values())
+
+
+def artifact_path(directory: str, url: str) -> str:
+    """
+    Local path of an artifact, mirroring the server layout.
+    """
+    parsed = urlparse(url)
+    return os.path.join(directory, parsed.netloc, parsed.path.lstrip('/'))
+
+
+def hash_file(file: str, algorithm: str):
+    """
+    Hash an existing file, returns the hash object.
+    """
+    digest = hashlib.new(algorithm)
+    with open(file, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest
+
+
+class Manifest:
+    """
+    Verified artifacts, keyed by local path.
+
+    An entry is only valid while size and modification time of the
+    file are unchanged.
+    """
+    def __init__(self, file: str):
+        self.file: str = file
+        self.entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(file):
+            with open(file, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def is_verified(self, path: str, artifact: Artifact) -> bool:
+        entry = self.entries.get(path)
+        if not entry or not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        return (entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+                and entry['checksum'] == artifact.checksum)
+
+    def add(self, path: str, artifact: Artifact):
+        stat = os.stat(path)
+        with self._lock:
+            self.entries[path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'checksum': artifact.checksum,
+            }
+
+    def save(self):
+        with open(self.file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+
+_local = threading.local()
+
+
+def _session():
+    import requests
+
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def verify(artifact: Artifact, size: int, digest) -> str | None:
+    """
+    Check size and checksum of a download, returns the error.
+    """
+    if artifact.size >= 0 and size != artifact.size:
+        return f'size mismatch {size} != {artifact.size}'
+    if digest and digest.hexdigest() != artifact.checksum:
+        return f'{artifact.algorithm} mismatch'
+    return None
+
+
+def fetch_artifact(artifact: Artifact, path: str, manifest: Manifest, timeout: float) -> str:
+    """
+    Download and verify one artifact.
+
+    Returns 'skipped', 'downloaded' or 'failed'.
+    """
+    import requests
+
+    if manifest.is_verified(path, artifact):
+        return 'skipped'
+
+    algorithm = artifact.algorithm
+    if os.path.exists(path) and algorithm:
+        # downloaded before, but not recorded in the manifest
+        error = verify(artifact, os.path.getsize(path), hash_file(path, algorithm))
+        if not error:
+            manifest.add(path, artifact)
+            return 'skipped'
+        logger.warning('Existing %s is invalid (%s), downloading again.', path, error)
+        os.remove(path)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = path + '.part'
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if 0 <= artifact.size <= offset:
+        os.remove(part)
+        offset = 0
+
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    try:
+        with _session().get(artifact.url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 206:
+                logger.debug('Resuming %s at %d bytes', artifact.url, offset)
+                digest = hash_file(part, algorithm) if algorithm else None
+                mode = 'ab'
+            elif response.status_code == 200:
+                digest = hashlib.new(algorithm) if algorithm else None
+                offset = 0
+                mode = 'wb'
+            else:
+                logger.error('Downloading %s failed: %d', artifact.url, response.status_code)
+                return 'failed'
+
+            size = offset
+            with open(part, mode) as f:
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+                    if digest:
+                        digest.update(chunk)
+    except requests.RequestException as e:
+        # the partial file is kept for the next run
+        logger.error('Downloading %s failed: %s', artifact.url, e)
+        return 'failed'
+
+    error = verify(artifact, size, digest)
+    if error:
+        logger.error('Verifying %s failed: %s', artifact.url, error)
+        os.remove(part)
+        return 'failed'
+
+    os.replace(part, path)
+    manifest.add(path, artifact)
+    return 'downloaded'
+
+
+def fetch_artifacts(config, lists: PackageLists) -> dict[str, int]:
+    """
+    Download all artifacts of the resolved package lists.
+
+    The 'artifacts' config section enables this stage. Returns the
+    number of skipped, downloaded and failed artifacts.
+    """
+    options = config.get('artifacts')
+    if not options:
+        return {}
+
+    directory = options['directory']
+    os.makedirs(directory, exist_ok=True)
+    manifest = Manifest(os.path.join(directory, 'manifest.json'))
+
+    artifacts = collect_artifacts(config, lists)
+    logger.info('Fetching %d artifacts to %s ...', len(artifacts), directory)
+
+    def fetch(artifact: Artifact) -> str:
+        path = artifact_path(directory, artifact.url)
+        try:
+            return fetch_artifact(artifact, path, manifest, options.get('timeout', 60))
+        except OSError as e:
+            logger.error('Writing %s failed: %s', path, e)
+            return 'failed'
+
+    counts = {'skipped': 0, 'downloaded': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=options.get('workers', 8)) as executor:
+        for result in executor.map(fetch, artifacts):
+            counts[result] += 1
+
+    manifest.save()
+    logger.info('Artifacts: %(downloaded)d downloaded, %(skipped)d skipped, %(failed)d failed', counts)
+    return counts
@@ -2,26 +2,98 @@
 apt2bom config handling.
 """
 import os
-import yaml
 import logging
 
 
 logger = logging.getLogger('conf')
 
+# stanza fields needed for resolving, always kept
+resolver_fields = [
+    'Package',
+    'Architecture',
+    'Version',
+    'Depends',
+    'Provides',
+    'Binary',
+    'Build-Depends',
+    'Build-Depends-Indep',
+    'Build-Depends-Arch',
+]
+
+# stanza fields needed for fetching artifacts
+artifact_fields = [
+    'Filename',
+    'Size',
+    'MD5sum',
+    'SHA1',
+    'SHA256',
+    'SHA512',
+    'Directory',
+    'Files',
+    'Checksums-Sha1',
+    'Checksums-Sha256',
+    'Checksums-Sha512',
+]
+
+# stanza fields needed for the SBOM components
+sbom_fields = [
+    'Filename',
+    'Size',
+    'MD5sum',
+    'SHA1',
+    'SHA256',
+    'SHA512',
+    'Section',
+    'Homepage',
+    'Files',
+    'Checksums-Sha1',
+    'Checksums-Sha256',
+    'Checksums-Sha512',
+]
+
+# stanza fields needed for the size analytics
+analytics_fields = [
+    'Installed-Size',
+    'Size',
+    'Section',
+    'Priority',
+]
+
 
 def read_config(file: str = 'config.json') -> dict:
     """
     Read configuration file.
+
+    A config with 'base' extends the config file named by it, relative
+    to its own directory. Its options replace the ones of the base
+    config, the options of the sections are merged.
     """
     if file is None:
         file = 'config.yaml'
 
     logger.debug('Reading config from %s ...', file)
 
+    import yaml
+
     config = None
     with open(file, 'r', encoding='utf-8') as f:
         config = yaml.safe_load(f)
 
+    base = config.pop('base', None)
+    if base:
+        base_config = read_config(os.path.join(os.path.dirname(file), base))
+        for key, value in config.items():
+            if isinstance(value, dict) and isinstance(base_config.get(key), dict):
+                base_config[key] = dict(base_config[key], **value)
+            else:
+                base_config[key] = value
+        config = base_config
+
+    for repository in config.get('repositories') or []:
+        if repository.get('mirrors'):
+            # the package URLs use the first mirror by default
+            repository.setdefault('url', repository['mirrors'][0])
+
     return config
 
 
@@ -60,3 +132,95 @@ def read_packages(config) -> (list[str], list[str]):
         logger.info('Found %d prod packages and %d dev packages.', len(prod), len(dev))
     
     return prod, dev, sdk
+
+
+def read_build_options(config) -> tuple[list[str], bool]:
+    """
+    Read active build profiles and Build-Depends-Indep handling.
+    """
+    profiles = config['packages'].get('build_profiles') or []
+    indep = config['packages'].get('build_depends_indep', True)
+    return profiles, indep
+
+
+def read_variants(config) -> list[tuple[str | None, dict]]:
+    """
+    Read the product variants of a batch config.
+
+    Each variant gets its own config, with the root package lists
+    and the output directory of the variant. Without 'variants',
+    the config itself is the only variant.
+    """
+    if not config.get('variants'):
+        return [(None, config)]
+
+    variants = []
+    for variant in config['variants']:
+        name = variant['name']
+        variant_config = dict(config)
+        del variant_config['variants']
+        variant_config['packages'] = dict(config['packages'])
+        variant_config['packages'].update(variant.get('packages') or {})
+        variant_config['output'] = dict(config['output'])
+        variant_config['output']['directory'] = variant.get(
+            'directory', os.path.join(config['output']['directory'], name))
+        variants.append((name, variant_config))
+
+    logger.info('Found %d product variants.', len(variants))
+    return variants
+
+
+def per_architecture(config) -> bool:
+    """
+    Check if the architectures are processed one at a time.
+    """
+    return bool((config.get('pipeline') or {}).get('per_architecture'))
+
+
+def architecture_config(config, arch: str) -> dict:
+    """
+    Get the config for processing only one architecture.
+
+    The outputs of the architecture are written to a subdirectory
+    of the output directory.
+    """
+    arch_config = dict(config)
+    arch_config['packages'] = dict(config['packages'])
+    arch_config['packages']['architectures'] = [arch]
+    arch_config['output'] = dict(config['output'])
+    arch_config['output']['directory'] = os.path.join(config['output']['directory'], arch)
+    return arch_config
+
+
+def read_fields(config) -> set[str] | None:
+    """
+    Read the stanza fields to keep while parsing.
+
+    The 'fields' section lists the fields per output profile. The
+    resolver fields are always kept, the 'json' profile is used for
+    the package lists, and the 'excel' profile if an Excel file is
+    configured. The artifact fields are kept if artifacts are
+    fetched, the SBOM fields if SBOMs are written, and the analytics
+    fields if analytics are written.
+    Without 'fields' section, all fields are kept.
+    """
+    profiles = config.get('fields')
+    if not profiles:
+        return None
+
+    active = ['resolver', 'json']
+    if config['output'].get('excel'):
+        active.append('excel')
+
+    fields = set(resolver_fields)
+    for profile in active:
+        fields.update(profiles.get(profile) or [])
+    if config.get('artifacts'):
+        fields.update(artifact_fields)
+    if config['output'].get('sbom'):
+        fields.update(sbom_fields)
+    if config['output'].get('analytics'):
+        fields.update(analytics_fields)
+
+    logger.debug('Keeping stanza fields %s', sorted(fields))
+    return fields
@@ -0,0 +1,352 @@
+"""
+File to package lookup using the 'Contents-<arch>' indices.
+
+A Contents file is converted once per checksum into a compact index
+file, which is memory-mapped for lookups. The index file consists of
+
+- a header: magic, number of paths and number of package lists,
+- the offsets of the sorted paths (uint64, one more than paths),
+- the package list offsets (uint64, one more than lists),
+- the package list id of each path (uint32),
+- 4 padding bytes if the number of paths is odd,
+- the path strings, then the package list strings.
+
+Paths are stored without leading '/', and sorted bytewise, so that
+exact and prefix lookups are binary searches on the mapped file.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+from array import array
+from .apt_download import MirrorSet, config_mirrors, get_distro_url, read_url, stream_gz_url
+from .conf import read_config
+
+
+logger = logging.getLogger('contents')
+
+magic = b'A2BCNT01'
+header = struct.Struct('<8sQQ')
+
+
+def contents_indices(url: str, distribution: str, arch: str,
+                     components: list[str] | None = None,
+                     mirrors: dict[str, MirrorSet] | None = None) -> list[tuple[str, str]]:
+    """
+    Find the Contents files of an architecture in the 'Release' file.
+
+    Returns (url, checksum) of the distribution wide file, or of the
+    files of the given components.
+    """
+    found: dict[str, str] = {}
+    section = None
+    for line in read_url(get_distro_url(url, distribution, 'Release'), mirrors):
+        if not line.startswith(' '):
+            section = line.split(':')[0]
+            continue
+        if section not in ('MD5Sum', 'SHA256'):
+            continue
+
+        checksum, _, path = line.split()
+        parts = path.split('/')
+        if parts[-1] != f'Contents-{arch}.gz':
+            continue
+        if len(parts) > 1 and components is not None and parts[0] not in components:
+            continue
+        # prefer SHA256, which comes after MD5Sum
+        found[path] = checksum
+
+    paths = [path for path in found.keys() if '/' not in path] or sorted(found.keys())
+    return [(get_distro_url(url, distribution, path), found[path]) for path in paths]
+
+
+def parse_contents_line(line: bytes) -> tuple[bytes, bytes] | None:
+    """
+    Split a Contents line into path and package list.
+    """
+    parts = line.rstrip(b'\n').rsplit(maxsplit=1)
+    if len(parts) != 2:
+        return None
+    path, packages = parts
+    return path.lstrip(b'/'), packages
+
+
+def build_contents_index(lines, file: str):
+    """
+    Write the index file for the lines of a Contents file.
+
+    Contents files are usually sorted already, then the paths are
+    streamed to a temporary file. Otherwise they are sorted before
+    writing the index.
+    """
+    path_offsets = array('Q', [0])
+    list_ids = array('I')
+    list_of: dict[bytes, int] = {}
+    lists: list[bytes] = []
+    ordered = True
+    last = b''
+
+    directory = os.path.dirname(file) or '.'
+    with tempfile.TemporaryFile(dir=directory) as blob:
+        for line in lines:
+            entry = parse_contents_line(line)
+            if entry is None or entry == (b'FILE', b'LOCATION'):
+                continue
+            path, packages = entry
+
+            if path < last:
+                ordered = False
+            last = path
+
+            if packages not in list_of:
+                list_of[packages] = len(lists)
+                lists.append(packages)
+
+            blob.write(path)
+            path_offsets.append(path_offsets[-1] + len(path))
+            list_ids.append(list_of[packages])
+
+        count = len(list_ids)
+        blob.seek(0)
+        if not ordered:
+            logger.debug('Sorting %d paths of %s', count, file)
+            paths = blob.read()
+            order = sorted(range(count), key=lambda i: paths[path_offsets[i]:path_offsets[i + 1]])
+            sorted_paths = [paths[path_offsets[i]:path_offsets[i + 1]] for i in order]
+            del paths
+            list_ids = array('I', [list_ids[i] for i in order])
+            path_offsets = array('Q', [0])
+            for path in sorted_paths:
+                path_offsets.append(path_offsets[-1] + len(path))
+            blob.seek(0)
+            blob.truncate()
+            blob.write(b''.join(sorted_paths))
+            del sorted_paths
+            blob.seek(0)
+
+        list_offsets = array('Q', [0])
+        for packages in lists:
+            list_offsets.append(list_offsets[-1] + len(packages))
+
+        # the index becomes visible atomically
+        part = file + '.part'
+        with open(part, 'wb') as f:
+            f.write(header.pack(magic, count, len(lists)))
+            f.write(path_offsets.tobytes())
+            f.write(list_offsets.tobytes())
+            f.write(list_ids.tobytes())
+            if count % 2:
+                f.write(b'\0' * 4)
+            shutil.copyfileobj(blob, f)
+            f.write(b''.join(lists))
+        os.replace(part, file)
+
+    logger.info('Indexed %d paths with %d package lists in %s', count, len(lists), file)
+
+
+class ContentsIndex:
+    """
+    Memory-mapped index of a Contents file.
+    """
+    def __init__(self, file: str):
+        self.file: str = file
+        with open(file, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        file_magic, self.count, lists = header.unpack_from(self._map, 0)
+        if file_magic != magic:
+            raise ValueError(f'{file} is no contents index')
+
+        view = memoryview(self._map)
+        start = header.size
+        self._path_offsets = view[start:start + 8 * (self.count + 1)].cast('Q')
+        start += 8 * (self.count + 1)
+        self._list_offsets = view[start:start + 8 * (lists + 1)].cast('Q')
+        start += 8 * (lists + 1)
+        self._list_ids = view[start:start + 4 * self.count].cast('I')
+        start += 4 * (self.count + self.count % 2)
+        self._paths_start = start
+        self._lists_start = start + self._path_offsets[self.count]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return f'ContentsIndex({self.file}, {self.count} paths)'
+
+    def _path(self, i: int) -> bytes:
+        start = self._paths_start
+        return self._map[start + self._path_offsets[i]:start + self._path_offsets[i + 1]]
+
+    def _packages(self, i: int) -> list[str]:
+        list_id = self._list_ids[i]
+        start = self._lists_start
+        packages = self._map[start + self._list_offsets[list_id]:start + self._list_offsets[list_id + 1]]
+        # entries are 'section/package' or 'area/section/package'
+        return [entry.rsplit('/', 1)[-1] for entry in packages.decode().split(',')]
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._path(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, path: str) -> list[str]:
+        """
+        Get the packages containing a file path.
+        """
+        key = path.lstrip('/').encode()
+        i = self._lower_bound(key)
+        if i < self.count and self._path(i) == key:
+            return self._packages(i)
+        return []
+
+    def prefix(self, prefix: str, limit: int | None = None):
+        """
+        Iterate (path, packages) of all paths starting with a prefix.
+        """
+        key = prefix.lstrip('/').encode()
+        i = self._lower_bound(key)
+        found = 0
+        while i < self.count and (limit is None or found < limit):
+            path = self._path(i)
+            if not path.startswith(key):
+                break
+            yield '/' + path.decode(), self._packages(i)
+            i += 1
+            found += 1
+
+    def close(self):
+        self._path_offsets.release()
+        self._list_offsets.release()
+        self._list_ids.release()
+        self._map.close()
+
+
+def index_file(directory: str, url: str, checksum: str) -> str:
+    name = re.sub(r'[^A-Za-z0-9.-]', '_', url.rsplit('/', 1)[-1])
+    key = hashlib.sha256(f'{url}\n{checksum}'.encode()).hexdigest()[:16]
+    return os.path.join(directory, f'{name}.{key}.idx')
+
+
+def load_contents(config, arch: str, mirrors: dict[str, MirrorSet] | None = None) -> list[ContentsIndex]:
+    """
+    Open the Contents indices of all repositories for an architecture,
+    building the index files which do not yet exist.
+    """
+    directory = config['contents']['directory']
+    os.makedirs(directory, exist_ok=True)
+
+    indices: list[ContentsIndex] = []
+    for repository in config['repositories']:
+        for url, checksum in contents_indices(
+                repository['url'], repository['distribution'], arch, repository.get('components'), mirrors):
+            file = index_file(directory, url, checksum)
+            if not os.path.exists(file):
+                logger.info('Building contents index for %s ...', url)
+                build_contents_index(stream_gz_url(url, mirrors), file)
+            indices.append(ContentsIndex(file))
+    return indices
+
+
+class Contents:
+    """
+    File lookups over the Contents indices of all configured repositories
+    and architectures, in repository priority order.
+
+    The 'mirrors' default to the mirror sets of the config.
+    """
+    def __init__(self, config, mirrors: dict[str, MirrorSet] | None = None):
+        if mirrors is None:
+            mirrors = config_mirrors(config)
+        self.indices: dict[str, list[ContentsIndex]] = {}
+        for arch in config['packages']['architectures']:
+            self.indices[arch] = load_contents(config, arch, mirrors)
+
+    def lookup(self, path: str, arch: str | None = None) -> list[str]:
+        """
+        Get the packages containing a file path.
+        """
+        packages: list[str] = []
+        for index_arch, indices in self.indices.items():
+            if arch is not None and index_arch != arch:
+                continue
+            for index in indices:
+                for package in index.lookup(path):
+                    if package not in packages:
+                        packages.append(package)
+        return packages
+
+    def prefix(self, prefix: str, arch: str | None = None, limit: int | None = None) -> dict[str, list[str]]:
+        """
+        Get the paths starting with a prefix, and their packages.
+        """
+        found: dict[str, list[str]] = {}
+        for index_arch, indices in self.indices.items():
+            if arch is not None and index_arch != arch:
+                continue
+            for index in indices:
+                for path, packages in index.prefix(prefix, limit):
+                    entry = found.setdefault(path, [])
+                    entry.extend([package for package in packages if package not in entry])
+        return found
+
+    def resolve_paths(self, names: list[str] | None) -> list[str] | None:
+        """
+        Replace the file paths in a root package list by the packages
+        containing them. Entries not starting with '/' are package names.
+        """
+        if names is None:
+            return None
+
+        packages: list[str] = []
+        for name in names:
+            if not name.startswith('/'):
+                packages.append(name)
+                continue
+
+            owners = self.lookup(name)
+            if not owners:
+                logger.error('No package contains %s!', name)
+                continue
+            if len(owners) > 1:
+                logger.warning('%s is contained in %s, using %s.', name, owners, owners[0])
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%s is provided by %s', name, owners[0])
+            packages.append(owners[0])
+        return packages
+
+    def close(self):
+        for indices in self.indices.values():
+            for index in indices:
+                index.close()
+
+
+def owner(config: str = 'config.yaml', path: str = None):
+    """
+    Print the packages containing a file path, or all paths starting
+    with a prefix if the path ends with '*'.
+    """
+    config = read_config(file=config)
+    if not config.get('contents'):
+        logger.error('No contents index configured!')
+        return
+
+    contents = Contents(config)
+    try:
+        if path.endswith('*'):
+            for found, packages in contents.prefix(path[:-1]).items():
+                print(f'{found}: {", ".join(packages)}')
+        else:
+            packages = contents.lookup(path)
+            print(f'{path}: {", ".join(packages) or "-"}')
+    finally:
+        contents.close()
@@ -0,0 +1,190 @@
+"""
+Differences of the package lists between two repository states.
+
+The same root packages are resolved against the repositories of two
+configs, e.g. jammy and jammy-updates, or two snapshots. Repositories
+configured in both are only parsed once. The resolved lists are
+reduced to records indexed by architecture, list and package name,
+and joined using these indices, so that the diff is linear in the
+size of the closures.
+"""
+import json
+import logging
+import os
+from .apt_data import AptRepository
+from .apt_download import config_mirrors
+from .apt_parsing import scan_apt_repository, repository_options
+from .apt2bom import read_roots
+from .conf import read_config, read_build_options, read_fields
+from .graph import DependencyGraph, build_graph
+from .resolve_lists import PackageLists, resolve_package_lists
+
+
+logger = logging.getLogger('diff')
+
+
+def scan_shared(configs: list[dict], fields: set[str] | None = None) -> list[list[AptRepository]]:
+    """
+    Scan the repositories of all configs.
+
+    A repository configured in several configs is scanned only once,
+    and shared by their repository lists.
+    """
+    scanned: dict[tuple, AptRepository] = {}
+    repo_lists: list[list[AptRepository]] = []
+    for config in configs:
+        mirrors = config_mirrors(config)
+        repos = []
+        for repository in config['repositories']:
+            architectures, components = repository_options(repository)
+            key = (repository['url'], repository['distribution'],
+                   tuple(architectures or []), tuple(components or []))
+            if key in scanned:
+                logger.info('Reusing repository %s %s', repository['url'], repository['distribution'])
+            else:
+                scanned[key] = scan_apt_repository(
+                    url=repository['url'],
+                    distribution=repository['distribution'],
+                    architectures=architectures,
+                    components=components,
+                    fields=fields,
+                    mirrors=mirrors
+                )
+            repos.append(scanned[key])
+        repo_lists.append(repos)
+    return repo_lists
+
+
+def list_records(lists: PackageLists) -> dict[tuple[str, str], dict[str, dict]]:
+    """
+    Reduce resolved package lists to records,
+    indexed by architecture, list and package name.
+    """
+    records: dict[tuple[str, str], dict[str, dict]] = {}
+    for list_name, arch_packages, arch_overlays in (('ecu', lists.ecu_packages, lists.ecu_overlays),
+                                                   ('sdk', lists.sdk_packages, lists.sdk_overlays)):
+        for arch, packages in arch_packages.items():
+            arch_graph = lists.graph.archs[arch]
+            index_of = arch_graph.index_of
+            members = set(index_of[id(package)] for package in packages.values())
+
+            entries: dict[str, dict] = {}
+            for name, package in packages.items():
+                depends = arch_graph.resolved_depends(index_of[id(package)], members)
+                entries[name] = {
+                    'version': package.version,
+                    'type': arch_overlays[arch][name].pkg_type,
+                    'source': f'{package.source.package} {package.source.version}' if package.source else None,
+                    'depends': [arch_graph.packages[dep].package for dep in depends if dep in members],
+                }
+            records[(arch, list_name)] = entries
+    return records
+
+
+def diff_entries(old: dict[str, dict], new: dict[str, dict]) -> dict[str, list]:
+    """
+    Join the records of one list by package name.
+    """
+    result: dict[str, list] = {
+        'added': [],
+        'removed': [],
+        'versions': [],
+        'sources': [],
+        'types': [],
+        'added_edges': [],
+        'removed_edges': [],
+    }
+    for name in sorted(old.keys() - new.keys()):
+        result['removed'].append({'name': name, 'version': old[name]['version']})
+
+    for name in sorted(new.keys()):
+        entry = new[name]
+        old_entry = old.get(name)
+        if old_entry is None:
+            result['added'].append({'name': name, 'version': entry['version']})
+            continue
+
+        for field, changes in (('version', 'versions'), ('source', 'sources'), ('type', 'types')):
+            if old_entry[field] != entry[field]:
+                result[changes].append({'name': name, 'old': old_entry[field], 'new': entry[field]})
+
+        old_depends = set(old_entry['depends'])
+        new_depends = set(entry['depends'])
+        result['added_edges'].extend([name, dep] for dep in entry['depends'] if dep not in old_depends)
+        result['removed_edges'].extend([name, dep] for dep in old_entry['depends'] if dep not in new_depends)
+    return result
+
+
+def diff_records(old: dict[tuple[str, str], dict[str, dict]],
+                 new: dict[tuple[str, str], dict[str, dict]]) -> dict[str, dict[str, dict]]:
+    """
+    Differences of all lists, per architecture and list.
+    """
+    result: dict[str, dict[str, dict]] = {}
+    for arch, list_name in dict.fromkeys(list(old.keys()) + list(new.keys())):
+        result.setdefault(arch, {})[list_name] = diff_entries(
+            old.get((arch, list_name), {}), new.get((arch, list_name), {}))
+    return result
+
+
+def format_diff(result: dict[str, dict[str, dict]]) -> list[str]:
+    """
+    Format the differences as report lines.
+    """
+    lines = []
+    for arch, arch_lists in result.items():
+        for list_name, changes in arch_lists.items():
+            lines.append(f'{arch} {list_name}: ' + ', '.join(
+                f'{len(values)} {key.replace("_", " ")}' for key, values in changes.items()))
+            lines.extend(f'  + {c["name"]} {c["version"]}' for c in changes['added'])
+            lines.extend(f'  - {c["name"]} {c["version"]}' for c in changes['removed'])
+            lines.extend(f'  ~ {c["name"]} {c["old"]} -> {c["new"]}' for c in changes['versions'])
+            lines.extend(f'  source {c["name"]}: {c["old"]} -> {c["new"]}' for c in changes['sources'])
+            lines.extend(f'  type {c["name"]}: {c["old"]} -> {c["new"]}' for c in changes['types'])
+            lines.extend(f'  + {name} -> {dep}' for name, dep in changes['added_edges'])
+            lines.extend(f'  - {name} -> {dep}' for name, dep in changes['removed_edges'])
+    return lines
+
+
+def diff(config: str = 'config.yaml', other: str = None):
+    """
+    Print the differences of the package lists resolved against the
+    repositories of the config, and of the 'other' config.
+
+    Only the repositories of the other config are used, roots and
+    build options are taken from the config. With 'output.diff',
+    the differences are also written as JSON.
+    """
+    config = read_config(file=config)
+    other_config = read_config(file=other)
+    variants = read_roots(config)
+
+    profiles, indep = read_build_options(config)
+    architectures = list(dict.fromkeys(
+        arch for _, variant, _ in variants for arch in variant['packages']['architectures']))
+
+    logger.info('Scan apt repositories...')
+    repo_lists = scan_shared([config, other_config], read_fields(config))
+    graphs: list[DependencyGraph] = [build_graph(repos, architectures, profiles=profiles, indep=indep)
+                                     for repos in repo_lists]
+
+    for name, variant, (prod, dev, sdk) in variants:
+        if name:
+            print(f'{name}:')
+
+        records = []
+        for repos, graph in zip(repo_lists, graphs):
+            lists = resolve_package_lists(
+                repos, variant['packages']['architectures'], prod, dev, sdk, graph=graph)
+            records.append(list_records(lists))
+
+        result = diff_records(*records)
+        for line in format_diff(result):
+            print(line)
+
+        if variant['output'].get('diff'):
+            os.makedirs(variant['output']['directory'], exist_ok=True)
+            file = os.path.join(variant['output']['directory'], variant['output']['diff'])
+            logger.debug('Writing diff to %s ...', file)
+            with open(file, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=4)
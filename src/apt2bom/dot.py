@@ -1,55 +1,214 @@
 """
 Export ECU packages as dot graph.
+
+The graphs can optionally be simplified before writing, see
+'simplify_graph': limiting the depth from the root packages,
+collapsing binary packages of the same source, condensing
+dependency cycles and removing transitive edges.
 """
 import os
+from collections import deque
 from .resolve_lists import PackageLists
 from .apt_data import Package
+from .graph import condense, transitive_reduction
+
+
+def _edges(lists: PackageLists, arch: str, package: Package,
+           build_time: bool, members: set[int]) -> list[str]:
+    """
+    Get the names of the resolved dependencies of a package.
+    """
+    arch_graph = lists.graph.archs[arch]
+    index = arch_graph.index_of[id(package)]
+    groups = arch_graph.build_depends(index) if build_time else arch_graph.depends(index)
+
+    names: list[str] = []
+    for group in groups:
+        dep = arch_graph.satisfier(group, members)
+        name = arch_graph.packages[dep].package if dep >= 0 else lists.graph.group_text(arch, group)
+        if name not in names:
+            names.append(name)
+    return names
+
+
+class DotGraph:
+    """
+    Named nodes with adjacency lists.
+    """
+    def __init__(self):
+        self.names: list[str] = []
+        self.sources: list[str] = []
+        self.roots: list[int] = []
+        self.adjacency: list[list[int]] = []
+        self.node_of: dict[str, int] = {}
+
+    def node(self, name: str, source: str | None = None) -> int:
+        if name not in self.node_of:
+            self.node_of[name] = len(self.names)
+            self.names.append(name)
+            self.sources.append(source or name)
+            self.adjacency.append([])
+        elif source:
+            self.sources[self.node_of[name]] = source
+        return self.node_of[name]
+
+    def add_edges(self, name: str, depends: list[str], source: str | None = None):
+        node = self.node(name, source)
+        for dep in depends:
+            target = self.node(dep)
+            if target not in self.adjacency[node]:
+                self.adjacency[node].append(target)
+
+    def merge(self, group_of: list[int], names: list[str]) -> 'DotGraph':
+        """
+        Merge nodes into groups, dropping edges inside a group.
+        """
+        graph = DotGraph()
+        graph.names = names
+        graph.sources = list(names)
+        graph.node_of = {name: node for node, name in enumerate(names)}
+        graph.adjacency = [[] for _ in names]
+        graph.roots = sorted(set(group_of[root] for root in self.roots))
+        edges: set[tuple[int, int]] = set()
+        for node, deps in enumerate(self.adjacency):
+            source = group_of[node]
+            for dep in deps:
+                target = group_of[dep]
+                if target != source and (source, target) not in edges:
+                    edges.add((source, target))
+                    graph.adjacency[source].append(target)
+        return graph
+
+    def limit_depth(self, max_depth: int) -> 'DotGraph':
+        """
+        Keep only the nodes reachable from the roots within max_depth edges.
+        """
+        depth = [-1] * len(self.names)
+        queue = deque(self.roots)
+        for root in self.roots:
+            depth[root] = 0
+        while queue:
+            node = queue.popleft()
+            if depth[node] >= max_depth:
+                continue
+            for dep in self.adjacency[node]:
+                if depth[dep] < 0:
+                    depth[dep] = depth[node] + 1
+                    queue.append(dep)
+
+        graph = DotGraph()
+        for node in range(len(self.names)):
+            if depth[node] >= 0:
+                graph.node(self.names[node], self.sources[node])
+        for node, deps in enumerate(self.adjacency):
+            if depth[node] >= 0:
+                graph.add_edges(self.names[node], [self.names[dep] for dep in deps if depth[dep] >= 0])
+        graph.roots = [graph.node_of[self.names[root]] for root in self.roots]
+        return graph
+
+    def collapse_sources(self) -> 'DotGraph':
+        """
+        Collapse binary packages of the same source package into one node.
+        """
+        names = list(dict.fromkeys(self.sources))
+        group = {name: index for index, name in enumerate(names)}
+        return self.merge([group[source] for source in self.sources], names)
+
+    def condense(self) -> 'DotGraph':
+        """
+        Condense dependency cycles into one node.
+        """
+        component, _ = condense(self.adjacency)
+        members: list[list[str]] = [[] for _ in range(max(component, default=-1) + 1)]
+        for node, name in enumerate(self.names):
+            members[component[node]].append(name)
+        return self.merge(component, [' | '.join(sorted(names)) for names in members])
+
+    def reduce(self) -> 'DotGraph':
+        """
+        Remove transitive edges, the graph must be condensed.
+        """
+        graph = self.merge(list(range(len(self.names))), self.names)
+        graph.adjacency = transitive_reduction(self.adjacency)
+        return graph
+
+    def write(self, file: str):
+        content = "digraph {\n"
+        for node, name in enumerate(self.names):
+            depends = ' '.join([f'"{self.names[dep]}"' for dep in self.adjacency[node]])
+            content += f'    "{name}" -> {{{depends}}}\n'
+        content += '}'
+
+        with open(file, 'w') as f:
+            f.write(content)
+
+        os.system(f'dot -Tsvg {file} > {file}.svg')
+
+
+def simplify_graph(config, graph: DotGraph) -> DotGraph:
+    """
+    Apply the simplifications configured in 'output.dot'.
+
+    A transitive reduction is only unique for acyclic graphs, so
+    cycles are always condensed before reducing.
+    """
+    options = config['output'].get('dot') or {}
+    if options.get('max_depth'):
+        graph = graph.limit_depth(options['max_depth'])
+    if options.get('collapse_sources'):
+        graph = graph.collapse_sources()
+    if options.get('condense_cycles') or options.get('transitive_reduction'):
+        graph = graph.condense()
+    if options.get('transitive_reduction'):
+        graph = graph.reduce()
+    return graph
+
+
+def _source_name(package: Package) -> str | None:
+    return package.source.package if package.source else None
+
 
 def write_ecu_runtime_dot_graph(config, lists: PackageLists):
     """
-    Write package lists as Excel file.
+    Write the runtime dependencies of the ECU packages as dot graph.
     """
     for arch in config['packages']['architectures']:
-        content = "digraph {\n"
+        graph = DotGraph()
 
         if arch in lists.ecu_packages:
+            index_of = lists.graph.archs[arch].index_of
+            members = set(index_of[id(p)] for p in lists.ecu_packages[arch].values())
             for name in lists.ecu_packages[arch]:
                 package = lists.ecu_packages[arch][name]
-                depends = ' '.join([f'"{name}"' for name, _ in package.depends])
-                content += f'    "{package.package}" -> {{{depends}}}\n'
-        
-        content += '}'
+                graph.add_edges(package.package, _edges(lists, arch, package, False, members),
+                                _source_name(package))
+                if name in lists.ecu_roots[arch]:
+                    graph.roots.append(graph.node_of[package.package])
 
         file = os.path.join(
             config['output']['directory'],
             f'runtime_deps_{arch}.dot')
-        with open(file, 'w') as f:
-            f.write(content)
-    
-        os.system(f'dot -Tsvg {file} > {file}.svg')
+        simplify_graph(config, graph).write(file)
 
 
 def write_ecu_build_time_dot_graph(config, lists: PackageLists):
     """
-    Write package lists as Excel file.
+    Write the build time dependencies of the ECU packages as dot graph.
     """
     for arch in config['packages']['architectures']:
-        content = "digraph {\n"
+        graph = DotGraph()
 
         if arch in lists.ecu_packages:
+            index_of = lists.graph.archs[arch].index_of
+            members = set(index_of[id(p)] for p in lists.sdk_packages.get(arch, {}).values())
             for name in lists.ecu_packages[arch]:
                 package = lists.ecu_packages[arch][name]
                 if package.source:
-                    build_depends = ' '.join(
-                        [f'"{name}"' for name, _ in package.source.build_depends])
-                    content += f'    "{package.package}" -> {{{build_depends}}}\n'
-        
-        content += '}'
+                    graph.add_edges(package.package, _edges(lists, arch, package, True, members),
+                                    _source_name(package))
+                    graph.roots.append(graph.node_of[package.package])
 
         file = os.path.join(
             config['output']['directory'],
             f'build_time_deps_{arch}.dot')
-        with open(file, 'w') as f:
-            f.write(content)
-        
-        os.system(f'dot -Tsvg {file} > {file}.svg')
+        simplify_graph(config, graph).write(file)
@@ -3,7 +3,6 @@ Write package lists as Excel sheet.
 """
 import os
 import logging
-from openpyxl import Workbook
 from .apt_data import Package, Source
 from .resolve_lists import PackageLists
 from .output import create_out_dir
@@ -23,6 +22,8 @@ source_headers = [
     'maintainer',
     'standards_version',
     'build_depends',
+    'build_depends_indep',
+    'build_depends_arch',
     'homepage',
     'vcs_browser',
     'vcs_git',
@@ -84,6 +85,8 @@ package_headers = [
     'source_maintainer',
     'source_standards_version',
     'source_build_depends',
+    'source_build_depends_indep',
+    'source_build_depends_arch',
     'source_homepage',
     'source_vcs_browser',
     'source_vcs_git',
@@ -106,6 +109,7 @@ def write_excel_package_list(config, lists: PackageLists):
     """
     Write package lists as Excel file.
     """
+    from openpyxl import Workbook
 
     create_out_dir(config)
 
@@ -116,14 +120,15 @@ def write_excel_package_list(config, lists: PackageLists):
     ws = wb.active
     ws.title = 'Source ECU Packages'
     sources: dict[str, Source] = {}
-    # collect all source packages
+    source_types: dict[str, str] = {}
+    # collect all source packages, typed by their first package
     for arch in config['packages']['architectures']:
         if arch in lists.ecu_packages:
             for name in lists.ecu_packages[arch]:
                 package = lists.ecu_packages[arch][name]
                 if package.source:
                     if package.source.package not in sources:
-                        package.source.pkg_type = package.pkg_type
+                        source_types[package.source.package] = lists.ecu_overlays[arch][name].pkg_type
                         sources[package.source.package] = package.source
 
     source_list = list(sources.values())
@@ -133,6 +138,7 @@ def write_excel_package_list(config, lists: PackageLists):
         
     for i, source in enumerate(source_list):
         data = source.to_record()
+        data['pkg_type'] = source_types[source.package]
         for j, key in enumerate(source_headers):
             if key in data:
                 ws.cell(row=i+2, column=j+1, value=data[key])
@@ -152,6 +158,7 @@ def write_excel_package_list(config, lists: PackageLists):
         
             for i, package in enumerate(ecu_packages):
                 data = package.to_record()
+                data['pkg_type'] = lists.ecu_overlays[arch][package.package].pkg_type
                 for j, key in enumerate(package_headers):
                     if key in data:
                         ws.cell(row=i+2, column=j+1, value=data[key])
@@ -170,6 +177,7 @@ def write_excel_package_list(config, lists: PackageLists):
             
             for i, package in enumerate(sdk_packages):
                 data = package.to_record()
+                data['pkg_type'] = lists.sdk_overlays[arch][package.package].pkg_type
                 for j, key in enumerate(package_headers):
                     if key in data:
                         ws.cell(row=i+2, column=j+1, value=data[key])
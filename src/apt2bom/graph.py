@@ -0,0 +1,701 @@
+"""
+Compiled dependency graph of APT metadata.
+
+Package names are interned to integer ids once after scanning, and
+the dependency edges of each architecture are stored as compact
+array-backed CSR (compressed sparse row) adjacency. Closures are
+computed with an array-based breadth-first search.
+
+A dependency entry is a group of alternatives ('a | b'). Packages
+point to groups, and groups point to the name ids of the alternatives.
+Build-time dependencies are compiled once per unique source package
+and version, and are shared by all binaries built from this source.
+Architecture and build profile restrictions are evaluated when the
+graph of an architecture is compiled.
+"""
+from __future__ import annotations
+
+import logging
+from array import array
+from typing import Callable, Hashable, Iterable, Sequence
+from .apt_data import AptRepository, Dependency, Package, Source
+
+
+logger = logging.getLogger('graph')
+
+
+cpu_names = {
+    'armhf': 'arm',
+    'armel': 'arm',
+}
+
+
+def arch_matches(pattern: str, arch: str) -> bool:
+    """
+    Check a Debian architecture wildcard, e.g. 'linux-any' or 'any-amd64'.
+    """
+    if pattern in ('any', arch, f'linux-{arch}'):
+        return True
+    if pattern == 'linux-any':
+        return '-' not in arch
+    if pattern.startswith('any-'):
+        return pattern[4:] == cpu_names.get(arch, arch)
+    return False
+
+
+def dependency_applies(dep: Dependency, arch: str, profiles: set[str]) -> bool:
+    """
+    Evaluate the architecture and build profile restrictions of a dependency.
+    """
+    if dep.architectures:
+        negated = dep.architectures[0].startswith('!')
+        matches = any(arch_matches(pattern.lstrip('!'), arch) for pattern in dep.architectures)
+        if matches == negated:
+            return False
+
+    if dep.profiles:
+        return any(
+            all((term[1:] not in profiles) if term.startswith('!') else (term in profiles)
+                for term in terms)
+            for terms in dep.profiles)
+
+    return True
+
+
+def strip_arch_qualifier(name: str) -> str:
+    """
+    Remove an architecture qualifier, e.g. 'python3:any' -> 'python3'.
+    """
+    if ':' in name:
+        return name.split(':', maxsplit=1)[0]
+    return name
+
+
+class ArchGraph:
+    """
+    Dependency graph of the packages of one architecture.
+
+    Nodes are indices into 'packages'. The 'provider' array maps a
+    name id to the index of the package providing this name, or -1.
+    Edges point from a package index to dependency groups, and from
+    a group to the name ids of its alternatives. The provides
+    adjacency maps a name id to all packages providing this name.
+    Build-time dependency groups are indexed by source id.
+    """
+    def __init__(self, arch: str):
+        self.arch: str = arch
+        self.packages: Sequence[Package] = []
+        self.index_of: dict[int, int] = {}
+        self.provider: array = array('i')
+        self.package_source: array = array('i')
+        self.depends_offsets: array = array('i', [0])
+        self.build_offsets: array = array('i', [0])
+        self.group_offsets: array = array('i', [0])
+        self.group_targets: array = array('i')
+        self.provides_offsets: array = array('i', [0])
+        self.provides_targets: array = array('i')
+
+    def __repr__(self) -> str:
+        return f'ArchGraph({self.arch}, {len(self.packages)} packages, {len(self.group_targets)} edges)'
+
+    def resolve(self, name_id: int) -> int:
+        """
+        Get the package index providing the given name id, or -1.
+        """
+        if name_id < len(self.provider):
+            return self.provider[name_id]
+        return -1
+
+    def providers(self, name_id: int) -> array:
+        """
+        Get the indices of all packages providing the given name id.
+        """
+        if name_id + 1 < len(self.provides_offsets):
+            return self.provides_targets[self.provides_offsets[name_id]:self.provides_offsets[name_id + 1]]
+        return array('i')
+
+    def alternatives(self, group: int) -> array:
+        """
+        Get the name ids of the alternatives of a dependency group.
+        """
+        return self.group_targets[self.group_offsets[group]:self.group_offsets[group + 1]]
+
+    def depends(self, index: int) -> range:
+        """
+        Get the runtime dependency groups of a package.
+        """
+        return range(self.depends_offsets[index], self.depends_offsets[index + 1])
+
+    def build_depends(self, index: int) -> range:
+        """
+        Get the build-time dependency groups of a package.
+        """
+        source_id = self.package_source[index]
+        if source_id < 0:
+            return range(0)
+        return self.source_build_depends(source_id)
+
+    def source_build_depends(self, source_id: int) -> range:
+        """
+        Get the build-time dependency groups of a source.
+        """
+        return range(self.build_offsets[source_id], self.build_offsets[source_id + 1])
+
+    def satisfier(self, group: int, members: set[int] | None = None) -> int:
+        """
+        Get the package index satisfying a dependency group, or -1.
+
+        A provider contained in 'members' is preferred,
+        else the first resolvable alternative is used.
+        """
+        if members:
+            for name_id in self.alternatives(group):
+                for index in self.providers(name_id):
+                    if index in members:
+                        return index
+
+        for name_id in self.alternatives(group):
+            index = self.resolve(name_id)
+            if index >= 0:
+                return index
+        return -1
+
+    def resolved_depends(self, index: int, members: set[int]) -> list[int]:
+        """
+        Get the package indices satisfying the runtime dependencies
+        of a package, preferring packages contained in 'members'.
+        """
+        deps: list[int] = []
+        for group in self.depends(index):
+            dep = self.satisfier(group, members)
+            if dep >= 0 and dep not in deps:
+                deps.append(dep)
+        return deps
+
+
+class DependencyGraph:
+    """
+    Interned, per architecture dependency graph of all scanned packages.
+
+    The 'profiles' are the active build profiles, e.g. 'nocheck'.
+    If 'indep' is set, Build-Depends-Indep are also followed.
+    """
+    def __init__(self, profiles: list[str] | None = None, indep: bool = True):
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.archs: dict[str, ArchGraph] = {}
+        self.profiles: set[str] = set(profiles or [])
+        self.indep: bool = indep
+        self.source_ids: dict[tuple[str, str], int] = {}
+        self.source_groups: list[list[tuple[tuple[int, Dependency], ...]]] = []
+        self.reach_cache: dict[str, dict[int, tuple[array, tuple[str, ...]]]] | None = None
+
+    def __repr__(self) -> str:
+        return f'DependencyGraph({len(self.names)} names, {len(self.source_groups)} sources, {list(self.archs.keys())})'
+
+    def intern(self, name: str) -> int:
+        """
+        Get the id of the given package name, adding it if unknown.
+        """
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.ids[name] = name_id
+            self.names.append(name)
+        return name_id
+
+    def intern_source(self, source: Source) -> int:
+        """
+        Get the id of the given source package and version.
+
+        The build-time dependencies are interned once per source,
+        and shared by all binaries and architectures.
+        """
+        key = (source.package, source.version)
+        source_id = self.source_ids.get(key)
+        if source_id is None:
+            groups = source.build_depends + source.build_depends_arch
+            if self.indep:
+                groups = groups + source.build_depends_indep
+
+            source_id = len(self.source_groups)
+            self.source_ids[key] = source_id
+            self.source_groups.append(
+                [tuple([(self.intern(dep.name), dep) for dep in group]) for group in groups])
+        return source_id
+
+    def add_architecture(self, repos: list[AptRepository], arch: str) -> ArchGraph:
+        """
+        Compile the packages of the given architecture.
+
+        The first repository and component containing a name
+        provides it.
+        """
+        def entries():
+            for repo in repos:
+                for component in repo.components.values():
+                    for name, archs in component.packages.items():
+                        candidates = archs.get(arch)
+                        if candidates:
+                            yield name, id(candidates[0]), candidates[0]
+
+        return self.compile_architecture(arch, entries())
+
+    def compile_architecture(self,
+                             arch: str,
+                             entries: Iterable[tuple[str, Hashable, Package]],
+                             loader: Callable[[ArchGraph, list[Hashable]], Sequence[Package]] | None = None
+                             ) -> ArchGraph:
+        """
+        Compile the packages of the given architecture.
+
+        The entries are (name, key, package) tuples in priority order,
+        the first entry of a name provides it. The key identifies a
+        unique package. If a 'loader' is given, the packages are only
+        used for compiling the edges, and the loader creates the
+        package sequence of the graph from the keys.
+        """
+        graph = ArchGraph(arch)
+        providers: dict[int, int] = {}
+        provided: dict[int, list[int]] = {}
+        keys: dict[Hashable, int] = {}
+
+        for name, key, package in entries:
+            name_id = self.intern(name)
+            if name_id in providers:
+                continue
+
+            index = keys.get(key)
+            if index is None:
+                index = len(keys)
+                keys[key] = index
+                if loader is None:
+                    graph.index_of[id(package)] = index
+                    graph.packages.append(package)
+
+                self._add_groups(graph, package.depends)
+                graph.depends_offsets.append(len(graph.group_offsets) - 1)
+                graph.package_source.append(self.intern_source(package.source) if package.source else -1)
+
+                provided.setdefault(self.intern(package.package), []).append(index)
+                for provide in package.provides:
+                    provided.setdefault(self.intern(provide.name), []).append(index)
+
+            providers[name_id] = index
+
+        if loader is not None:
+            graph.packages = loader(graph, list(keys.keys()))
+
+        graph.build_offsets = array('i', [len(graph.group_offsets) - 1])
+        for groups in self.source_groups:
+            for group in groups:
+                names = [name_id for name_id, dep in group
+                         if (not dep.architectures and not dep.profiles)
+                         or dependency_applies(dep, arch, self.profiles)]
+                if names:
+                    graph.group_targets.extend(names)
+                    graph.group_offsets.append(len(graph.group_targets))
+            graph.build_offsets.append(len(graph.group_offsets) - 1)
+
+        graph.provider = array('i', [-1]) * len(self.names)
+        for name_id, index in providers.items():
+            graph.provider[name_id] = index
+
+        for name_id in range(len(self.names)):
+            graph.provides_targets.extend(provided.get(name_id, []))
+            graph.provides_offsets.append(len(graph.provides_targets))
+
+        logger.info('Compiled %s', graph)
+
+        self.archs[arch] = graph
+        return graph
+
+    def _add_groups(self, graph: ArchGraph, groups: list[list[Dependency]]):
+        """
+        Append dependency groups to the CSR arrays.
+        """
+        for group in groups:
+            for dep in group:
+                graph.group_targets.append(self.intern(dep.name))
+            graph.group_offsets.append(len(graph.group_targets))
+
+    def group_text(self, arch: str, group: int) -> str:
+        """
+        Format a dependency group, e.g. 'default-mta | mail-transport-agent'.
+        """
+        return ' | '.join([self.names[name_id] for name_id in self.archs[arch].alternatives(group)])
+
+    def name_ids(self, names: list[str], unknown: list[str] | None = None) -> list[int]:
+        """
+        Get the ids of a list of package names.
+
+        The graph is not modified, so that it can be shared by concurrent
+        resolutions. Names which are not part of it are added to 'unknown'.
+        """
+        name_ids = []
+        for name in names:
+            name = strip_arch_qualifier(name)
+            name_id = self.ids.get(name)
+            if name_id is not None:
+                name_ids.append(name_id)
+            elif unknown is not None:
+                unknown.append(name)
+        return name_ids
+
+    def enable_reach_cache(self):
+        """
+        Memoize the direct closure of each expanded package.
+
+        This shares the resolution of common subgraphs between
+        many closures over the same graph, e.g. in batch mode.
+        """
+        if self.reach_cache is None:
+            self.reach_cache = {}
+
+    def _expand(self,
+                graph: ArchGraph,
+                starts: list[int],
+                visited: bytearray,
+                order: list[int],
+                missing: list[str],
+                pending: set[int]):
+        """
+        Follow all dependencies without alternatives from the start packages.
+
+        Groups with alternatives are collected in 'pending'.
+        """
+        provider = graph.provider
+        package_offsets = graph.depends_offsets
+        group_offsets = graph.group_offsets
+        targets = graph.group_targets
+        size = len(provider)
+
+        head = len(order)
+        for index in starts:
+            if not visited[index]:
+                visited[index] = 1
+                order.append(index)
+
+        while head < len(order):
+            index = order[head]
+            head += 1
+            for group in range(package_offsets[index], package_offsets[index + 1]):
+                start = group_offsets[group]
+                if group_offsets[group + 1] - start > 1:
+                    pending.add(group)
+                    continue
+
+                name_id = targets[start]
+                dep = provider[name_id] if name_id < size else -1
+                if dep < 0:
+                    missing.append(self.names[name_id])
+                elif not visited[dep]:
+                    visited[dep] = 1
+                    order.append(dep)
+
+    def reach(self, arch: str, index: int) -> tuple[array, tuple[str, ...]]:
+        """
+        Get the direct closure of a single package, memoized if enabled.
+
+        Returns the package indices and the missing dependencies.
+        """
+        cache = self.reach_cache.setdefault(arch, {}) if self.reach_cache is not None else None
+        if cache is not None and index in cache:
+            return cache[index]
+
+        graph = self.archs[arch]
+        order: list[int] = []
+        missing: list[str] = []
+        self._expand(graph, [index], bytearray(len(graph.packages)), order, missing, set())
+        result = (array('i', order), tuple(missing))
+
+        if cache is not None:
+            cache[index] = result
+        return result
+
+    def _expand_cached(self,
+                       graph: ArchGraph,
+                       starts: list[int],
+                       visited: bytearray,
+                       order: list[int],
+                       missing: list[str],
+                       pending: set[int]):
+        """
+        Same as '_expand', but joins the memoized closures of the start packages.
+        """
+        package_offsets = graph.depends_offsets
+        group_offsets = graph.group_offsets
+        for index in starts:
+            if visited[index]:
+                continue
+
+            reached, reached_missing = self.reach(graph.arch, index)
+            missing.extend(reached_missing)
+            for dep in reached:
+                if visited[dep]:
+                    continue
+                visited[dep] = 1
+                order.append(dep)
+                for group in range(package_offsets[dep], package_offsets[dep + 1]):
+                    if group_offsets[group + 1] - group_offsets[group] > 1:
+                        pending.add(group)
+
+    def _starts(self,
+                graph: ArchGraph,
+                roots: list[int],
+                root_groups: list[int] | None,
+                missing: list[str],
+                pending: set[int]) -> list[int]:
+        """
+        Get the package indices of the roots and of the root groups
+        without alternatives. Root groups with alternatives are
+        collected in 'pending'.
+        """
+        provider = graph.provider
+        group_offsets = graph.group_offsets
+        targets = graph.group_targets
+        size = len(provider)
+
+        starts: list[int] = []
+        for name_id in roots:
+            index = provider[name_id] if name_id < size else -1
+            if index < 0:
+                missing.append(self.names[name_id])
+            else:
+                starts.append(index)
+
+        for group in root_groups or []:
+            if group_offsets[group + 1] - group_offsets[group] > 1:
+                pending.add(group)
+                continue
+
+            name_id = targets[group_offsets[group]]
+            index = provider[name_id] if name_id < size else -1
+            if index < 0:
+                missing.append(self.names[name_id])
+            else:
+                starts.append(index)
+        return starts
+
+    def expand_roots(self,
+                     arch: str,
+                     roots: list[int],
+                     root_groups: list[int] | None = None) -> tuple[array, tuple[str, ...]]:
+        """
+        Follow all dependencies without alternatives from the roots.
+
+        This is the part of a closure which does not depend on other
+        closures, and can be computed independently for shards of
+        the roots, see 'closure'. Returns the package indices and the
+        missing dependencies, unresolvable roots are not included.
+        """
+        graph = self.archs[arch]
+        order: list[int] = []
+        missing: list[str] = []
+        starts = self._starts(graph, roots, root_groups, [], set())
+        self._expand(graph, starts, bytearray(len(graph.packages)), order, missing, set())
+        return array('i', order), tuple(missing)
+
+    def _merge_expanded(self,
+                        graph: ArchGraph,
+                        expanded: Iterable[tuple[Sequence[int], Sequence[str]]],
+                        visited: bytearray,
+                        order: list[int],
+                        missing: list[str],
+                        pending: set[int]):
+        """
+        Same as '_expand', but joins closures computed by 'expand_roots'.
+        """
+        package_offsets = graph.depends_offsets
+        group_offsets = graph.group_offsets
+        for reached, reached_missing in expanded:
+            missing.extend(reached_missing)
+            for dep in reached:
+                if visited[dep]:
+                    continue
+                visited[dep] = 1
+                order.append(dep)
+                for group in range(package_offsets[dep], package_offsets[dep + 1]):
+                    if group_offsets[group + 1] - group_offsets[group] > 1:
+                        pending.add(group)
+
+    def closure(self,
+                arch: str,
+                roots: list[int],
+                visited: bytearray | None = None,
+                root_groups: list[int] | None = None,
+                expanded: Iterable[tuple[Sequence[int], Sequence[str]]] | None = None
+                ) -> tuple[list[int], list[str]]:
+        """
+        Breadth-first runtime closure of the given root name ids
+        and root dependency groups.
+
+        Dependencies without alternatives are followed directly. Groups
+        with alternatives are deferred until the queue is drained, and
+        are then satisfied by an alternative which is already part of
+        the closure, if any, so that no new subgraph is pulled in.
+
+        If 'expanded' is given, it must be the results of 'expand_roots'
+        for shards of the roots, and replaces the first expansion.
+
+        Returns the newly visited package indices in BFS order and
+        the dependencies which could not be resolved. The 'visited' map
+        is updated, which allows extending a previous closure.
+        """
+        graph = self.archs[arch]
+        if visited is None:
+            visited = bytearray(len(graph.packages))
+
+        expand = self._expand if self.reach_cache is None else self._expand_cached
+        provider = graph.provider
+        group_offsets = graph.group_offsets
+        targets = graph.group_targets
+        provides_offsets = graph.provides_offsets
+        provides_targets = graph.provides_targets
+        size = len(provider)
+
+        order: list[int] = []
+        missing: list[str] = []
+        pending: set[int] = set()
+        starts = self._starts(graph, roots, root_groups, missing, pending)
+
+        if expanded is not None:
+            self._merge_expanded(graph, expanded, visited, order, missing, pending)
+            starts = []
+
+        while True:
+            expand(graph, starts, visited, order, missing, pending)
+            if not pending:
+                break
+
+            # settle alternatives in a deterministic order
+            alternatives = sorted(pending)
+            pending.clear()
+            starts = []
+            chosen: set[int] = set()
+            for group in alternatives:
+                names = targets[group_offsets[group]:group_offsets[group + 1]]
+                if any(visited[dep] or dep in chosen
+                       for name_id in names if name_id < size
+                       for dep in provides_targets[provides_offsets[name_id]:provides_offsets[name_id + 1]]):
+                    continue
+
+                dep = next((provider[name_id] for name_id in names
+                            if name_id < size and provider[name_id] >= 0), -1)
+                if dep < 0:
+                    missing.append(self.group_text(arch, group))
+                else:
+                    chosen.add(dep)
+                    starts.append(dep)
+
+        return order, missing
+
+
+def strongly_connected_components(adjacency: list[list[int]]) -> list[int]:
+    """
+    Map each node to its strongly connected component (iterative Tarjan).
+
+    The components are numbered in reverse topological order.
+    """
+    count = len(adjacency)
+    index = [-1] * count
+    low = [0] * count
+    on_stack = bytearray(count)
+    component = [-1] * count
+    stack: list[int] = []
+    counter = 0
+    components = 0
+
+    for root in range(count):
+        if index[root] >= 0:
+            continue
+
+        work = [(root, 0)]
+        while work:
+            node, child = work[-1]
+            if child == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = 1
+
+            if child < len(adjacency[node]):
+                work[-1] = (node, child + 1)
+                dep = adjacency[node][child]
+                if index[dep] < 0:
+                    work.append((dep, 0))
+                elif on_stack[dep]:
+                    low[node] = min(low[node], index[dep])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component[member] = components
+                    if member == node:
+                        break
+                components += 1
+
+    return component
+
+
+def condense(adjacency: list[list[int]]) -> tuple[list[int], list[list[int]]]:
+    """
+    Condense dependency cycles into single nodes.
+
+    Returns the component of each node and the adjacency of the
+    resulting DAG, whose nodes are in reverse topological order.
+    """
+    component = strongly_connected_components(adjacency)
+    dag: list[list[int]] = [[] for _ in range(max(component, default=-1) + 1)]
+    edges: set[tuple[int, int]] = set()
+    for node, deps in enumerate(adjacency):
+        source = component[node]
+        for dep in deps:
+            target = component[dep]
+            if target != source and (source, target) not in edges:
+                edges.add((source, target))
+                dag[source].append(target)
+    return component, dag
+
+
+def transitive_reduction(dag: list[list[int]]) -> list[list[int]]:
+    """
+    Remove all edges of a DAG which are implied by longer paths.
+
+    The nodes must be in reverse topological order, i.e. every edge
+    points to a lower node, as returned by 'condense'. Reachability
+    is tracked as integer bitsets.
+    """
+    reachable = [0] * len(dag)
+    reduced: list[list[int]] = []
+    for node, deps in enumerate(dag):
+        # a dependency reachable over another one has a lower number
+        covered = 0
+        keep = []
+        for dep in sorted(deps, reverse=True):
+            if not (covered >> dep) & 1:
+                keep.append(dep)
+            covered |= reachable[dep] | (1 << dep)
+        reachable[node] = covered
+        reduced.append(keep)
+    return reduced
+
+
+def build_graph(repos: list[AptRepository],
+                architectures: list[str],
+                profiles: list[str] | None = None,
+                indep: bool = True) -> DependencyGraph:
+    """
+    Compile the dependency graph for all given architectures.
+    """
+    graph = DependencyGraph(profiles, indep)
+    for arch in architectures:
+        graph.add_architecture(repos, arch)
+    return graph
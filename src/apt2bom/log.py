@@ -1,50 +1,106 @@
 """
 Logging configuration.
+
+Log records are passed through a queue to a background thread, which
+formats and writes them, so that logging does not block the resolver.
+Repeated messages, e.g. the same missing package reached again and
+again, are dropped before they are queued, and summarized at exit.
+Warnings and errors are only dropped if they are exact repeats.
+
+The listener thread is not inherited by forked worker processes,
+which start their own listener, see 'worker_logging'.
 """
+import atexit
 import logging
-import requests # needed for urllib log level config
-from logging.config import dictConfig
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 
 log_level = logging.DEBUG
 
+_listener: QueueListener = None
+_queue_handler: QueueHandler = None
+_repeat_filter: 'RepeatFilter' = None
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Drop repeated log records.
+
+    A record with the same message and arguments as an earlier one is
+    dropped. Debug records with the same message template are dropped
+    after 'limit' records. Info records are progress messages, and
+    always kept.
+    """
+    def __init__(self, limit: int = 20):
+        super().__init__()
+        self.limit: int = limit
+        self.seen: set[tuple] = set()
+        self.templates: dict[tuple[str, str], int] = {}
+        self.suppressed: dict[tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno == logging.INFO:
+            return True
 
-def config_logger(level=logging.DEBUG, logfile='apt2bom.log'):
+        template = (record.name, str(record.msg))
+        try:
+            key = (template, record.args)
+            duplicate = key in self.seen
+        except TypeError:
+            # unhashable arguments are not deduplicated
+            key, duplicate = None, False
+
+        count = self.templates.get(template, 0)
+        if duplicate or (record.levelno < logging.INFO and count >= self.limit):
+            self.suppressed[template] = self.suppressed.get(template, 0) + 1
+            return False
+
+        if key is not None:
+            self.seen.add(key)
+        self.templates[template] = count + 1
+        return True
+
+    def summary(self) -> list[str]:
+        return [f'Suppressed {count} repeated messages of {name}: {msg}'
+                for (name, msg), count in sorted(self.suppressed.items(), key=lambda s: -s[1])]
+
+
+def config_logger(level=logging.DEBUG, logfile='apt2bom.log', repeat_limit: int = 20):
     """
     Config Python logging.
+
+    The stream and file handlers are run by a queue listener thread.
+    Per message template, at most 'repeat_limit' debug records are logged.
     """
-    global log_level
-
-    logging_config = dict(
-        version = 1,
-        formatters = {
-            'f': {'format':
-                '%(asctime)s %(levelname)-15s %(name)-8s %(message)s'}
-            },
-        handlers = {
-            'h': {'class': 'logging.StreamHandler',
-                'formatter': 'f',
-                'level': level},
-            'f': {
-                'level': level,
-                'formatter': 'f',
-                'class': 'logging.FileHandler',
-                'filename': logfile,
-                'mode': 'a'}
-            },
-        root = {
-            'handlers': ['h', 'f'],
-            'level': level,
-            },
-    )
-    dictConfig(logging_config)
+    global log_level, _listener, _queue_handler, _repeat_filter
+
+    formatter = logging.Formatter('%(asctime)s %(levelname)-15s %(name)-8s %(message)s')
+    handlers: list[logging.Handler] = [logging.StreamHandler(), logging.FileHandler(logfile, mode='a')]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(level)
+
+    stop_logging()
+    _listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+    _listener.start()
+
+    _repeat_filter = RepeatFilter(repeat_limit)
+    _queue_handler = QueueHandler(_listener.queue)
+    _queue_handler.addFilter(_repeat_filter)
 
     log_level = level
 
     root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
     root.setLevel(level)
     root.log(level, 'Using log level: %s', level)
 
+    # configured by name, requests and urllib3 are imported later if needed
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
     loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict]
     for logger in loggers:
         if 'urllib' in logger.name:
@@ -53,3 +109,49 @@ def config_logger(level=logging.DEBUG, logfile='apt2bom.log'):
 
         logger.setLevel(level)
         logger.log(level, 'Using log level: %s', level)
+
+
+def worker_logging():
+    """
+    Config logging in a forked worker process.
+
+    The records queued by a worker would never be written by the
+    listener thread of the parent. The worker starts a listener for
+    the inherited handlers, which is stopped when the worker exits.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    from multiprocessing.util import Finalize
+
+    _listener = QueueListener(queue.SimpleQueue(), *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    _queue_handler.queue = _listener.queue
+    # the suppressed records of the parent are summarized by the parent
+    _repeat_filter.suppressed = {}
+    Finalize(None, stop_logging, exitpriority=100)
+
+
+def stop_logging():
+    """
+    Log the summary of suppressed messages, and flush all records.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    handlers = _listener.handlers
+    _listener.stop()
+    _listener = None
+
+    if _repeat_filter:
+        # written after all queued records, and not filtered itself
+        logger = logging.getLogger('log')
+        for line in _repeat_filter.summary():
+            record = logger.makeRecord(logger.name, logging.WARNING, __file__, 0, line, None, None)
+            for handler in handlers:
+                if handler.level <= logging.WARNING:
+                    handler.handle(record)
+
+atexit.register(stop_logging)
@@ -1,11 +1,12 @@
 """
 Write resolved data.
 """
+import hashlib
 import json
 import os
 import logging
-from .apt_data import JsonSerializer
-from .resolve_lists import PackageLists
+from .apt_data import JsonSerializer, Package, Source
+from .resolve_lists import Overlay, PackageLists
 
 
 logger = logging.getLogger('output')
@@ -29,34 +30,180 @@ def write_repos(config, repos):
         json.dump(repos, f, indent=4, cls=JsonSerializer)
 
 
+def package_data(package: Package, overlay: Overlay) -> dict:
+    """
+    Data of a resolved package, with the type from its overlay.
+    """
+    data = package.to_data()
+    data['pkg_type'] = overlay.pkg_type
+    return data
+
+
+def normalize_packages(arch_packages: dict[str, dict[str, Package]],
+                       overlays: dict[str, dict[str, Overlay]]) -> dict:
+    """
+    Convert package lists to tables of repositories, components,
+    sources and packages, which refer to each other by ID.
+    """
+    ids: dict[int, int] = {}
+    tables: dict[str, list] = {
+        'repositories': [],
+        'components': [],
+        'sources': [],
+        'packages': [],
+    }
+
+    def add(table: str, obj, data: dict) -> int:
+        if id(obj) not in ids:
+            ids[id(obj)] = len(tables[table])
+            data['id'] = ids[id(obj)]
+            tables[table].append(data)
+        return ids[id(obj)]
+
+    def add_component(obj: Package | Source) -> tuple[int, int]:
+        repository = add('repositories', obj.repository, obj.repository.to_data_non_recursive())
+        data = obj.component.to_data_non_recursive()
+        data['repository'] = repository
+        return repository, add('components', obj.component, data)
+
+    lists: dict[str, list[int]] = {}
+    for arch in arch_packages.keys():
+        lists[arch] = []
+        for name in arch_packages[arch].keys():
+            package = arch_packages[arch][name]
+            if id(package) not in ids:
+                data = package.__dict__.copy()
+                data['pkg_type'] = overlays[arch][name].pkg_type
+                data['repository'], data['component'] = add_component(package)
+                if package.source:
+                    source = package.source.to_data()
+                    source['repository'], source['component'] = add_component(package.source)
+                    data['source'] = add('sources', package.source, source)
+                add('packages', package, data)
+            lists[arch].append(ids[id(package)])
+
+    tables['lists'] = lists
+    return tables
+
+
+def write_package_list(config, file: str, arch_packages: dict[str, dict[str, Package]],
+                       overlays: dict[str, dict[str, Overlay]]):
+    """
+    Write one resolved package list in the configured JSON format.
+
+    The 'full' format embeds repository, component and source into each
+    package, the 'normalized' format refers to them by ID.
+    """
+    if config['output'].get('json_format', 'full') == 'normalized':
+        data = normalize_packages(arch_packages, overlays)
+    else:
+        data = [{name: package_data(package, overlays[arch][name]) for name, package in packages.items()}
+                for arch, packages in arch_packages.items()]
+
+    file = os.path.join(config['output']['directory'], file)
+    with open(file, 'w') as f:
+        json.dump(data, f, indent=4, cls=JsonSerializer)
+
+
 def write_package_lists(config, lists: PackageLists):
     """
     Write resolve package lists.
     """
     create_out_dir(config)
     
-    packages = [lists.ecu_packages[key] for key in lists.ecu_packages.keys()]
-    file = os.path.join(config['output']['directory'], config['output']['ecu_json'])
-    with open(file, 'w') as f:
-        json.dump(packages, f, indent=4, cls=JsonSerializer)
-
-    packages = [lists.sdk_packages[key] for key in lists.sdk_packages.keys()]
-    file = os.path.join(config['output']['directory'], config['output']['sdk_json'])
-    with open(file, 'w') as f:
-        json.dump(packages, f, indent=4, cls=JsonSerializer)
+    write_package_list(config, config['output']['ecu_json'], lists.ecu_packages, lists.ecu_overlays)
+    write_package_list(config, config['output']['sdk_json'], lists.sdk_packages, lists.sdk_overlays)
 
     file = os.path.join(config['output']['directory'], config['output']['missing'])
     with open(file, 'w') as f:
         s = ""
         for a in lists.missing_packages.keys():
-            for p in lists.missing_packages[a]:
-                s += f'{p} ({a})\n'
+            suggestions = lists.suggestions.get(a, {})
+            for p in sorted(lists.missing_packages[a]):
+                if suggestions.get(p):
+                    s += f'{p} ({a}), did you mean: {", ".join(suggestions[p])}\n'
+                else:
+                    s += f'{p} ({a})\n'
         f.write(s)
     
     file = os.path.join(config['output']['directory'], config['output']['broken'])
     with open(file, 'w') as f:
         s = ""
         for a in lists.broken_packages.keys():
-            for p in lists.broken_packages[a]:
+            for p in sorted(lists.broken_packages[a]):
                 s += f'{p} ({a})\n'
         f.write(s)
+
+
+def write_metrics(config, lists: PackageLists):
+    """
+    Write the sizes of the resolved package lists,
+    and the missing packages with suggestions.
+    """
+    metrics = {}
+    for arch in lists.ecu_packages.keys():
+        suggestions = lists.suggestions.get(arch, {})
+        metrics[arch] = {
+            'ecu_packages': len(lists.ecu_packages[arch]),
+            'sdk_packages': len(lists.sdk_packages[arch]),
+            'missing_packages': len(lists.missing_packages[arch]),
+            'broken_packages': len(lists.broken_packages[arch]),
+            'missing': {name: suggestions.get(name, []) for name in sorted(lists.missing_packages[arch])},
+        }
+
+    file = os.path.join(config['output']['directory'], config['output']['metrics'])
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=4)
+
+
+def digest(data) -> str:
+    """
+    Hash data using a canonical JSON serialization.
+    """
+    text = json.dumps(data, sort_keys=True, separators=(',', ':'), cls=JsonSerializer)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def section_fingerprints(lists: PackageLists) -> dict[str, str]:
+    """
+    Content fingerprints of the sections of resolved package lists.
+
+    A package is hashed with its metadata and its type in the list. The
+    repositories, components and sources are shared by many packages,
+    and hashed only once.
+    """
+    shared: dict[int, str] = {}
+
+    def shared_digest(obj) -> str | None:
+        if obj is None:
+            return None
+        if id(obj) not in shared:
+            data = obj.to_data() if isinstance(obj, Source) else obj.to_data_non_recursive()
+            shared[id(obj)] = digest(data)
+        return shared[id(obj)]
+
+    def package_digest(package: Package, overlay: Overlay) -> str:
+        data = package.__dict__.copy()
+        data['pkg_type'] = overlay.pkg_type
+        data['repository'] = shared_digest(package.repository)
+        data['component'] = shared_digest(package.component)
+        data['source'] = shared_digest(package.source)
+        return digest(data)
+
+    def sorted_sets(arch_sets: dict[str, set[str]]) -> dict[str, list[str]]:
+        return {arch: sorted(names) for arch, names in arch_sets.items()}
+
+    sections = {
+        'ecu_packages': {arch: {name: package_digest(package, lists.ecu_overlays[arch][name])
+                                for name, package in packages.items()}
+                         for arch, packages in lists.ecu_packages.items()},
+        'sdk_packages': {arch: {name: package_digest(package, lists.sdk_overlays[arch][name])
+                                for name, package in packages.items()}
+                         for arch, packages in lists.sdk_packages.items()},
+        'missing_packages': sorted_sets(lists.missing_packages),
+        'broken_packages': sorted_sets(lists.broken_packages),
+        'ecu_roots': sorted_sets(lists.ecu_roots),
+        'sdk_roots': sorted_sets(lists.sdk_roots),
+        'suggestions': lists.suggestions,
+    }
+    return {section: digest(data) for section, data in sections.items()}
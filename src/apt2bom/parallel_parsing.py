@@ -0,0 +1,257 @@
+"""
+Parsing of APT indices in worker processes.
+
+Parsing the indices is CPU-bound, and the GIL lets only one thread
+parse at a time. The indices are downloaded and decompressed by
+threads, and split into chunks at stanza boundaries. The chunks are
+parsed by a pool of worker processes, which send back compact records
+of plain values instead of pickled object graphs. The main process
+rebuilds the packages and sources in index order, so that the result
+is identical to parsing the indices one after the other.
+"""
+import gc
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from .apt_data import AptRepository, Component, Dependency, Index, Package, Source, SourceFile
+from .apt_download import MirrorSet, read_gz_url
+from .apt_parsing import (add_package, iter_packages, iter_sources, package_indices, read_release,
+                          release_options, repository_options, scan_components, source_indices)
+from .log import worker_logging
+
+
+logger = logging.getLogger('parallel_parsing')
+
+# minimal lines of a chunk, smaller indices are parsed as a whole
+chunk_lines = 20000
+
+# attributes set by the main process, not part of the records; these are
+# the last attributes of the classes, so that rebuilding keeps the order
+linked_attributes = ('source', 'repository', 'component')
+
+package_fields = [name for name in Package(None, None).__dict__ if name not in linked_attributes]
+source_fields = [name for name in Source(None, None).__dict__ if name not in linked_attributes]
+file_attributes = list(SourceFile().__dict__)
+
+dependency_fields = ('depends', 'build_depends', 'build_depends_indep', 'build_depends_arch')
+
+
+def groups_record(groups: list[list[Dependency]], interned: dict[tuple, tuple]) -> tuple:
+    """
+    Convert dependency groups to tuples.
+
+    Equal dependencies and groups are the same tuple, which is pickled
+    only once per chunk.
+    """
+    record = []
+    for group in groups:
+        group_record = []
+        for dep in group:
+            dep_record = (dep.name, dep.arch, dep.relation, dep.version,
+                          tuple(dep.architectures), tuple(tuple(profiles) for profiles in dep.profiles))
+            group_record.append(interned.setdefault(dep_record, dep_record))
+        group_record = tuple(group_record)
+        record.append(interned.setdefault(group_record, group_record))
+    return tuple(record)
+
+
+def make_groups(record: tuple, groups: dict[tuple, list[Dependency]]) -> list[list[Dependency]]:
+    """
+    Convert dependency group tuples to groups.
+
+    Dependencies are never modified after parsing, so equal groups
+    share one list of dependencies.
+    """
+    result = []
+    for group_record in record:
+        group = groups.get(group_record)
+        if group is None:
+            group = []
+            for name, arch, relation, version, architectures, profiles in group_record:
+                dep = Dependency.__new__(Dependency)
+                dep.__dict__ = {
+                    'name': name,
+                    'arch': arch,
+                    'relation': relation,
+                    'version': version,
+                    'architectures': list(architectures) if architectures else [],
+                    'profiles': [list(values) for values in profiles] if profiles else [],
+                }
+                group.append(dep)
+            groups[group_record] = group
+        result.append(group)
+    return result
+
+
+def package_record(package: Package, interned: dict[tuple, tuple]) -> tuple:
+    """
+    Convert a package to a tuple of plain values.
+    """
+    data = package.__dict__
+    values = []
+    for name in package_fields:
+        value = data[name]
+        if name == 'depends':
+            value = groups_record(value, interned)
+        elif name == 'provides':
+            value = groups_record([value], interned)[0]
+        values.append(value)
+    return tuple(values)
+
+
+def make_package(record: tuple, repo: AptRepository, comp: Component,
+                 groups: dict[tuple, list[Dependency]]) -> Package:
+    package = Package.__new__(Package)
+    package.__dict__ = data = dict(zip(package_fields, record))
+    data['depends'] = make_groups(data['depends'], groups)
+    data['provides'] = list(make_groups((data['provides'],), groups)[0])
+    data.update(source=None, repository=repo, component=comp)
+    return package
+
+
+def source_record(source: Source, interned: dict[tuple, tuple]) -> tuple:
+    """
+    Convert a source to a tuple of plain values.
+    """
+    data = source.__dict__
+    values = []
+    for name in source_fields:
+        value = data[name]
+        if name in dependency_fields:
+            value = groups_record(value, interned)
+        elif name == 'files':
+            value = [(filename, tuple(file.__dict__.values())) for filename, file in value.items()]
+        values.append(value)
+    return tuple(values)
+
+
+def make_source(record: tuple, repo: AptRepository, comp: Component,
+                groups: dict[tuple, list[Dependency]]) -> Source:
+    source = Source.__new__(Source)
+    source.__dict__ = data = dict(zip(source_fields, record))
+    for name in dependency_fields[1:]:
+        data[name] = make_groups(data[name], groups)
+    files = {}
+    for filename, values in data['files']:
+        file = SourceFile.__new__(SourceFile)
+        file.__dict__ = dict(zip(file_attributes, values))
+        files[filename] = file
+    data['files'] = files
+    data.update(repository=repo, component=comp)
+    return source
+
+
+def parse_chunk(kind: str, text: str, base_url: str, fields: set[str] | None) -> list[tuple]:
+    """
+    Parse a chunk of an index in a worker process.
+    """
+    lines = text.split('\n')
+    interned: dict[tuple, tuple] = {}
+    # the records are not cyclic, collecting only slows down the allocations
+    gc.disable()
+    try:
+        if kind == 'packages':
+            return [package_record(package, interned)
+                    for package in iter_packages(lines, base_url, None, None, fields)]
+        return [source_record(source, interned)
+                for source in iter_sources(lines, base_url, None, None, fields)]
+    finally:
+        gc.enable()
+
+
+def split_chunks(lines: list[str], count: int) -> list[str]:
+    """
+    Split the lines of an index into chunks at stanza boundaries.
+    """
+    chunks = []
+    size = len(lines) // count
+    start = 0
+    for _ in range(count - 1):
+        end = max(start, start + size)
+        # stanzas are separated by empty lines
+        while end < len(lines) and lines[end].strip() != '':
+            end += 1
+        chunks.append('\n'.join(lines[start:end]))
+        start = end
+    chunks.append('\n'.join(lines[start:]))
+    return chunks
+
+
+def parse_indices(jobs: list[tuple[str, AptRepository, Component, Index]],
+                  fields: set[str] | None, processes: int,
+                  mirrors: dict[str, MirrorSet] | None = None) -> dict[tuple[int, str], dict]:
+    """
+    Parse the indices of the jobs, using 'processes' workers.
+
+    A job is the kind, 'packages' or 'sources', the repository, the
+    component and the index. Returns the parsed packages or sources
+    by component ID and index URL, see 'scan_packages'.
+    """
+    parsed: dict[tuple[int, str], dict] = {}
+    groups: dict[tuple, list[Dependency]] = {}
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=worker_logging) as pool:
+        # fork the workers before the download threads are started
+        pool.submit(len, '').result()
+
+        with ThreadPoolExecutor(processes) as downloads:
+            fetched = [downloads.submit(read_gz_url, index.url, mirrors) for _, _, _, index in jobs]
+
+            chunks: list[list[Future]] = []
+            for (kind, repo, _, index), future in zip(jobs, fetched):
+                lines = future.result()
+                count = max(1, min(processes, len(lines) // chunk_lines))
+                logger.debug('Parsing %s in %d chunks', index, count)
+                chunks.append([pool.submit(parse_chunk, kind, text, repo.url, fields)
+                               for text in split_chunks(lines, count)])
+                del lines
+
+        # rebuilding allocates millions of objects, without creating garbage
+        gc.disable()
+        try:
+            for (kind, repo, comp, index), futures in zip(jobs, chunks):
+                result = {}
+                for future in futures:
+                    for record in future.result():
+                        if kind == 'packages':
+                            add_package(result, make_package(record, repo, comp, groups))
+                        else:
+                            source = make_source(record, repo, comp, groups)
+                            result[source.package] = source
+                parsed[(id(comp), index.url)] = result
+        finally:
+            gc.enable()
+    return parsed
+
+
+def scan_repositories_parallel(config, fields: set[str] | None, processes: int,
+                               mirrors: dict[str, MirrorSet] | None = None) -> list[AptRepository]:
+    """
+    Read all packages and sources from all given APT repositories,
+    parsing the indices in worker processes.
+    """
+    repos: list[tuple[AptRepository, list[str], list[str]]] = []
+    jobs: list[tuple[str, AptRepository, Component, Index]] = []
+    for repository in config['repositories']:
+        architectures, components = repository_options(repository)
+        logger.info('Parsing repository %s %s %s %s',
+                    repository['url'], repository['distribution'], architectures, components)
+
+        repo = read_release(repository['url'], repository['distribution'], components, mirrors)
+        repos.append((repo, architectures, components))
+
+        used_architectures, used_components = release_options(repo, architectures, components)
+        for component in used_components:
+            comp = repo.components.get(component)
+            if comp is None:
+                continue
+            for arch in used_architectures:
+                jobs.extend(('packages', repo, comp, index) for index in package_indices(comp, arch))
+            jobs.extend(('sources', repo, comp, index) for index in source_indices(comp))
+
+    logger.info('Parsing %d indices using %d processes...', len(jobs), processes)
+    parsed = parse_indices(jobs, fields, processes, mirrors)
+
+    for repo, architectures, components in repos:
+        scan_components(repo, architectures, components, fields, parsed, mirrors)
+    return [repo for repo, _, _ in repos]
@@ -0,0 +1,355 @@
+"""
+Partitioned resolution of large root package sets.
+
+The roots of a closure are split into shards. For each shard, a
+worker follows all dependencies without alternatives, which does not
+depend on the other shards, see 'DependencyGraph.expand_roots'. The
+coordinator merges the partial closures and settles the alternatives,
+so that the result is identical to a single closure of all roots.
+
+The shards are exchanged using a file-based work queue in a shared
+directory:
+
+- tasks/<id>.json: a shard waiting for a worker,
+- claimed/<id>.json: a shard claimed by a worker, using an atomic rename,
+- results/<id>.json: the partial closure of a shard,
+- stop: tells the workers on other hosts to exit,
+- stop-<coordinator>: tells the local workers of a coordinator to exit.
+
+The task ids start with the id of the coordinator, which removes its
+files after each closure and when it stops. Files older than 'timeout'
+are left by crashed coordinators, and removed when a coordinator starts.
+
+Local worker processes are forked from the coordinator and share its
+graph. Workers on other hosts load the same metadata and check the
+graph fingerprint of each task before working on it.
+
+A claim not finished within 'claim_timeout', e.g. of a crashed worker,
+is moved back to the tasks. Shards without result after 'timeout' are
+withdrawn and expanded by the coordinator itself, so that a run never
+waits forever, e.g. with 0 local workers and no other hosts.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from array import array
+from .graph import DependencyGraph
+from .log import worker_logging
+
+
+logger = logging.getLogger('partition')
+
+poll_interval = 0.05
+
+
+def graph_fingerprint(graph: DependencyGraph) -> str:
+    """
+    Hash the compiled edges of a graph, equal graphs use equal indices.
+    """
+    digest = hashlib.sha256()
+    for arch in sorted(graph.archs.keys()):
+        arch_graph = graph.archs[arch]
+        digest.update(arch.encode())
+        for values in (arch_graph.provider, arch_graph.depends_offsets,
+                       arch_graph.group_offsets, arch_graph.group_targets):
+            digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def write_json(file: str, data: dict):
+    """
+    Write a JSON file which becomes visible atomically.
+    """
+    with open(file + '.part', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(file + '.part', file)
+
+
+class WorkQueue:
+    """
+    File-based work queue in a shared directory.
+    """
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        for folder in ('tasks', 'claimed', 'results'):
+            os.makedirs(os.path.join(directory, folder), exist_ok=True)
+
+    def _file(self, folder: str, task_id: str) -> str:
+        return os.path.join(self.directory, folder, f'{task_id}.json')
+
+    def put(self, task: dict) -> str:
+        task_id = task['id']
+        write_json(self._file('tasks', task_id), task)
+        return task_id
+
+    def claim(self) -> dict | None:
+        """
+        Claim the next task, the rename only succeeds for one worker.
+        """
+        for name in sorted(os.listdir(os.path.join(self.directory, 'tasks'))):
+            if not name.endswith('.json'):
+                continue
+            task_id = name[:-5]
+            claimed = self._file('claimed', task_id)
+            try:
+                os.rename(self._file('tasks', task_id), claimed)
+                # the age of the claim, the rename keeps the time of the task
+                os.utime(claimed)
+                with open(claimed, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                # taken by another worker, or requeued meanwhile
+                continue
+        return None
+
+    def done(self, task_id: str, result: dict):
+        write_json(self._file('results', task_id), result)
+        try:
+            os.remove(self._file('claimed', task_id))
+        except FileNotFoundError:
+            # the claim was requeued or withdrawn meanwhile
+            pass
+
+    def requeue_stale(self, task_ids: list[str], max_age: float) -> list[str]:
+        """
+        Move claims older than 'max_age' seconds back to the tasks.
+        """
+        requeued = []
+        now = time.time()
+        for task_id in task_ids:
+            claimed = self._file('claimed', task_id)
+            try:
+                if now - os.path.getmtime(claimed) > max_age:
+                    os.rename(claimed, self._file('tasks', task_id))
+                    requeued.append(task_id)
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def withdraw(self, task_id: str):
+        """
+        Remove a task, whether waiting or claimed.
+        """
+        for folder in ('tasks', 'claimed'):
+            try:
+                os.remove(self._file(folder, task_id))
+            except FileNotFoundError:
+                pass
+
+    def result(self, task_id: str) -> dict | None:
+        file = self._file('results', task_id)
+        if not os.path.exists(file):
+            return None
+        with open(file, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        os.remove(file)
+        return result
+
+    def purge(self, prefix: str = '', max_age: float | None = None):
+        """
+        Remove the tasks, claims and results with ids starting with
+        'prefix', if given only those older than 'max_age' seconds.
+        """
+        now = time.time()
+        for folder in ('tasks', 'claimed', 'results'):
+            path = os.path.join(self.directory, folder)
+            for name in os.listdir(path):
+                if not name.startswith(prefix):
+                    continue
+                file = os.path.join(path, name)
+                try:
+                    if max_age is None or now - os.path.getmtime(file) > max_age:
+                        os.remove(file)
+                except FileNotFoundError:
+                    continue
+
+    def stop(self, name: str = 'stop'):
+        with open(os.path.join(self.directory, name), 'w'):
+            pass
+
+    def stopped(self, name: str = 'stop') -> bool:
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def reset(self, name: str = 'stop'):
+        if self.stopped(name):
+            os.remove(os.path.join(self.directory, name))
+
+
+def run_task(graph: DependencyGraph, fingerprint: str, task: dict) -> dict:
+    """
+    Compute the partial closure of a shard.
+    """
+    if task['fingerprint'] != fingerprint:
+        return {'error': 'graph fingerprint mismatch'}
+
+    reached, missing = graph.expand_roots(
+        task['arch'], graph.name_ids(task['roots']), task['root_groups'])
+    return {'packages': reached.tolist(), 'missing': list(missing)}
+
+
+def work(directory: str, graph: DependencyGraph, idle_timeout: float | None = None, stop: str = 'stop'):
+    """
+    Work on the tasks of a queue until the 'stop' file exists.
+    """
+    queue = WorkQueue(directory)
+    fingerprint = graph_fingerprint(graph)
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    logger.info('Worker %s waiting for tasks in %s ...', worker, directory)
+
+    idle_since = time.monotonic()
+    while not queue.stopped(stop):
+        task = queue.claim()
+        if task is None:
+            if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logger.debug('Worker %s: task %s', worker, task['id'])
+        try:
+            result = run_task(graph, fingerprint, task)
+        except Exception as e:
+            result = {'error': str(e)}
+        result['worker'] = worker
+        queue.done(task['id'], result)
+        idle_since = time.monotonic()
+
+
+def forked_work(directory: str, graph: DependencyGraph, stop: str):
+    """
+    Work on the tasks of a queue in a forked local worker process.
+    """
+    worker_logging()
+    work(directory, graph, stop=stop)
+
+
+class Partitioner:
+    """
+    Distribute the expansion of closures over workers.
+
+    'shards' is the number of shards per closure, 'workers' the number
+    of local worker processes. With 0 local workers, the shards are
+    only resolved by workers on other hosts sharing the directory.
+    Claims older than 'claim_timeout' seconds are requeued, shards
+    without result after 'timeout' seconds are expanded locally.
+    """
+    def __init__(self, graph: DependencyGraph, directory: str, shards: int = 8, workers: int = 4,
+                 timeout: float = 300.0, claim_timeout: float = 60.0):
+        self.graph: DependencyGraph = graph
+        self.queue: WorkQueue = WorkQueue(directory)
+        self.shards: int = max(1, shards)
+        self.workers: int = workers
+        self.timeout: float = timeout
+        self.claim_timeout: float = claim_timeout
+        self.fingerprint: str = graph_fingerprint(graph)
+        self.id: str = uuid.uuid4().hex
+        self._stop: str = f'stop-{self.id}'
+        self._closures: itertools.count = itertools.count()
+        self._processes: list[multiprocessing.Process] = []
+
+    def __enter__(self) -> 'Partitioner':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Fork the local worker processes, which inherit the graph.
+        """
+        self.queue.purge(max_age=self.timeout)
+        context = multiprocessing.get_context('fork')
+        for _ in range(self.workers):
+            process = context.Process(target=forked_work, args=(self.queue.directory, self.graph, self._stop),
+                                      daemon=True)
+            process.start()
+            self._processes.append(process)
+        logger.info('Started %d local workers on %s', len(self._processes), self.queue.directory)
+
+    def stop(self):
+        """
+        Stop the local worker processes, the other workers keep running.
+        """
+        self.queue.stop(self._stop)
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        self.queue.reset(self._stop)
+        # late results of shards expanded locally
+        self.queue.purge(self.id)
+
+    def expand(self, arch: str, roots: list[str],
+               root_groups: list[int] | None = None) -> list[tuple[array, list[str]]]:
+        """
+        Expand the shards of the roots on the workers.
+
+        Returns the partial closures in shard order.
+        """
+        root_groups = root_groups or []
+        count = min(self.shards, max(1, len(roots) + len(root_groups)))
+        prefix = f'{self.id}-{next(self._closures):04d}'
+
+        tasks: dict[str, dict] = {}
+        for shard in range(count):
+            task = {
+                'id': f'{prefix}-{shard:04d}',
+                'fingerprint': self.fingerprint,
+                'arch': arch,
+                'roots': roots[shard::count],
+                'root_groups': root_groups[shard::count],
+            }
+            tasks[self.queue.put(task)] = task
+        task_ids = list(tasks.keys())
+
+        try:
+            results = self._wait(arch, tasks)
+        finally:
+            self.queue.purge(prefix + '-')
+
+        logger.debug('Expanded %d shards of %d roots (%s)', count, len(roots) + len(root_groups), arch)
+        return [(array('i', results[task_id]['packages']), results[task_id]['missing'])
+                for task_id in task_ids]
+
+    def _wait(self, arch: str, tasks: dict[str, dict]) -> dict[str, dict]:
+        """
+        Collect the results of the tasks, expanding the shards locally
+        which have no result after the timeout.
+        """
+        task_ids = list(tasks.keys())
+        results: dict[str, dict] = {}
+        deadline = time.monotonic() + self.timeout
+        while len(results) < len(task_ids):
+            for task_id in task_ids:
+                if task_id not in results:
+                    result = self.queue.result(task_id)
+                    if result is not None:
+                        if 'error' in result:
+                            raise RuntimeError(f'Task {task_id} failed on {result["worker"]}: {result["error"]}')
+                        results[task_id] = result
+            if len(results) == len(task_ids):
+                break
+
+            pending = [task_id for task_id in task_ids if task_id not in results]
+            if time.monotonic() > deadline:
+                logger.warning('No result for %d shards after %g s, expanding them locally.',
+                               len(pending), self.timeout)
+                for task_id in pending:
+                    self.queue.withdraw(task_id)
+                    task = tasks[task_id]
+                    reached, missing = self.graph.expand_roots(
+                        arch, self.graph.name_ids(task['roots']), task['root_groups'])
+                    results[task_id] = {'packages': reached, 'missing': list(missing)}
+                break
+
+            for task_id in self.queue.requeue_stale(pending, self.claim_timeout):
+                logger.warning('Requeued task %s, claimed for more than %g s.', task_id, self.claim_timeout)
+            time.sleep(poll_interval)
+        return results
+
@@ -0,0 +1,180 @@
+"""
+Registry of the output plugins.
+
+A plugin is a writer function 'write(config, lists)', referenced by
+module and function name, and only imported if it is enabled by the
+config. This keeps heavy dependencies like openpyxl and requests out
+of runs which do not need them.
+
+With 'output.fingerprints', a plugin is skipped if the fingerprints of
+the package list sections it reads, and the config, did not change
+since its last run, and the files it wrote still exist.
+"""
+import importlib
+import json
+import logging
+import os
+from typing import Callable
+
+
+logger = logging.getLogger('plugins')
+
+
+class OutputPlugin:
+    """
+    A lazily loaded writer for resolved package lists.
+    """
+    def __init__(self, name: str, target: str, enabled: Callable[[dict], bool], description: str,
+                 sections: tuple[str, ...] | None):
+        self.name: str = name
+        self.target: str = target
+        self.enabled: Callable[[dict], bool] = enabled
+        self.description: str = description
+        self.sections: tuple[str, ...] | None = sections
+
+    def __repr__(self) -> str:
+        return f'OutputPlugin({self.name}, {self.target})'
+
+    def load(self) -> Callable:
+        module, function = self.target.split(':')
+        return getattr(importlib.import_module(module, __package__), function)
+
+
+# in order of execution
+output_plugins: dict[str, OutputPlugin] = {}
+
+
+# sections of the package lists, see 'section_fingerprints'
+all_sections = ('ecu_packages', 'sdk_packages', 'missing_packages', 'broken_packages',
+                'ecu_roots', 'sdk_roots', 'suggestions')
+package_sections = ('ecu_packages', 'sdk_packages')
+
+
+def register_output(name: str, target: str, enabled: Callable[[dict], bool], description: str,
+                    sections: tuple[str, ...] | None = all_sections):
+    """
+    Register an output plugin, 'target' is 'module:function'.
+
+    'sections' are the package list sections read by the plugin,
+    a plugin without sections is never skipped.
+    """
+    output_plugins[name] = OutputPlugin(name, target, enabled, description, sections)
+
+
+register_output('package_lists', '.output:write_package_lists',
+                lambda config: True, 'package lists')
+register_output('metrics', '.output:write_metrics',
+                lambda config: bool(config['output'].get('metrics')), 'metrics')
+register_output('why', '.why:write_why',
+                lambda config: bool(config['output'].get('why')), 'dependency trees',
+                package_sections + ('ecu_roots', 'sdk_roots'))
+register_output('analytics', '.analytics:write_analytics',
+                lambda config: bool(config['output'].get('analytics')), 'size analytics',
+                package_sections + ('ecu_roots', 'sdk_roots'))
+register_output('excel', '.excel:write_excel_package_list',
+                lambda config: bool(config['output'].get('excel')), 'excel list', package_sections)
+register_output('sbom', '.sbom:write_sboms',
+                lambda config: bool(config['output'].get('sbom')), 'SBOMs', package_sections)
+# the artifact manifest already skips complete downloads
+register_output('artifacts', '.artifacts:fetch_artifacts',
+                lambda config: bool(config.get('artifacts')), 'artifacts', None)
+register_output('dot_runtime', '.dot:write_ecu_runtime_dot_graph',
+                lambda config: True, 'runtime dependencies dot graphs', ('ecu_packages', 'ecu_roots'))
+register_output('dot_build_time', '.dot:write_ecu_build_time_dot_graph',
+                lambda config: True, 'build time dependencies dot graphs', package_sections)
+
+
+def enabled_outputs(config) -> list[OutputPlugin]:
+    """
+    Get the enabled output plugins.
+
+    If 'output.writers' lists plugin names, only these are used.
+    """
+    selected = config['output'].get('writers')
+    plugins = []
+    for name, plugin in output_plugins.items():
+        if selected is not None and name not in selected:
+            continue
+        if plugin.enabled(config):
+            plugins.append(plugin)
+
+    for name in selected or []:
+        if name not in output_plugins:
+            logger.error('Unknown output plugin %s!', name)
+    return plugins
+
+
+def plugin_fingerprint(plugin: OutputPlugin, config, sections: dict[str, str]) -> str:
+    """
+    Fingerprint of the inputs of a plugin.
+    """
+    from .output import digest
+
+    # selecting other writers does not change the output of a writer
+    output = {key: value for key, value in config['output'].items() if key != 'writers'}
+    return digest({
+        'config': dict(config, output=output),
+        'sections': [sections[section] for section in plugin.sections],
+    })
+
+
+def output_files(directory: str) -> dict[str, int]:
+    """
+    Modification times of the files in the output directory.
+    """
+    if not os.path.isdir(directory):
+        return {}
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(directory) if entry.is_file()}
+
+
+def read_fingerprints(file: str) -> dict[str, dict]:
+    if not os.path.exists(file):
+        return {}
+    try:
+        with open(file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError as e:
+        logger.warning('Invalid fingerprints %s: %s', file, e)
+        return {}
+
+
+def write_outputs(config, lists):
+    """
+    Run all enabled output plugins for the resolved package lists.
+
+    With 'output.fingerprints', unchanged outputs are not written again.
+    """
+    directory = config['output']['directory']
+    os.makedirs(directory, exist_ok=True)
+
+    fingerprints_file = None
+    if config['output'].get('fingerprints'):
+        from .output import section_fingerprints
+        fingerprints_file = os.path.join(directory, config['output']['fingerprints'])
+        previous = read_fingerprints(fingerprints_file)
+        sections = section_fingerprints(lists)
+    fingerprints: dict[str, dict] = {}
+
+    for plugin in enabled_outputs(config):
+        if fingerprints_file and plugin.sections is not None:
+            fingerprint = plugin_fingerprint(plugin, config, sections)
+            last = previous.get(plugin.name, {})
+            if last.get('fingerprint') == fingerprint and \
+                    all(os.path.exists(os.path.join(directory, file)) for file in last.get('files', [])):
+                logger.info('Skipping %s, unchanged.', plugin.description)
+                fingerprints[plugin.name] = last
+                continue
+            before = output_files(directory)
+
+        logger.info('Writing %s...', plugin.description)
+        plugin.load()(config, lists)
+
+        if fingerprints_file and plugin.sections is not None:
+            # the files written by the plugin
+            files = sorted(name for name, mtime in output_files(directory).items()
+                           if before.get(name) != mtime and name != config['output']['fingerprints'])
+            fingerprints[plugin.name] = {'fingerprint': fingerprint, 'files': files}
+
+    if fingerprints_file:
+        with open(fingerprints_file, 'w', encoding='utf-8') as f:
+            json.dump(fingerprints, f, indent=4, sort_keys=True)
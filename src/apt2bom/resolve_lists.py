@@ -1,12 +1,44 @@
 """
 Generate package lists from APT metadata.
+
+The scanned metadata is shared by all resolutions and never modified.
+The type, root origin and depth of a resolved package are kept in an
+overlay of the package list, so that resolutions over the same
+metadata are independent of each other, and may run concurrently.
 """
+from __future__ import annotations
+
 import logging
+from collections import deque
+from typing import TYPE_CHECKING
 from .apt_data import AptRepository, Package
+from .graph import ArchGraph, DependencyGraph, build_graph
+
+if TYPE_CHECKING:
+    from .partition import Partitioner
 
 
 logger = logging.getLogger('resolve_lists')
 
+
+class Overlay:
+    """
+    Resolution data of a package in one package list.
+
+    The 'root' is the nearest root package, 'parent' the package
+    requiring it on a shortest path from this root, and 'depth' the
+    length of this path, -1 if the package is not reachable.
+    """
+    def __init__(self, pkg_type: str):
+        self.pkg_type: str = pkg_type
+        self.root: str | None = None
+        self.parent: str | None = None
+        self.depth: int = -1
+
+    def __repr__(self) -> str:
+        return f'Overlay({self.pkg_type}, {self.root}, {self.depth})'
+
+
 class PackageLists:
     """
     Data class for all resolved package lists.
@@ -14,233 +46,226 @@ class PackageLists:
     def __init__(self):
         self.ecu_packages: dict[str, dict[str, Package]] = {}
         self.sdk_packages: dict[str, dict[str, Package]] = {}
+        self.ecu_overlays: dict[str, dict[str, Overlay]] = {}
+        self.sdk_overlays: dict[str, dict[str, Overlay]] = {}
         self.missing_packages: dict[str, set[str]] = {}
         self.broken_packages: dict[str, set[str]] = {}
+        self.ecu_roots: dict[str, set[str]] = {}
+        self.sdk_roots: dict[str, set[str]] = {}
+        self.suggestions: dict[str, dict[str, list[str]]] = {}
+        self.graph: DependencyGraph = None
 
 
-def resolve_package(repos: list[AptRepository], pkg: str, arch: str) -> Package | None:
-    """
-    Search a given package in the given APT repositories.
-    """
-    if not pkg or pkg == '':
-        logger.info('Invalid package name: |%s|', pkg)
-        return
-    
-    if ':' in pkg:
-        pkg = pkg.split(':', maxsplit=1)[0]
-
-    # TODO: repo priorities
-    for repo in repos:
-        for component_name in repo.components.keys():
-            component = repo.components[component_name]
-            if pkg in component.packages:
-                if arch in component.packages[pkg].keys():
-                    if component.packages[pkg][arch]:
-                        logger.debug('Package %s (%s) found in %s %s.',
-                                    pkg, arch, repo, component)
-                        # TODO: criteria for "right" package
-                        return component.packages[pkg][arch][0]
-
-    logger.error('Package %s not found!', pkg)
-    return None
-
-
-def resolve_rt_dependencies_recursive(repos: list[AptRepository],
+def resolve_runtime_dependencies(graph: DependencyGraph,
                                  packages: dict[str, Package],
+                                 overlays: dict[str, Overlay],
                                  missing_packages: set[str],
-                                 package_name: str,
-                                 arch: str):
-    """
-    Recursive resolve runtime dependencies.
+                                 visited: bytearray,
+                                 roots: list[int],
+                                 pkg_type: str,
+                                 arch: str,
+                                 root_groups: list[int] | None = None,
+                                 root_packages: set[str] | None = None,
+                                 partitioner: Partitioner | None = None,
+                                 unknown_roots: list[str] | None = None):
     """
-    package = packages[package_name]
-    root_type = package.pkg_type.split('_')[0]
-    dep_type = f'{root_type}_DEP'
-    
-    for (dep, _) in package.depends:
-        if dep in packages:
-            # package was already resolved or is root package
-            continue
-
-        dep_package = resolve_package(repos, dep, arch)
-        if dep_package:
-            if dep_package.pkg_type is None:
-                dep_package.pkg_type = dep_type
-            packages[dep] = dep_package
-            #recursive resolve dependencies
-            for (dep, _) in dep_package.depends:
-                if dep not in packages:
-                    dep_dep_package = resolve_package(repos, dep, arch)
-                    if dep_dep_package:
-                        if dep_dep_package.pkg_type is None:
-                            dep_dep_package.pkg_type = dep_type
-                        packages[dep] = dep_dep_package
-                        packages, missing_packages = resolve_rt_dependencies_recursive(
-                            repos, packages, missing_packages, dep, arch)
-                    else:
-                        logger.debug('Package %s not found!', package_name)
-                        missing_packages.add(package_name)
-        else:
-            logger.error('Package %s (%s) not found!', dep, package.pkg_type)
-            missing_packages.add(package_name)
-
-    return packages, missing_packages
+    Add the root packages and all their runtime dependencies.
 
-
-def resolve_runtime_dependencies(repos: list[AptRepository],
-                                 packages: dict[str, Package],
-                                 missing_packages: set[str],
-                                 package_names: list[str],
-                                 arch: str):
+    A package keeps the type of the first closure adding it to the
+    'overlays'. The names of the resolved root packages are added to
+    'root_packages', 'unknown_roots' are reported as missing.
+    With a 'partitioner', shards of the roots are expanded by workers.
     """
-    Add all runtime dependencies
-    """
-    for pkg in package_names:
-        package = packages[pkg]
-        logger.debug('Resolving %d runtime depends of %s: %s',
-                     len(package.depends), pkg,
-                     [name for name, _ in package.depends])
-        
-        packages, missing_packages = resolve_rt_dependencies_recursive(
-            repos, packages, missing_packages, pkg, arch)
+    expanded = None
+    if partitioner:
+        expanded = partitioner.expand(arch, [graph.names[name_id] for name_id in roots], root_groups)
+    order, missing = graph.closure(arch, roots, visited, root_groups, expanded)
+
+    root_type = pkg_type.split('_')[0]
+    dep_type = f'{root_type}_DEP'
+    arch_graph = graph.archs[arch]
+    root_indices = set(arch_graph.resolve(name_id) for name_id in roots)
+    for group in root_groups or []:
+        # the alternative taken by the closure
+        members = set(index for name_id in arch_graph.alternatives(group)
+                      for index in arch_graph.providers(name_id) if visited[index])
+        root_indices.add(arch_graph.satisfier(group, members) if members else -1)
+
+    for index in order:
+        package = arch_graph.packages[index]
+        if package.package not in overlays:
+            overlays[package.package] = Overlay(pkg_type if index in root_indices else dep_type)
+        packages[package.package] = package
+    if root_packages is not None:
+        root_packages.update(graph.archs[arch].packages[index].package
+                             for index in root_indices if index >= 0)
+
+    # a missing dependency is reported once, not for every package reaching it
+    for name in (unknown_roots or []) + missing:
+        if name not in missing_packages:
+            logger.error('Package %s (%s, %s) not found!', name, arch, pkg_type)
+            missing_packages.add(name)
 
     logger.info('Found %d packages', len(packages))
 
     return packages, missing_packages
 
 
-def resolve_build_time_dependencies(repos: list[AptRepository],
+def resolve_build_time_dependencies(graph: DependencyGraph,
                                  ecu_packages: dict[str, Package],
+                                 ecu_overlays: dict[str, Overlay],
                                  missing_packages: set[str],
-                                 arch: str):
+                                 arch: str,
+                                 root_packages: set[str] | None = None,
+                                 partitioner: Partitioner | None = None):
     """
     Add all build-time dependencies
+
+    The build-time dependencies are resolved once per unique source
+    package, and not again for each binary package built from it.
     """
+    arch_graph = graph.archs[arch]
     sdk_packages: dict[str, Package] = {}
+    sdk_overlays: dict[str, Overlay] = {}
     broken_packages: set[str] = set()
 
-    package_names = []
-    for pkg in ecu_packages.keys():
-        package = ecu_packages[pkg]
-        root_type = package.pkg_type.split('_')[0]
+    sources: dict[int, str] = {}
+    for pkg, package in ecu_packages.items():
+        root_type = ecu_overlays[pkg].pkg_type.split('_')[0]
         if not root_type.endswith('SDK'):
             dep_type = f'{root_type}SDK'
         else:
             dep_type = root_type
 
         if not package.source:
-            logger.error('No source metadata for %s!', pkg)
+            logger.error('No source metadata for %s (%s)!', pkg, arch)
             broken_packages.add(pkg)
             continue
 
-        # find build-time dependencies of ECU packages
-        for (dep, _) in package.source.build_depends:
-            dep_package = resolve_package(repos, dep, arch)
-            if dep_package:
-                if dep_package.pkg_type is None:
-                    dep_package.pkg_type = dep_type
-                sdk_packages[dep] = dep_package
-                package_names.append(dep)
-            else:
-                logger.error('Missing SDK package %s (%s)!', dep, dep_type)
-                missing_packages.add(dep)
-                continue
-    
-    logger.debug('Found %d root SDK packages. %d', len(sdk_packages), len(package_names))
-
-    # get runtime dependencies of SDK packages
-    sdk_packages, missing_packages = resolve_runtime_dependencies(
-        repos, sdk_packages, missing_packages, package_names, arch)
-    
-    return sdk_packages, missing_packages, broken_packages
+        # PROD build dependencies take precedence
+        source_id = arch_graph.package_source[arch_graph.index_of[id(package)]]
+        if source_id not in sources or dep_type.startswith('PROD'):
+            sources[source_id] = dep_type
+
+    # find build-time dependencies of ECU sources
+    roots: dict[str, list[int]] = {}
+    seen: set[tuple[int, ...]] = set()
+    for source_id, dep_type in sorted(sources.items(), key=lambda s: (not s[1].startswith('PROD'), s[0])):
+        for group in arch_graph.source_build_depends(source_id):
+            alternatives = tuple(arch_graph.alternatives(group))
+            if alternatives not in seen:
+                seen.add(alternatives)
+                roots.setdefault(dep_type, []).append(group)
+
+    logger.debug('Found %d build-time dependencies of %d sources for %d packages.',
+                 len(seen), len(sources), len(ecu_packages))
+
+    # get runtime dependencies of SDK packages, PROD before DEV
+    visited = bytearray(len(arch_graph.packages))
+    for dep_type in sorted(roots.keys(), key=lambda t: (not t.startswith('PROD'), t)):
+        sdk_packages, missing_packages = resolve_runtime_dependencies(
+            graph, sdk_packages, sdk_overlays, missing_packages, visited, [], dep_type, arch, roots[dep_type],
+            root_packages, partitioner)
+
+    return sdk_packages, sdk_overlays, missing_packages, broken_packages
+
+
+def trace_origins(arch_graph: ArchGraph, packages: dict[str, Package],
+                  overlays: dict[str, Overlay], roots: set[str]):
+    """
+    Set root, parent and depth of the overlays of a package list.
+
+    Breadth-first over the resolved dependencies within the list. All
+    root packages start at depth 0, in list order, so that each package
+    gets the shortest path from its nearest root.
+    """
+    index_of = arch_graph.index_of
+    members = set(index_of[id(package)] for package in packages.values())
+
+    queue: deque[str] = deque()
+    for name in packages.keys():
+        if name in roots:
+            overlay = overlays[name]
+            overlay.root = name
+            overlay.depth = 0
+            queue.append(name)
+
+    while queue:
+        name = queue.popleft()
+        overlay = overlays[name]
+        for dep in arch_graph.resolved_depends(index_of[id(packages[name])], members):
+            dep_overlay = overlays[arch_graph.packages[dep].package]
+            if dep_overlay.depth < 0:
+                dep_overlay.root = overlay.root
+                dep_overlay.parent = name
+                dep_overlay.depth = overlay.depth + 1
+                queue.append(arch_graph.packages[dep].package)
 
 
 def resolve_package_lists(repos: list[AptRepository],
                           architectures: list[str],
                           prod: list[str],
                           dev: list[str],
-                          sdk: list[str]) -> PackageLists:
+                          sdk: list[str],
+                          graph: DependencyGraph | None = None,
+                          profiles: list[str] | None = None,
+                          partitioner: Partitioner | None = None) -> PackageLists:
     """
     Search the metadata for the root packages,
     and all runtime and build-time dependencies.
-    """
-    ecu_arch_packages: dict[str, dict[str, Package]] = {}
-    sdk_arch_packages: dict[str, dict[str, Package]] = {}
-    missing_arch_packages: dict[str, set[str]] = {}
-    broken_arch_packages: dict[str, set[str]] = {}
-
-    # join package name with package type
-    packages = [(pkg, 'PROD') for pkg in prod]
-    packages += [(pkg, 'DEV') for pkg in dev]
-    
-    for arch in architectures:
-        missing_packages = set()
-        found_packages = []
-        ecu_packages: dict[str, Package] = {}
-        for pkg, pkg_type in packages:
-            package = resolve_package(repos, pkg, arch)
-            if package:
-                if package.pkg_type is None:
-                    package.pkg_type = pkg_type
-                ecu_packages[pkg] = package
-                found_packages.append(pkg)
-            else:
-                logger.error('Package %s (%s) not found!', pkg, pkg_type)
-                missing_packages.add(pkg)
-
-        logger.info('Resolved %d packages.', len(packages))
-
-        ecu_packages, missing_packages = resolve_runtime_dependencies(
-            repos, ecu_packages, missing_packages, found_packages, arch)
-        
-        sdk_packages, missing_packages, broken_packages = resolve_build_time_dependencies(
-            repos, ecu_packages, missing_packages, arch)
 
-        logger.info('Resolved %d ECU packages, %d SDK packages.',
-                    len(ecu_packages), len(sdk_packages))
-        logger.info('Missing packages: %s', missing_packages)
-        logger.info('Broken packages: %s', broken_packages)
+    The package lists are sorted by name, so that the result does not
+    depend on the order of expansion, e.g. with a 'partitioner'.
+    """
+    if graph is None:
+        graph = build_graph(repos, architectures, profiles)
 
-        ecu_arch_packages[arch] = ecu_packages
-        sdk_arch_packages[arch] = sdk_packages
-        missing_arch_packages[arch] = missing_packages
-        broken_arch_packages[arch] = broken_packages
+    lists = PackageLists()
+    lists.graph = graph
 
-    # resolve SDK packages
-    packages = [(pkg, 'SDK') for pkg in sdk]
     for arch in architectures:
+        arch_graph = graph.archs[arch]
         missing_packages = set()
-        found_packages = []
-        sdk_packages: dict[str, Package] = {}
-        for pkg, pkg_type in packages:
-            package = resolve_package(repos, pkg, arch)
-            if package:
-                if package.pkg_type is None:
-                    package.pkg_type = pkg_type
-                sdk_packages[pkg] = package
-                found_packages.append(pkg)
-            else:
-                logger.error('Package %s (%s) not found!', pkg, pkg_type)
-                missing_packages.add(pkg)
-
-        logger.info('Resolved %d packages.', len(packages))
-
+        ecu_packages: dict[str, Package] = {}
+        ecu_overlays: dict[str, Overlay] = {}
+        ecu_roots: set[str] = set()
+        sdk_roots: set[str] = set()
+
+        # PROD first, so that shared dependencies become PROD dependencies
+        visited = bytearray(len(arch_graph.packages))
+        for names, pkg_type in ((prod, 'PROD'), (dev, 'DEV')):
+            unknown: list[str] = []
+            ecu_packages, missing_packages = resolve_runtime_dependencies(
+                graph, ecu_packages, ecu_overlays, missing_packages, visited,
+                graph.name_ids(names or [], unknown), pkg_type, arch,
+                root_packages=ecu_roots, partitioner=partitioner, unknown_roots=unknown)
+
+        sdk_packages, sdk_overlays, missing_packages, broken_packages = resolve_build_time_dependencies(
+            graph, ecu_packages, ecu_overlays, missing_packages, arch, sdk_roots, partitioner)
+
+        # resolve SDK packages
+        visited = bytearray(len(arch_graph.packages))
+        unknown = []
         sdk_packages, missing_packages = resolve_runtime_dependencies(
-            repos, sdk_packages, missing_packages, found_packages, arch)
+            graph, sdk_packages, sdk_overlays, missing_packages, visited,
+            graph.name_ids(sdk or [], unknown), 'SDK', arch,
+            root_packages=sdk_roots, partitioner=partitioner, unknown_roots=unknown)
 
-        logger.info('Resolved %d SDK packages.', len(sdk_packages))
+        logger.info('Resolved %d ECU packages, %d SDK packages.',
+                    len(ecu_packages), len(sdk_packages))
         logger.info('Missing %d packages.', len(missing_packages))
         logger.info('Broken %d packages.', len(broken_packages))
 
-        sdk_arch_packages[arch].update(sdk_packages)
-
-        missing_arch_packages[arch].update(missing_packages)
-        broken_arch_packages[arch].update(broken_packages)
-
-    lists = PackageLists()
-    lists.ecu_packages = ecu_arch_packages
-    lists.sdk_packages = sdk_arch_packages
-    lists.broken_packages = broken_arch_packages
-    lists.missing_packages = missing_arch_packages
+        lists.ecu_packages[arch] = dict(sorted(ecu_packages.items()))
+        lists.sdk_packages[arch] = dict(sorted(sdk_packages.items()))
+        trace_origins(arch_graph, lists.ecu_packages[arch], ecu_overlays, ecu_roots)
+        trace_origins(arch_graph, lists.sdk_packages[arch], sdk_overlays, sdk_roots)
+        lists.ecu_overlays[arch] = dict(sorted(ecu_overlays.items()))
+        lists.sdk_overlays[arch] = dict(sorted(sdk_overlays.items()))
+        lists.missing_packages[arch] = missing_packages
+        lists.broken_packages[arch] = broken_packages
+        lists.ecu_roots[arch] = ecu_roots
+        lists.sdk_roots[arch] = sdk_roots
 
     return lists
+
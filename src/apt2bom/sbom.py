@@ -0,0 +1,337 @@
+"""
+Write resolved package lists as CycloneDX and SPDX SBOMs.
+
+The documents are streamed component by component, directly from
+the resolved package lists and the dependency graph, so that no
+second in-memory copy of the lists is created.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+from .apt_data import Package, Source
+from .resolve_lists import Overlay, PackageLists
+
+
+logger = logging.getLogger('sbom')
+
+sbom_suffixes = {
+    'cyclonedx': '.cdx.json',
+    'spdx_json': '.spdx.json',
+    'spdx_tv': '.spdx',
+}
+
+hash_algorithms = [
+    ('md5', 'MD5'),
+    ('sha1', 'SHA-1'),
+    ('sha256', 'SHA-256'),
+    ('sha512', 'SHA-512'),
+]
+
+
+def purl(package: Package | Source, arch: str) -> str:
+    """
+    Package URL of a Debian binary or source package.
+
+    Binary packages use their own architecture, so that 'all' packages
+    are not tagged with the architecture of the list.
+    """
+    if isinstance(package, Package) and package.architecture:
+        arch = package.architecture
+    vendor = (package.repository.origin or 'debian').lower()
+    url = f'pkg:deb/{vendor}/{quote(package.package)}@{quote(package.version or "", safe="")}?arch={arch}'
+    if package.repository.codename:
+        url += f'&distro={package.repository.codename}'
+    return url
+
+
+def spdx_id(*parts: str) -> str:
+    """
+    SPDX element ID, only letters, numbers, '.' and '-' are allowed.
+
+    Other characters are replaced, and a hash of the parts is appended,
+    so that e.g. the versions '1.2+dfsg-1' and '1.2-dfsg-1' differ.
+    """
+    raw = '-'.join(parts)
+    ref = re.sub(r'[^A-Za-z0-9.-]', '-', raw)
+    if ref != raw:
+        ref += '-' + hashlib.sha256(raw.encode()).hexdigest()[:8]
+    return 'SPDXRef-' + ref
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def iterate_packages(lists: PackageLists, arch_packages: dict[str, dict[str, Package]]):
+    """
+    Iterate (arch, package, resolved dependencies) of a package list.
+    """
+    for arch in arch_packages.keys():
+        arch_graph = lists.graph.archs[arch]
+        members = set(arch_graph.index_of[id(package)] for package in arch_packages[arch].values())
+        for package in arch_packages[arch].values():
+            depends = arch_graph.resolved_depends(arch_graph.index_of[id(package)], members)
+            yield arch, package, [arch_graph.packages[dep] for dep in depends]
+
+
+def cyclonedx_component(package: Package | Source, arch: str, pkg_type: str | None) -> dict:
+    component = {
+        'type': 'library',
+        'bom-ref': purl(package, arch),
+        'name': package.package,
+        'version': package.version,
+        'purl': purl(package, arch),
+    }
+
+    if isinstance(package, Source):
+        files = package.files.values()
+        hashes = [{'alg': alg, 'content': getattr(file, key)}
+                  for file in files if file.name.endswith('.dsc')
+                  for key, alg in hash_algorithms if getattr(file, key)]
+    else:
+        hashes = [{'alg': alg, 'content': getattr(package, key)}
+                  for key, alg in hash_algorithms if getattr(package, key)]
+    if hashes:
+        component['hashes'] = hashes
+
+    properties = [('apt2bom:pkg_type', pkg_type), ('apt2bom:section', package.section)]
+    if isinstance(package, Package) and package.source:
+        # bom-ref of the source component
+        properties.append(('apt2bom:source', purl(package.source, 'source')))
+    component['properties'] = [{'name': name, 'value': value} for name, value in properties if value]
+    return component
+
+
+def write_cyclonedx(file: str, lists: PackageLists, arch_packages: dict[str, dict[str, Package]],
+                    overlays: dict[str, dict[str, Overlay]]):
+    """
+    Stream a CycloneDX 1.5 JSON document.
+
+    A source gets the type of the first package built from it. Components
+    are written once per bom-ref, the dependencies of 'all' packages,
+    which are part of the lists of several architectures, are merged.
+    """
+    header = {
+        'bomFormat': 'CycloneDX',
+        'specVersion': '1.5',
+        'serialNumber': f'urn:uuid:{uuid.uuid4()}',
+        'version': 1,
+        'metadata': {
+            'timestamp': timestamp(),
+            'tools': {'components': [{'type': 'application', 'name': 'apt2bom'}]},
+        },
+    }
+
+    with open(file, 'w') as f:
+        f.write(json.dumps(header, indent=4)[:-2])
+        f.write(',\n    "components": [')
+
+        separator = '\n'
+        refs: set[str] = set()
+        for arch, package, _ in iterate_packages(lists, arch_packages):
+            pkg_type = overlays[arch][package.package].pkg_type
+            for component in (package, package.source):
+                if component is None:
+                    continue
+                component_arch = 'source' if component is package.source else arch
+                ref = purl(component, component_arch)
+                if ref not in refs:
+                    refs.add(ref)
+                    f.write(separator + json.dumps(cyclonedx_component(component, component_arch, pkg_type)))
+                    separator = ',\n'
+
+        f.write('\n    ],\n    "dependencies": [')
+        separator = '\n'
+        shared: dict[str, list[str]] = {}
+        for arch, package, depends in iterate_packages(lists, arch_packages):
+            ref = purl(package, arch)
+            depends_on = [purl(dep, arch) for dep in depends]
+            if package.architecture in (None, arch):
+                f.write(separator + json.dumps({'ref': ref, 'dependsOn': depends_on}))
+                separator = ',\n'
+            else:
+                # e.g. 'all' packages, written after the architecture specific ones
+                merged = shared.setdefault(ref, [])
+                merged.extend(dep for dep in depends_on if dep not in merged)
+        for ref, depends_on in shared.items():
+            f.write(separator + json.dumps({'ref': ref, 'dependsOn': depends_on}))
+            separator = ',\n'
+
+        f.write('\n    ]\n}\n')
+
+
+def spdx_package(package: Package | Source, arch: str) -> dict:
+    data = {
+        'SPDXID': spdx_package_id(package, arch),
+        'name': package.package,
+        'versionInfo': package.version,
+        'downloadLocation': 'NOASSERTION',
+        'filesAnalyzed': False,
+        'licenseConcluded': 'NOASSERTION',
+        'licenseDeclared': 'NOASSERTION',
+        'copyrightText': 'NOASSERTION',
+        'externalRefs': [{
+            'referenceCategory': 'PACKAGE-MANAGER',
+            'referenceType': 'purl',
+            'referenceLocator': purl(package, arch),
+        }],
+    }
+
+    if isinstance(package, Source):
+        dsc = [file for file in package.files.values() if file.name.endswith('.dsc')]
+        if dsc:
+            data['downloadLocation'] = dsc[0].name
+            checksums = [(alg, getattr(dsc[0], key)) for key, alg in hash_algorithms]
+        else:
+            checksums = []
+    else:
+        if package.filename:
+            data['downloadLocation'] = package.filename
+        checksums = [(alg, getattr(package, key)) for key, alg in hash_algorithms]
+
+    checksums = [{'algorithm': alg.replace('-', ''), 'checksumValue': value}
+                 for alg, value in checksums if value]
+    if checksums:
+        data['checksums'] = checksums
+    if package.homepage:
+        data['homepage'] = package.homepage
+    return data
+
+
+def spdx_package_id(package: Package | Source, arch: str) -> str:
+    if isinstance(package, Source):
+        return spdx_id('Source', package.package, package.version or '')
+    return spdx_id('Package', arch, package.package)
+
+
+def spdx_relationships(lists: PackageLists, arch_packages: dict[str, dict[str, Package]]):
+    """
+    Iterate (element, relationship, related element) of a package list.
+    """
+    for arch, package, depends in iterate_packages(lists, arch_packages):
+        package_id = spdx_package_id(package, arch)
+        yield 'SPDXRef-DOCUMENT', 'DESCRIBES', package_id
+        for dep in depends:
+            yield package_id, 'DEPENDS_ON', spdx_package_id(dep, arch)
+        if package.source:
+            yield package_id, 'GENERATED_FROM', spdx_package_id(package.source, 'source')
+
+
+def spdx_packages(lists: PackageLists, arch_packages: dict[str, dict[str, Package]]):
+    """
+    Iterate the SPDX packages of a package list, sources included once.
+    """
+    sources: set[int] = set()
+    for arch, package, _ in iterate_packages(lists, arch_packages):
+        yield spdx_package(package, arch)
+        if package.source and id(package.source) not in sources:
+            sources.add(id(package.source))
+            yield spdx_package(package.source, 'source')
+
+
+def spdx_document(name: str) -> dict:
+    return {
+        'spdxVersion': 'SPDX-2.3',
+        'dataLicense': 'CC0-1.0',
+        'SPDXID': 'SPDXRef-DOCUMENT',
+        'name': name,
+        'documentNamespace': f'https://spdx.org/spdxdocs/apt2bom-{name}-{uuid.uuid4()}',
+        'creationInfo': {
+            'created': timestamp(),
+            'creators': ['Tool: apt2bom'],
+        },
+    }
+
+
+def write_spdx_json(file: str, lists: PackageLists, arch_packages: dict[str, dict[str, Package]],
+                    overlays: dict[str, dict[str, Overlay]]):
+    """
+    Stream a SPDX 2.3 JSON document.
+    """
+    name = os.path.basename(file)
+    with open(file, 'w') as f:
+        f.write(json.dumps(spdx_document(name), indent=4)[:-2])
+        f.write(',\n    "packages": [')
+
+        separator = '\n'
+        for package in spdx_packages(lists, arch_packages):
+            f.write(separator + json.dumps(package))
+            separator = ',\n'
+
+        f.write('\n    ],\n    "relationships": [')
+        separator = '\n'
+        for element, relationship, related in spdx_relationships(lists, arch_packages):
+            f.write(separator + json.dumps({
+                'spdxElementId': element,
+                'relationshipType': relationship,
+                'relatedSpdxElement': related,
+            }))
+            separator = ',\n'
+
+        f.write('\n    ]\n}\n')
+
+
+def write_spdx_tv(file: str, lists: PackageLists, arch_packages: dict[str, dict[str, Package]],
+                  overlays: dict[str, dict[str, Overlay]]):
+    """
+    Stream a SPDX 2.3 tag-value document.
+    """
+    document = spdx_document(os.path.basename(file))
+    with open(file, 'w') as f:
+        f.write(f'SPDXVersion: {document["spdxVersion"]}\n')
+        f.write(f'DataLicense: {document["dataLicense"]}\n')
+        f.write(f'SPDXID: {document["SPDXID"]}\n')
+        f.write(f'DocumentName: {document["name"]}\n')
+        f.write(f'DocumentNamespace: {document["documentNamespace"]}\n')
+        f.write(f'Creator: {document["creationInfo"]["creators"][0]}\n')
+        f.write(f'Created: {document["creationInfo"]["created"]}\n')
+
+        for package in spdx_packages(lists, arch_packages):
+            f.write(f'\nPackageName: {package["name"]}\n')
+            f.write(f'SPDXID: {package["SPDXID"]}\n')
+            f.write(f'PackageVersion: {package["versionInfo"]}\n')
+            f.write(f'PackageDownloadLocation: {package["downloadLocation"]}\n')
+            f.write('FilesAnalyzed: false\n')
+            for checksum in package.get('checksums', []):
+                f.write(f'PackageChecksum: {checksum["algorithm"]}: {checksum["checksumValue"]}\n')
+            if 'homepage' in package:
+                f.write(f'PackageHomePage: {package["homepage"]}\n')
+            f.write('PackageLicenseConcluded: NOASSERTION\n')
+            f.write('PackageLicenseDeclared: NOASSERTION\n')
+            f.write('PackageCopyrightText: NOASSERTION\n')
+            for ref in package['externalRefs']:
+                f.write(f'ExternalRef: {ref["referenceCategory"]} {ref["referenceType"]} {ref["referenceLocator"]}\n')
+
+        f.write('\n')
+        for element, relationship, related in spdx_relationships(lists, arch_packages):
+            f.write(f'Relationship: {element} {relationship} {related}\n')
+
+
+sbom_writers = {
+    'cyclonedx': write_cyclonedx,
+    'spdx_json': write_spdx_json,
+    'spdx_tv': write_spdx_tv,
+}
+
+
+def write_sboms(config, lists: PackageLists):
+    """
+    Write the configured SBOM formats for the ECU and SDK package lists.
+    """
+    formats = config['output'].get('sbom') or []
+    for sbom_format in formats:
+        if sbom_format not in sbom_writers:
+            logger.error('Unknown SBOM format %s!', sbom_format)
+            continue
+
+        for key, arch_packages, overlays in (('ecu_json', lists.ecu_packages, lists.ecu_overlays),
+                                             ('sdk_json', lists.sdk_packages, lists.sdk_overlays)):
+            name = os.path.splitext(config['output'][key])[0]
+            file = os.path.join(config['output']['directory'], name + sbom_suffixes[sbom_format])
+            logger.debug('Writing %s SBOM to %s ...', sbom_format, file)
+            sbom_writers[sbom_format](file, lists, arch_packages, overlays)
@@ -0,0 +1,257 @@
+"""
+Long-running BOM service with hot in-memory APT metadata.
+
+The scanned repositories and the compiled dependency graph are kept
+in memory as a snapshot. A background thread watches the 'Release'
+files of the configured repositories, and builds a new snapshot if
+they change. The new snapshot replaces the old one atomically, while
+requests in flight keep using the snapshot they started with.
+
+Resolving only reads the snapshot: root names are looked up without
+interning them into the graph, unknown names are reported as missing,
+and the types, root origins and depths are kept in the overlays of
+the resolved package lists. The reach cache of the graph is not
+enabled, so that requests are resolved concurrently without a lock.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .conf import read_config, read_build_options
+from .apt_data import AptRepository, Package
+from .apt_download import MirrorSet, config_mirrors, get_distro_url, read_url
+from .apt_parsing import scan_repositories
+from .graph import DependencyGraph, build_graph
+from .resolve_lists import Overlay, PackageLists, resolve_package_lists
+
+
+logger = logging.getLogger('server')
+
+
+class Snapshot:
+    """
+    Scanned APT metadata and the compiled dependency graph.
+    """
+    def __init__(self):
+        self.repos: list[AptRepository] = []
+        self.graph: DependencyGraph = None
+        self.fingerprint: str = None
+        self.created: float = 0.0
+
+    def __repr__(self) -> str:
+        return f'Snapshot({self.fingerprint[:12]}, {self.graph})'
+
+
+def release_fingerprint(config, mirrors: dict[str, MirrorSet] | None = None) -> str:
+    """
+    Hash the 'Release' files of all configured repositories.
+    """
+    digest = hashlib.sha256()
+    for repository in config['repositories']:
+        release = get_distro_url(repository['url'], repository['distribution'], 'Release')
+        for line in read_url(release, mirrors):
+            digest.update(line.encode())
+    return digest.hexdigest()
+
+
+def load_snapshot(config, mirrors: dict[str, MirrorSet] | None = None) -> Snapshot:
+    """
+    Scan the configured repositories and compile the dependency graph.
+    """
+    snapshot = Snapshot()
+    snapshot.fingerprint = release_fingerprint(config, mirrors)
+    snapshot.repos = scan_repositories(config, mirrors)
+    profiles, indep = read_build_options(config)
+    snapshot.graph = build_graph(
+        snapshot.repos, config['packages']['architectures'], profiles=profiles, indep=indep)
+    snapshot.created = time.time()
+    logger.info('Loaded %s', snapshot)
+    return snapshot
+
+
+def package_summary(package: Package, overlay: Overlay) -> dict:
+    """
+    Compact description of a resolved package.
+    """
+    return {
+        'package': package.package,
+        'version': package.version,
+        'architecture': package.architecture,
+        'pkg_type': overlay.pkg_type,
+        'root': overlay.root,
+        'depth': overlay.depth,
+        'source': package.source.package if package.source else None,
+    }
+
+
+def lists_to_response(lists: PackageLists) -> dict:
+    """
+    Convert resolved package lists to a JSON response.
+    """
+    response = {}
+    for arch in lists.ecu_packages.keys():
+        response[arch] = {
+            'ecu': [package_summary(lists.ecu_packages[arch][name], lists.ecu_overlays[arch][name])
+                    for name in sorted(lists.ecu_packages[arch].keys())],
+            'sdk': [package_summary(lists.sdk_packages[arch][name], lists.sdk_overlays[arch][name])
+                    for name in sorted(lists.sdk_packages[arch].keys())],
+            'missing': sorted(lists.missing_packages[arch]),
+            'broken': sorted(lists.broken_packages[arch]),
+        }
+    return response
+
+
+class BomService:
+    """
+    Resolve root package lists against an in-memory snapshot.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.mirrors: dict[str, MirrorSet] = config_mirrors(config)
+        self.snapshot: Snapshot = load_snapshot(config, self.mirrors)
+        self._stop = threading.Event()
+
+    def resolve(self, request: dict) -> dict:
+        """
+        Resolve the root packages of a request.
+
+        Raises ValueError for an invalid request.
+        """
+        if not isinstance(request, dict):
+            raise ValueError('The request must be a JSON object')
+        prod, dev, sdk = (request_names(request, key) for key in ('prod', 'dev', 'sdk'))
+
+        snapshot = self.snapshot
+        architectures = request_names(request, 'architectures') or self.config['packages']['architectures']
+        unknown = [arch for arch in architectures if arch not in snapshot.graph.archs]
+        if unknown:
+            raise ValueError(f'Unknown architectures: {unknown}')
+
+        lists = resolve_package_lists(
+            snapshot.repos, architectures, prod, dev, sdk, graph=snapshot.graph)
+        return {'snapshot': snapshot.fingerprint, 'architectures': lists_to_response(lists)}
+
+    def status(self) -> dict:
+        """
+        Describe the active snapshot.
+        """
+        snapshot = self.snapshot
+        return {
+            'snapshot': snapshot.fingerprint,
+            'created': snapshot.created,
+            'names': len(snapshot.graph.names),
+            'architectures': {arch: len(graph.packages) for arch, graph in snapshot.graph.archs.items()},
+        }
+
+    def refresh(self) -> bool:
+        """
+        Load a new snapshot if the 'Release' files changed.
+        """
+        fingerprint = release_fingerprint(self.config, self.mirrors)
+        if fingerprint == self.snapshot.fingerprint:
+            return False
+
+        logger.info('Release files changed, loading new snapshot...')
+        snapshot = load_snapshot(self.config, self.mirrors)
+        self.snapshot = snapshot
+        return True
+
+    def watch(self, interval: float):
+        """
+        Refresh the snapshot periodically in a background thread.
+        """
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error('Refreshing snapshot failed: %s', e)
+
+        thread = threading.Thread(target=loop, name='snapshot-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def request_names(request: dict, key: str) -> list[str]:
+    """
+    Get a list of names of a request, empty if not given.
+    """
+    names = request.get(key)
+    if names is None:
+        return []
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError(f"'{key}' must be a list of strings")
+    return names
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/JSON API of the BOM service.
+
+    GET /status returns the active snapshot, POST /resolve accepts
+    {"prod": [...], "dev": [...], "sdk": [...], "architectures": [...]}.
+    Invalid requests are answered with 400, failures with 500, both
+    with an 'error' message.
+    """
+    service: BomService = None
+
+    def _send(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send(200, self.service.status())
+        else:
+            self._send(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/resolve':
+            self._send(404, {'error': f'Unknown path {self.path}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            self._send(200, self.service.resolve(request))
+        except (ValueError, TypeError) as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            logger.error('Resolving %s failed: %r', self.path, e)
+            self._send(500, {'error': f'Internal error: {e!r}'})
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve(config: str = 'config.yaml', host: str | None = None, port: int | None = None):
+    """
+    Run the BOM service until interrupted.
+    """
+    config = read_config(file=config)
+    options = config.get('server') or {}
+    host = host or options.get('host', 'localhost')
+    port = port or options.get('port', 8080)
+
+    service = BomService(config)
+    service.watch(options.get('refresh_interval', 300))
+
+    RequestHandler.service = service
+    httpd = ThreadingHTTPServer((host, port), RequestHandler)
+    logger.info('Serving on http://%s:%d ...', host, port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        httpd.server_close()
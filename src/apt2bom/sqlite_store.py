@@ -0,0 +1,399 @@
+"""
+SQLite-backed out-of-core store for APT metadata.
+
+The parsed stanzas are bulk-loaded into an indexed SQLite database,
+one index file at a time, so that memory stays bounded. Package lookup
+and source linking run as indexed queries, and the database can be
+reused across runs and queried ad-hoc with SQL.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+from .apt_data import AptRepository, Component, Dependency, JsonSerializer, Package, Source, SourceFile
+from .apt_download import MirrorSet, config_mirrors, get_distro_url, read_url
+from .conf import read_fields
+from .apt_parsing import parse_apt_repository, parse_package_index, parse_source_index
+from .graph import ArchGraph, DependencyGraph
+
+
+logger = logging.getLogger('sqlite_store')
+
+schema = '''
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    priority INTEGER,
+    fingerprint TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS components (
+    id INTEGER PRIMARY KEY,
+    repository_id INTEGER,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    component_id INTEGER,
+    name TEXT,
+    arch TEXT,
+    version TEXT,
+    source_id INTEGER,
+    depends TEXT,
+    provides TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS provides (
+    name TEXT,
+    package_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    component_id INTEGER,
+    name TEXT,
+    version TEXT,
+    build_depends TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS binaries (
+    name TEXT,
+    source_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS packages_name ON packages (name, arch);
+CREATE INDEX IF NOT EXISTS packages_arch ON packages (arch, component_id);
+CREATE INDEX IF NOT EXISTS provides_name ON provides (name);
+CREATE INDEX IF NOT EXISTS provides_package ON provides (package_id);
+CREATE INDEX IF NOT EXISTS sources_name ON sources (name, version);
+CREATE INDEX IF NOT EXISTS binaries_name ON binaries (name);
+'''
+
+package_refs = ('source', 'repository', 'component', 'depends', 'provides')
+source_refs = ('repository', 'component', 'files', 'build_depends',
+               'build_depends_indep', 'build_depends_arch')
+
+
+def dependency_from_data(data: dict) -> Dependency:
+    """
+    Restore a dependency from its JSON data.
+    """
+    dep = Dependency()
+    dep.__dict__.update(data)
+    return dep
+
+
+def groups_from_data(data: list) -> list[list[Dependency]]:
+    """
+    Restore dependency groups from their JSON data.
+    """
+    return [[dependency_from_data(dep) for dep in group] for group in data]
+
+
+def to_json(data) -> str:
+    return json.dumps(data, cls=JsonSerializer)
+
+
+class StoredPackages:
+    """
+    Package sequence of a graph, loaded from the store on access.
+    """
+    def __init__(self, store: SqliteStore, graph: ArchGraph, ids: list[int]):
+        self.store = store
+        self.graph = graph
+        self.ids = ids
+        self.loaded: dict[int, Package] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Package:
+        package = self.loaded.get(index)
+        if package is None:
+            package = self.store.load_package(self.ids[index])
+            self.loaded[index] = package
+            self.graph.index_of[id(package)] = index
+        return package
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self[index]
+
+
+def open_store(config) -> SqliteStore | None:
+    """
+    Open the configured SQLite store, if any.
+    """
+    storage = config.get('storage') or {}
+    if not storage.get('sqlite'):
+        return None
+    return SqliteStore(storage['sqlite'])
+
+
+class SqliteStore:
+    """
+    APT metadata in an indexed SQLite database.
+    """
+    def __init__(self, file: str):
+        self.file = file
+        self.db = sqlite3.connect(file)
+        self.db.executescript(schema)
+        self._repositories: dict[int, AptRepository] = {}
+        self._components: dict[int, tuple[AptRepository, Component]] = {}
+        self._sources: dict[int, Source] = {}
+
+    def __repr__(self) -> str:
+        return f'SqliteStore({self.file})'
+
+    def close(self):
+        self.db.close()
+
+    def load(self, config, mirrors: dict[str, MirrorSet] | None = None):
+        """
+        Load all configured repositories, skipping unchanged ones.
+
+        Only the configured repositories are used for lookups,
+        with the priority of their order in the config.
+        The 'mirrors' default to the mirror sets of the config.
+        """
+        self.db.execute('UPDATE repositories SET priority = NULL')
+        fields = read_fields(config)
+        if mirrors is None:
+            mirrors = config_mirrors(config)
+        for priority, repository in enumerate(config['repositories']):
+            key = self.load_repository(
+                url=repository['url'],
+                distribution=repository['distribution'],
+                architectures=repository.get('architectures', ['amd64', 'arm64']),
+                components=repository.get('components', ['main', 'universe']),
+                fields=fields,
+                mirrors=mirrors)
+            self.db.execute('UPDATE repositories SET priority = ? WHERE key = ?', (priority, key))
+        self.db.commit()
+
+    def load_repository(self,
+                        url: str,
+                        distribution: str,
+                        architectures: list[str],
+                        components: list[str],
+                        fields: set[str] | None = None,
+                        mirrors: dict[str, MirrorSet] | None = None) -> str:
+        """
+        Bulk-load one APT repository, one index at a time.
+
+        Returns the key of the repository in the store.
+        """
+        content = read_url(get_distro_url(url, distribution, 'Release'), mirrors)
+        fingerprint = hashlib.sha256('\n'.join(content).encode()).hexdigest()
+        key = f'{url} {distribution} {" ".join(sorted(architectures))} {" ".join(sorted(components))}'
+        if fields is not None:
+            key += f' {" ".join(sorted(fields))}'
+
+        row = self.db.execute(
+            'SELECT id, fingerprint FROM repositories WHERE key = ?', (key,)).fetchone()
+        if row and row[1] == fingerprint:
+            logger.info('Repository %s %s is up to date in %s.', url, distribution, self.file)
+            return key
+        if row:
+            self._delete_repository(row[0])
+
+        repo = parse_apt_repository(url, distribution, components, content)
+        repo_id = self.db.execute(
+            'INSERT INTO repositories (key, fingerprint, data) VALUES (?, ?, ?)',
+            (key, fingerprint, to_json(repo.to_data_non_recursive()))).lastrowid
+
+        for name in components:
+            if name not in repo.components:
+                logger.warning('Component %s not found in repository %s', name, repo)
+
+        # in the order of the Release file, as 'build_graph' uses them
+        for name, comp in repo.components.items():
+            component_id = self.db.execute(
+                'INSERT INTO components (repository_id, name) VALUES (?, ?)',
+                (repo_id, name)).lastrowid
+
+            for arch in architectures:
+                for index in comp.indices:
+                    if f'binary-{arch}' in index.url and 'Packages.gz' in index.url:
+                        logger.debug('Loading %s', index)
+                        self._insert_packages(
+                            component_id, arch, parse_package_index(index.url, url, repo, comp, fields, mirrors))
+
+            for index in comp.indices:
+                if 'source' in index.url and 'Sources.gz' in index.url:
+                    logger.debug('Loading %s', index)
+                    self._insert_sources(component_id, parse_source_index(index.url, url, repo, comp, fields, mirrors))
+
+            self._link_sources(component_id)
+            self.db.commit()
+
+            count = self.db.execute(
+                'SELECT COUNT(*) FROM packages WHERE component_id = ?', (component_id,)).fetchone()[0]
+            logger.info('Component %s: %d packages stored.', name, count)
+
+        return key
+
+    def _delete_repository(self, repo_id: int):
+        components = 'SELECT id FROM components WHERE repository_id = ?'
+        packages = f'SELECT id FROM packages WHERE component_id IN ({components})'
+        sources = f'SELECT id FROM sources WHERE component_id IN ({components})'
+        self.db.execute(f'DELETE FROM provides WHERE package_id IN ({packages})', (repo_id,))
+        self.db.execute(f'DELETE FROM binaries WHERE source_id IN ({sources})', (repo_id,))
+        self.db.execute(f'DELETE FROM packages WHERE component_id IN ({components})', (repo_id,))
+        self.db.execute(f'DELETE FROM sources WHERE component_id IN ({components})', (repo_id,))
+        self.db.execute('DELETE FROM components WHERE repository_id = ?', (repo_id,))
+        self.db.execute('DELETE FROM repositories WHERE id = ?', (repo_id,))
+
+    def _insert_packages(self, component_id: int, arch: str, packages: dict[str, Package]):
+        # the index maps provided names to packages too
+        unique = {id(package): package for package in packages.values()}
+        for package in unique.values():
+            data = {key: value for key, value in package.__dict__.items() if key not in package_refs}
+            package_id = self.db.execute(
+                'INSERT INTO packages (component_id, name, arch, version, depends, provides, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (component_id, package.package, arch, package.version,
+                 to_json(package.depends), to_json(package.provides), to_json(data))).lastrowid
+            self.db.executemany(
+                'INSERT INTO provides (name, package_id) VALUES (?, ?)',
+                [(provide.name, package_id) for provide in package.provides])
+
+    def _insert_sources(self, component_id: int, sources: dict[str, Source]):
+        for source in sources.values():
+            data = {key: value for key, value in source.__dict__.items() if key not in source_refs}
+            data['files'] = [file.__dict__ for file in source.files.values()]
+            build_depends = {
+                'build_depends': source.build_depends,
+                'build_depends_indep': source.build_depends_indep,
+                'build_depends_arch': source.build_depends_arch,
+            }
+            source_id = self.db.execute(
+                'INSERT INTO sources (component_id, name, version, build_depends, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (component_id, source.package, source.version,
+                 to_json(build_depends), to_json(data))).lastrowid
+            self.db.executemany(
+                'INSERT INTO binaries (name, source_id) VALUES (?, ?)',
+                [(binary, source_id) for binary in source.binaries])
+
+    def _link_sources(self, component_id: int):
+        """
+        Link binary packages to the first source of the component building them.
+        """
+        self.db.execute(
+            'UPDATE packages SET source_id = ('
+            '  SELECT MIN(b.source_id) FROM binaries b JOIN sources s ON s.id = b.source_id'
+            '  WHERE b.name = packages.name AND s.component_id = packages.component_id)'
+            ' WHERE component_id = ?', (component_id,))
+
+    def _load_component(self, component_id: int) -> tuple[AptRepository, Component]:
+        loaded = self._components.get(component_id)
+        if loaded is None:
+            repo_id, name = self.db.execute(
+                'SELECT repository_id, name FROM components WHERE id = ?', (component_id,)).fetchone()
+            if repo_id not in self._repositories:
+                data = self.db.execute(
+                    'SELECT data FROM repositories WHERE id = ?', (repo_id,)).fetchone()[0]
+                repo = AptRepository()
+                repo.__dict__.update(json.loads(data))
+                self._repositories[repo_id] = repo
+
+            component = Component()
+            component.name = name
+            self._components[component_id] = (self._repositories[repo_id], component)
+            loaded = self._components[component_id]
+        return loaded
+
+    def load_source(self, source_id: int) -> Source:
+        """
+        Materialize a source package.
+        """
+        source = self._sources.get(source_id)
+        if source is None:
+            component_id, build_depends, data = self.db.execute(
+                'SELECT component_id, build_depends, data FROM sources WHERE id = ?',
+                (source_id,)).fetchone()
+            source = Source(*self._load_component(component_id))
+            data = json.loads(data)
+            files = data.pop('files')
+            source.__dict__.update(data)
+            for key, groups in json.loads(build_depends).items():
+                setattr(source, key, groups_from_data(groups))
+            for values in files:
+                file = SourceFile()
+                file.__dict__.update(values)
+                source.files[file.name.split('/')[-1]] = file
+            self._sources[source_id] = source
+        return source
+
+    def load_package(self, package_id: int) -> Package:
+        """
+        Materialize a binary package, including its source.
+        """
+        component_id, source_id, depends, provides, data = self.db.execute(
+            'SELECT component_id, source_id, depends, provides, data FROM packages WHERE id = ?',
+            (package_id,)).fetchone()
+        package = Package(*self._load_component(component_id))
+        package.__dict__.update(json.loads(data))
+        package.depends = groups_from_data(json.loads(depends))
+        package.provides = [dependency_from_data(provide) for provide in json.loads(provides)]
+        if source_id is not None:
+            package.source = self.load_source(source_id)
+        return package
+
+    def _graph_entries(self, arch: str):
+        """
+        Lightweight (name, id, package) entries for compiling a graph.
+
+        The component ids of a repository follow the Release file, so
+        the providers are the same as for the scanned repositories.
+        """
+        build_depends: dict[int, Source] = {}
+
+        rows = self.db.execute(
+            'SELECT e.name, p.id, p.name, p.depends, p.provides, p.source_id FROM ('
+            '  SELECT name, id AS package_id, component_id, 0 AS virtual FROM packages WHERE arch = ?'
+            '  UNION ALL'
+            '  SELECT v.name, v.package_id, p.component_id, 1 FROM provides v'
+            '   JOIN packages p ON p.id = v.package_id WHERE p.arch = ?'
+            ') e JOIN packages p ON p.id = e.package_id'
+            ' JOIN components c ON c.id = e.component_id'
+            ' JOIN repositories r ON r.id = c.repository_id'
+            ' WHERE r.priority IS NOT NULL'
+            ' ORDER BY r.priority, e.component_id, e.virtual, e.package_id', (arch, arch))
+
+        for name, package_id, package_name, depends, provides, source_id in rows:
+            package = Package(None, None)
+            package.package = package_name
+            package.depends = groups_from_data(json.loads(depends))
+            package.provides = [dependency_from_data(provide) for provide in json.loads(provides)]
+
+            if source_id is not None:
+                source = build_depends.get(source_id)
+                if source is None:
+                    source = Source(None, None)
+                    source.package, source.version, groups = self.db.execute(
+                        'SELECT name, version, build_depends FROM sources WHERE id = ?',
+                        (source_id,)).fetchone()
+                    for key, value in json.loads(groups).items():
+                        setattr(source, key, groups_from_data(value))
+                    build_depends[source_id] = source
+                package.source = source
+
+            yield name, package_id, package
+
+    def build_graph(self,
+                    architectures: list[str],
+                    profiles: list[str] | None = None,
+                    indep: bool = True) -> DependencyGraph:
+        """
+        Compile the dependency graph from the store.
+
+        Only the packages of resolved closures are materialized.
+        """
+        graph = DependencyGraph(profiles, indep)
+        for arch in architectures:
+            graph.compile_architecture(
+                arch, self._graph_entries(arch),
+                loader=lambda arch_graph, ids: StoredPackages(self, arch_graph, ids))
+        return graph
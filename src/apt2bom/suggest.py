@@ -0,0 +1,103 @@
+"""
+Suggestions for missing package names.
+
+All package and Provides names are indexed by their trigrams. The
+candidates for a missing name are collected from the posting lists
+of its rarest trigrams, and ranked by the Dice coefficient of the
+trigram sets, so that a query only touches a small part of the names.
+"""
+import logging
+from array import array
+from collections import Counter
+from typing import Iterable
+from .graph import DependencyGraph
+from .resolve_lists import PackageLists
+
+
+logger = logging.getLogger('suggest')
+
+
+def trigrams(name: str) -> set[str]:
+    """
+    Trigrams of a name, padded to also match prefix and suffix.
+    """
+    padded = f'^{name}$'
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """
+    Trigram index of package names.
+    """
+    def __init__(self, names: Iterable[str]):
+        self.names: list[str] = []
+        self.postings: dict[str, array] = {}
+        for name in names:
+            name_id = len(self.names)
+            self.names.append(name)
+            for trigram in trigrams(name):
+                postings = self.postings.get(trigram)
+                if postings is None:
+                    postings = self.postings[trigram] = array('i')
+                postings.append(name_id)
+
+        # trigrams like 'lib' are too common to select candidates
+        self.common: int = max(1000, len(self.names) // 20)
+        logger.debug('Indexed %d names with %d trigrams', len(self.names), len(self.postings))
+
+    def __repr__(self) -> str:
+        return f'TrigramIndex({len(self.names)} names)'
+
+    def suggest(self, name: str, limit: int = 5, min_score: float = 0.4) -> list[tuple[str, float]]:
+        """
+        Get up to 'limit' similar names, with their score, best first.
+        """
+        query = trigrams(name)
+        postings = sorted([self.postings[trigram] for trigram in query if trigram in self.postings], key=len)
+        rare = [values for values in postings if len(values) <= self.common] or postings[:1]
+
+        counts: Counter[int] = Counter()
+        for values in rare:
+            counts.update(values)
+
+        scored = []
+        for name_id, _ in counts.most_common(limit * 20):
+            candidate = self.names[name_id]
+            if candidate == name:
+                continue
+            other = trigrams(candidate)
+            score = 2 * len(query & other) / (len(query) + len(other))
+            if score >= min_score:
+                scored.append((-score, candidate))
+
+        scored.sort()
+        return [(candidate, round(-score, 3)) for score, candidate in scored[:limit]]
+
+
+def name_index(graph: DependencyGraph) -> TrigramIndex:
+    """
+    Index all names provided by a package of any architecture.
+    """
+    provided: set[int] = set()
+    for arch_graph in graph.archs.values():
+        provided.update(name_id for name_id, index in enumerate(arch_graph.provider) if index >= 0)
+    return TrigramIndex(graph.names[name_id] for name_id in sorted(provided))
+
+
+def suggest_missing(lists: PackageLists, index: TrigramIndex, limit: int = 5):
+    """
+    Add suggestions for all missing packages to the package lists.
+
+    For a missing group of alternatives, the suggestions for each
+    alternative are joined.
+    """
+    for arch, missing in lists.missing_packages.items():
+        suggestions: dict[str, list[str]] = {}
+        for missing_name in sorted(missing):
+            scored: dict[str, float] = {}
+            for name in missing_name.split(' | '):
+                for candidate, score in index.suggest(name, limit):
+                    scored[candidate] = max(score, scored.get(candidate, 0.0))
+            ranked = sorted(scored.items(), key=lambda s: (-s[1], s[0]))
+            suggestions[missing_name] = [candidate for candidate, _ in ranked[:limit]]
+        lists.suggestions[arch] = suggestions
@@ -0,0 +1,179 @@
+"""
+Explain why packages are part of the resolved package lists.
+
+For each resolved package, the nearest root package, the parent on
+a shortest dependency path from that root and the depth are taken
+from the overlays of the resolved package lists, together with the
+resolved and reverse dependencies. The result is written as JSON file, which is used to
+answer queries without resolving the package lists again.
+"""
+import json
+import logging
+import os
+from collections import deque
+from .apt_data import Package
+from .conf import read_config, read_variants, per_architecture, architecture_config
+from .graph import ArchGraph
+from .resolve_lists import Overlay, PackageLists
+
+
+logger = logging.getLogger('why')
+
+
+def dependency_tree(arch_graph: ArchGraph, packages: dict[str, Package], overlays: dict[str, Overlay],
+                    build_parents: dict[str, list[str]] | None = None) -> dict[str, dict]:
+    """
+    Breadth-first tree of a resolved package list, see 'trace_origins'.
+
+    Build-time dependencies of ECU packages are roots of the SDK list,
+    'build_parents' maps them to the ECU packages requiring them.
+    """
+    index_of = arch_graph.index_of
+    members = set(index_of[id(package)] for package in packages.values())
+
+    entries: dict[str, dict] = {}
+    for name, package in packages.items():
+        depends = arch_graph.resolved_depends(index_of[id(package)], members)
+        overlay = overlays[name]
+        entries[name] = {
+            'root': overlay.root,
+            'parent': overlay.parent,
+            'depth': overlay.depth,
+            'depends': [arch_graph.packages[dep].package for dep in depends],
+            'dependents': [],
+        }
+
+    for name, entry in entries.items():
+        for dep in entry['depends']:
+            entries[dep]['dependents'].append(name)
+
+    for name, parents in (build_parents or {}).items():
+        if name in entries:
+            entries[name]['build_dependents'] = parents
+
+    return entries
+
+
+def build_dependents(lists: PackageLists, arch: str) -> dict[str, list[str]]:
+    """
+    Map SDK packages to the ECU packages build-depending on them.
+    """
+    arch_graph = lists.graph.archs[arch]
+    index_of = arch_graph.index_of
+    members = set(index_of[id(package)] for package in lists.sdk_packages[arch].values())
+
+    dependents: dict[str, list[str]] = {}
+    for name, package in lists.ecu_packages[arch].items():
+        for group in arch_graph.build_depends(index_of[id(package)]):
+            dep = arch_graph.satisfier(group, members)
+            if dep >= 0 and dep in members:
+                dep_name = arch_graph.packages[dep].package
+                if name not in dependents.setdefault(dep_name, []):
+                    dependents[dep_name].append(name)
+    return dependents
+
+
+def write_why(config, lists: PackageLists):
+    """
+    Write the dependency trees of the resolved package lists.
+    """
+    file = os.path.join(config['output']['directory'], config['output']['why'])
+    logger.debug('Writing dependency trees to %s ...', file)
+
+    data = {}
+    for arch in lists.ecu_packages.keys():
+        arch_graph = lists.graph.archs[arch]
+        data[arch] = {
+            'ecu': dependency_tree(arch_graph, lists.ecu_packages[arch], lists.ecu_overlays[arch]),
+            'sdk': dependency_tree(arch_graph, lists.sdk_packages[arch], lists.sdk_overlays[arch],
+                                   build_dependents(lists, arch)),
+        }
+
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+
+def dependency_path(entries: dict[str, dict], name: str) -> list[str]:
+    """
+    Shortest dependency path from the nearest root to a package.
+    """
+    path = []
+    while name is not None:
+        path.append(name)
+        name = entries[name]['parent']
+    path.reverse()
+    return path
+
+
+def all_dependents(entries: dict[str, dict], name: str) -> list[str]:
+    """
+    All packages depending directly or indirectly on a package,
+    ordered by distance.
+    """
+    seen = {name}
+    queue = deque([name])
+    dependents = []
+    while queue:
+        for dependent in entries[queue.popleft()]['dependents']:
+            if dependent not in seen:
+                seen.add(dependent)
+                dependents.append(dependent)
+                queue.append(dependent)
+    return dependents
+
+
+def explain(config, package: str, dependents: bool = False) -> list[str]:
+    """
+    Explain why a package is part of the package lists of a config,
+    using the dependency trees written by the last run.
+    """
+    file = os.path.join(config['output']['directory'], config['output']['why'])
+    if not os.path.isfile(file):
+        logger.error('Dependency trees %s not found, run apt2bom first!', file)
+        return []
+
+    with open(file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    lines = []
+    for arch, arch_lists in data.items():
+        for list_name, entries in arch_lists.items():
+            if package not in entries:
+                continue
+
+            entry = entries[package]
+            prefix = f'{package} ({arch}, {list_name})'
+            if dependents:
+                lines.append(f'{prefix} is required by: ' + (', '.join(all_dependents(entries, package)) or '-'))
+            elif entry['depth'] == 0:
+                lines.append(f'{prefix} is a root package')
+            else:
+                lines.append(f'{prefix}: ' + ' -> '.join(dependency_path(entries, package)))
+            if entry.get('build_dependents'):
+                lines.append(f'{prefix} is a build dependency of: ' + ', '.join(entry['build_dependents']))
+
+    if not lines:
+        lines.append(f'{package} is not part of any package list')
+    return lines
+
+
+def query(config: str = 'config.yaml', package: str = None, dependents: bool = False):
+    """
+    Print why a package is part of the package lists, for all variants.
+    """
+    config = read_config(file=config)
+    if not config['output'].get('why'):
+        logger.error('No dependency tree output configured!')
+        return
+
+    for name, variant in read_variants(config):
+        if name:
+            print(f'{name}:')
+        if per_architecture(config):
+            # one output directory per architecture
+            variants = [architecture_config(variant, arch) for arch in variant['packages']['architectures']]
+        else:
+            variants = [variant]
+        for arch_variant in variants:
+            for line in explain(arch_variant, package, dependents):
+                print(line)
@@ -0,0 +1,133 @@
+"""
+Fixtures serving a small in-memory APT repository.
+"""
+import random
+
+import pytest
+
+from apt2bom import apt_parsing, sqlite_store
+from apt2bom.apt_parsing import scan_repositories
+from apt2bom.graph import build_graph
+from apt2bom.resolve_lists import resolve_package_lists
+
+
+def package(name: str, depends: str = '', provides: str = '', arch: str = 'amd64',
+            version: str = '1.0') -> list[str]:
+    """
+    Lines of a Packages stanza.
+    """
+    lines = [f'Package: {name}', f'Architecture: {arch}', f'Version: {version}',
+             f'Filename: pool/{name}_{version}_{arch}.deb', 'Size: 100', f'SHA256: {name}{version}']
+    if depends:
+        lines.append(f'Depends: {depends}')
+    if provides:
+        lines.append(f'Provides: {provides}')
+    return lines + ['']
+
+
+def source(name: str, binaries: str, build_depends: str = '', version: str = '1.0') -> list[str]:
+    """
+    Lines of a Sources stanza.
+    """
+    lines = [f'Package: {name}', f'Binary: {binaries}', f'Version: {version}', f'Directory: pool/{name}']
+    if build_depends:
+        lines.append(f'Build-Depends: {build_depends}')
+    return lines + ['Files:', f' abc 10 {name}_{version}.dsc', '']
+
+
+def random_repo(apt_repo, seed: int, size: int = 120) -> tuple[list[str], list[str], list[str]]:
+    """
+    Fill the repository with random packages, and pick random roots.
+    """
+    rand = random.Random(seed)
+    for i in range(size):
+        depends = []
+        for _ in range(rand.randint(0, 3)):
+            if rand.random() < 0.2:
+                depends.append(' | '.join(f'p{rand.randrange(size + 10)}' for _ in range(2)))
+            else:
+                depends.append(f'p{rand.randrange(size + 5)}')
+        provides = f'v{rand.randrange(5)}' if rand.random() < 0.1 else ''
+        apt_repo.add_packages(package(f'p{i}', ', '.join(depends), provides))
+    for j in range(size // 3):
+        binaries = ', '.join(f'p{k}' for k in range(j * 3, j * 3 + 3))
+        build_depends = ', '.join(f'p{rand.randrange(size + 5)}' for _ in range(rand.randint(0, 3)))
+        apt_repo.add_sources(source(f's{j}', binaries, build_depends))
+
+    prod = [f'p{rand.randrange(size)}' for _ in range(rand.randint(1, 8))]
+    dev = [f'p{rand.randrange(size)}' for _ in range(rand.randint(0, 4))]
+    sdk = [f'v{rand.randrange(6)}' for _ in range(rand.randint(0, 2))]
+    return prod, dev, sdk
+
+
+def snapshot(lists) -> dict:
+    """
+    The resolved lists, in list order, for comparing resolutions.
+    """
+    return {arch: ([(name, overlay.pkg_type) for name, overlay in lists.ecu_overlays[arch].items()],
+                   [(name, overlay.pkg_type) for name, overlay in lists.sdk_overlays[arch].items()],
+                   sorted(lists.missing_packages[arch]), sorted(lists.broken_packages[arch]),
+                   sorted(lists.ecu_roots[arch]), sorted(lists.sdk_roots[arch]))
+            for arch in lists.ecu_packages}
+
+
+class AptRepo:
+    """
+    Index files of an APT repository, served by the patched download functions.
+    """
+    def __init__(self):
+        self.packages: dict[str, list[str]] = {}
+        self.sources: list[str] = []
+
+    def add_packages(self, *stanzas: list[str], arch: str = 'amd64'):
+        for stanza in stanzas:
+            self.packages.setdefault(arch, []).extend(stanza)
+
+    def add_sources(self, *stanzas: list[str]):
+        for stanza in stanzas:
+            self.sources.extend(stanza)
+
+    def release(self) -> list[str]:
+        lines = ['Origin: Test', 'Suite: test', f'Architectures: {" ".join(self.packages)}',
+                 'Components: main', 'MD5Sum:']
+        lines += [f' abc 10 main/binary-{arch}/Packages.gz' for arch in self.packages]
+        return lines + [' abc 10 main/source/Sources.gz']
+
+    def read_url(self, url: str, mirrors=None) -> list[str]:
+        return self.release()
+
+    def read_gz_url(self, url: str, mirrors=None) -> list[str]:
+        if 'Sources' in url:
+            return list(self.sources)
+        for arch, lines in self.packages.items():
+            if f'binary-{arch}/' in url:
+                return list(lines)
+        return []
+
+    def config(self, output: str = 'output') -> dict:
+        architectures = list(self.packages)
+        return {
+            'repositories': [{'url': 'http://apt.test/', 'distribution': 'test',
+                              'components': ['main'], 'architectures': architectures}],
+            'packages': {'architectures': architectures},
+            'output': {'directory': output, 'ecu_json': 'ecu.json', 'sdk_json': 'sdk.json',
+                       'missing': 'missing.txt', 'broken': 'broken.txt'},
+        }
+
+    def resolve(self, prod: list[str], dev: list[str] | None = None, sdk: list[str] | None = None,
+                profiles: list[str] | None = None, **kwargs):
+        repos = scan_repositories(self.config())
+        return resolve_package_lists(repos, list(self.packages), prod, dev or [], sdk or [],
+                                     profiles=profiles, **kwargs)
+
+    def graph(self, profiles: list[str] | None = None):
+        return build_graph(scan_repositories(self.config()), list(self.packages), profiles)
+
+
+@pytest.fixture
+def apt_repo(monkeypatch) -> AptRepo:
+    repo = AptRepo()
+    monkeypatch.setattr(apt_parsing, 'read_url', repo.read_url)
+    monkeypatch.setattr(apt_parsing, 'read_gz_url', repo.read_gz_url)
+    monkeypatch.setattr(sqlite_store, 'read_url', repo.read_url)
+    return repo
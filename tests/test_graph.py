@@ -0,0 +1,54 @@
+from conftest import package, source
+
+
+def test_closure_prefers_present_alternative(apt_repo):
+    apt_repo.add_packages(package('app', 'a | b, tool'), package('tool', 'b'), package('a'), package('b'))
+    lists = apt_repo.resolve(['app'])
+
+    assert sorted(lists.ecu_packages['amd64']) == ['app', 'b', 'tool']
+
+
+def test_closure_takes_first_alternative(apt_repo):
+    apt_repo.add_packages(package('app', 'a | b'), package('a'), package('b'))
+    lists = apt_repo.resolve(['app'])
+
+    assert sorted(lists.ecu_packages['amd64']) == ['a', 'app']
+
+
+def test_root_alternative_from_closure(apt_repo):
+    apt_repo.add_packages(package('app'), package('a'), package('b'), package('c', 'b'))
+    apt_repo.add_sources(source('app', 'app', 'a | b, c'))
+    lists = apt_repo.resolve(['app'])
+
+    assert sorted(lists.sdk_packages['amd64']) == ['b', 'c']
+    assert sorted(lists.sdk_roots['amd64']) == ['b', 'c']
+
+
+def test_architecture_restrictions(apt_repo):
+    for arch in ('amd64', 'arm64'):
+        apt_repo.add_packages(package('app', arch=arch), package('a', arch=arch), package('b', arch=arch),
+                              arch=arch)
+    apt_repo.add_sources(source('app', 'app', 'a [amd64], b [!amd64]'))
+    lists = apt_repo.resolve(['app'])
+
+    assert sorted(lists.sdk_packages['amd64']) == ['a']
+    assert sorted(lists.sdk_packages['arm64']) == ['b']
+
+
+def test_profile_restrictions(apt_repo):
+    apt_repo.add_packages(package('app'), package('gcc'), package('check'), package('docs'))
+    apt_repo.add_sources(source('app', 'app', 'gcc, check <!nocheck>, docs <nodoc>'))
+
+    lists = apt_repo.resolve(['app'])
+    assert sorted(lists.sdk_packages['amd64']) == ['check', 'gcc']
+
+    lists = apt_repo.resolve(['app'], profiles=['nocheck', 'nodoc'])
+    assert sorted(lists.sdk_packages['amd64']) == ['docs', 'gcc']
+
+
+def test_missing_dependencies(apt_repo):
+    apt_repo.add_packages(package('app', 'a, gone'), package('a'))
+    lists = apt_repo.resolve(['app', 'unknown'])
+
+    assert sorted(lists.ecu_packages['amd64']) == ['a', 'app']
+    assert 'gone' in lists.missing_packages['amd64']
@@ -0,0 +1,18 @@
+import pytest
+
+from apt2bom.partition import Partitioner
+from conftest import random_repo, snapshot
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('workers', [0, 2])
+def test_partitioned_resolution(apt_repo, tmp_path, seed, workers):
+    prod, dev, sdk = random_repo(apt_repo, seed)
+    graph = apt_repo.graph()
+    plain = apt_repo.resolve(prod, dev, sdk, graph=graph)
+
+    with Partitioner(graph, str(tmp_path / 'work'), shards=3, workers=workers, timeout=0.2) as partitioner:
+        partitioned = apt_repo.resolve(prod, dev, sdk, graph=graph, partitioner=partitioner)
+
+    assert snapshot(partitioned) == snapshot(plain)
+    assert not list((tmp_path / 'work' / 'results').iterdir())
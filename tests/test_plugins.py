@@ -0,0 +1,54 @@
+import logging
+import os
+
+from apt2bom.plugins import write_outputs
+from conftest import package, source
+
+
+def output_config(apt_repo, directory: str) -> dict:
+    config = apt_repo.config(directory)
+    config['output'].update(metrics='metrics.json', fingerprints='fingerprints.json',
+                            writers=['package_lists', 'metrics'])
+    return config
+
+
+def mtimes(directory) -> dict[str, int]:
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(directory)}
+
+
+def test_rerun_skips_unchanged(apt_repo, tmp_path, caplog):
+    apt_repo.add_packages(package('app', 'a'), package('a'), package('gcc'))
+    apt_repo.add_sources(source('app', 'app', 'gcc'))
+    config = output_config(apt_repo, str(tmp_path / 'output'))
+    lists = apt_repo.resolve(['app'])
+
+    write_outputs(config, lists)
+    written = mtimes(config['output']['directory'])
+    assert {'ecu.json', 'sdk.json', 'metrics.json', 'fingerprints.json'} <= set(written)
+
+    with caplog.at_level(logging.INFO, logger='plugins'):
+        write_outputs(config, apt_repo.resolve(['app']))
+    assert caplog.text.count('Skipping') == 2
+    assert 'Writing' not in caplog.text
+    rerun = mtimes(config['output']['directory'])
+    assert {name: rerun[name] for name in written if name != 'fingerprints.json'} == \
+        {name: mtime for name, mtime in written.items() if name != 'fingerprints.json'}
+
+
+def test_rerun_writes_changed(apt_repo, tmp_path, caplog):
+    apt_repo.add_packages(package('app', 'a'), package('a'), package('tool'))
+    config = output_config(apt_repo, str(tmp_path / 'output'))
+    write_outputs(config, apt_repo.resolve(['app']))
+
+    # a deleted output is written again
+    os.remove(os.path.join(config['output']['directory'], 'metrics.json'))
+    with caplog.at_level(logging.INFO, logger='plugins'):
+        write_outputs(config, apt_repo.resolve(['app']))
+    assert 'Skipping package lists' in caplog.text
+    assert 'Writing metrics' in caplog.text
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger='plugins'):
+        write_outputs(config, apt_repo.resolve(['app', 'tool']))
+    assert 'Writing package lists' in caplog.text
+    assert 'Writing metrics' in caplog.text
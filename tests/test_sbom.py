@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from apt2bom.sbom import spdx_id, write_sboms
+from conftest import package, source
+
+
+@pytest.fixture
+def sbom_lists(apt_repo, tmp_path):
+    for arch in ('amd64', 'arm64'):
+        apt_repo.add_packages(package('app', 'libfoo, common', arch=arch), package('libfoo', 'common', arch=arch),
+                              package('common', arch='all', version='1.2+dfsg-1'), package('gcc', arch=arch),
+                              arch=arch)
+    apt_repo.add_sources(source('app', 'app', 'gcc, libfoo'), source('foo', 'libfoo', 'gcc'),
+                         source('common', 'common', version='1.2+dfsg-1'))
+    config = apt_repo.config(str(tmp_path))
+    config['output']['sbom'] = ['cyclonedx', 'spdx_json']
+    lists = apt_repo.resolve(['app'])
+    write_sboms(config, lists)
+    return tmp_path
+
+
+def test_spdx_id_versions():
+    assert spdx_id('Source', 'foo', '1.2+dfsg-1') != spdx_id('Source', 'foo', '1.2-dfsg-1')
+    assert spdx_id('Package', 'amd64', 'libfoo') == 'SPDXRef-Package-amd64-libfoo'
+
+
+@pytest.mark.parametrize('name', ['ecu', 'sdk'])
+def test_cyclonedx_references(sbom_lists, name):
+    with open(sbom_lists / f'{name}.cdx.json') as f:
+        bom = json.load(f)
+
+    refs = [component['bom-ref'] for component in bom['components']]
+    assert refs
+    assert len(refs) == len(set(refs))
+
+    dependencies = [dependency['ref'] for dependency in bom['dependencies']]
+    assert len(dependencies) == len(set(dependencies))
+    for dependency in bom['dependencies']:
+        assert dependency['ref'] in refs
+        assert set(dependency['dependsOn']) <= set(refs)
+
+
+@pytest.mark.parametrize('name', ['ecu', 'sdk'])
+def test_spdx_references(sbom_lists, name):
+    with open(sbom_lists / f'{name}.spdx.json') as f:
+        document = json.load(f)
+
+    ids = [package['SPDXID'] for package in document['packages']]
+    assert ids
+    assert len(ids) == len(set(ids))
+
+    elements = set(ids) | {document['SPDXID']}
+    for relationship in document['relationships']:
+        assert relationship['spdxElementId'] in elements
+        assert relationship['relatedSpdxElement'] in elements
@@ -0,0 +1,34 @@
+from apt2bom.sqlite_store import SqliteStore
+from conftest import package, random_repo, snapshot, source
+
+
+def test_store_resolution(apt_repo, tmp_path):
+    prod, dev, sdk = random_repo(apt_repo, 7)
+    plain = apt_repo.resolve(prod, dev, sdk)
+
+    store = SqliteStore(str(tmp_path / 'apt.db'))
+    try:
+        store.load(apt_repo.config())
+        stored = apt_repo.resolve(prod, dev, sdk, graph=store.build_graph(['amd64']))
+    finally:
+        store.close()
+
+    assert snapshot(stored) == snapshot(plain)
+    assert [package.version for package in stored.ecu_packages['amd64'].values()] == \
+        [package.version for package in plain.ecu_packages['amd64'].values()]
+
+
+def test_store_reload(apt_repo, tmp_path):
+    apt_repo.add_packages(package('app', 'a'), package('a'))
+    apt_repo.add_sources(source('app', 'app', 'a'))
+    file = str(tmp_path / 'apt.db')
+
+    for _ in range(2):
+        store = SqliteStore(file)
+        try:
+            store.load(apt_repo.config())
+            lists = apt_repo.resolve(['app'], graph=store.build_graph(['amd64']))
+        finally:
+            store.close()
+        assert sorted(lists.ecu_packages['amd64']) == ['a', 'app']
+        assert sorted(lists.sdk_packages['amd64']) == ['a']